@@ -0,0 +1,147 @@
+import argparse
+import functools
+from datetime import date
+
+import numpy as np
+
+from database import Database, LIFETIME_GROUPS
+
+
+def cached(method):
+    # results stay valid until the next write, the change log's sequence number tells when that happened
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        generation = self.database.get_generation()
+        key = (method.__name__, args)
+        if key not in self.cache or self.cache[key][0] != generation:
+            self.cache[key] = (generation, method(self, *args))
+        return self.cache[key][1]
+    return wrapper
+
+
+class SurvivalAnalysis:
+    """Time to contamination of cultures, grain spawn and bags, compared between groups of experiments."""
+
+    def __init__(self, database):
+        self.database = database
+        self.cache = {}
+
+    @cached
+    def lifetimes(self, experiment_type, group_by, as_of=None):
+        as_of = as_of or date.today().strftime("%Y-%m-%d")
+        rows = self.database.get_lifetimes(experiment_type, group_by, as_of)
+        if not rows:
+            return np.array([], dtype=object), np.array([], dtype=int), np.array([]), np.array([], dtype=bool)
+
+        labels, created, failed, censored = zip(*rows)
+        created = np.array(created, dtype=float)
+        failed = np.array(failed, dtype=float)
+        censored = np.array(censored, dtype=float)
+
+        events = ~np.isnan(failed)
+        durations = np.maximum(np.where(events, failed, censored) - created, 0)
+        groups, codes = np.unique(np.array(labels, dtype=object), return_inverse=True)
+        return groups, codes, durations, events
+
+    @cached
+    def kaplan_meier(self, experiment_type, group_by, as_of=None):
+        # {group: (days, at risk, failures, survival)} at every day on which a failure or censoring happened
+        groups, codes, durations, events = self.lifetimes(experiment_type, group_by, as_of)
+        if not len(groups):
+            return {}
+
+        # one key per (group, day), sorted by group and then day, so every group is one contiguous run
+        days = durations.astype(int)
+        keys, inverse = np.unique(codes * (days.max() + 1) + days, return_inverse=True)
+        removed = np.bincount(inverse)
+        failures = np.bincount(inverse, weights=events).astype(int)
+        key_groups = keys // (days.max() + 1)
+        key_days = keys % (days.max() + 1)
+
+        # at risk on a day: the group's size less everyone who left the group on an earlier day
+        group_sizes = np.bincount(codes, minlength=len(groups))
+        left_before = np.cumsum(removed) - removed
+        group_starts = np.searchsorted(key_groups, np.arange(len(groups)))
+        at_risk = group_sizes[key_groups] - (left_before - left_before[group_starts[key_groups]])
+
+        # the product limit as a cumulative sum of logs, restarted for every group; days on which everyone
+        # at risk failed would take the log of zero, they are tracked separately instead
+        hazard = failures / at_risk
+        extinct = hazard >= 1
+        log_survival = np.cumsum(np.log(np.where(extinct, 1, 1 - hazard)))
+        extinctions = np.cumsum(extinct)
+        group_offset = np.where(group_starts[key_groups] > 0, log_survival[group_starts[key_groups] - 1], 0)
+        extinct_offset = np.where(group_starts[key_groups] > 0, extinctions[group_starts[key_groups] - 1], 0)
+        survival = np.where(extinctions - extinct_offset > 0, 0, np.exp(log_survival - group_offset))
+
+        boundaries = np.append(group_starts, len(keys))
+        return {groups[g]: (key_days[start:end], at_risk[start:end], failures[start:end], survival[start:end])
+                for g, (start, end) in enumerate(zip(boundaries[:-1], boundaries[1:])) if end > start}
+
+    @cached
+    def compare(self, experiment_type, group_by, as_of=None):
+        # per group: (group, experiments, failures, days observed, failures per 100 days, median days to
+        # failure, expected failures); with the log-rank statistic and its degrees of freedom
+        groups, codes, durations, events = self.lifetimes(experiment_type, group_by, as_of)
+        if not len(groups):
+            return [], 0.0, 0
+
+        # failures and experiments at risk per (day, group), over all days on which anyone failed; an experiment
+        # is at risk on every failure day up to and including its last day, so it leaves after the failure days
+        # that are not later than its duration
+        days = durations.astype(int)
+        failure_days = np.unique(days[events])
+        failed = np.zeros((len(failure_days), len(groups)))
+        np.add.at(failed, (np.searchsorted(failure_days, days[events]), codes[events]), 1)
+        leaving = np.zeros((len(failure_days) + 1, len(groups)))
+        np.add.at(leaving, (np.searchsorted(failure_days, days, side="right"), codes), 1)
+        at_risk = np.cumsum(leaving[::-1], axis=0)[::-1][1:]
+
+        # failures expected if every group failed at the pooled rate of each day
+        total_at_risk = at_risk.sum(axis=1, keepdims=True)
+        total_failed = failed.sum(axis=1, keepdims=True)
+        share = at_risk / np.maximum(total_at_risk, 1)
+        expected = (share * total_failed).sum(axis=0)
+        observed = np.bincount(codes, weights=events, minlength=len(groups))
+
+        # the log-rank statistic (O - E)' V^-1 (O - E) over G - 1 of the groups, V the hypergeometric covariance
+        # of their failures summed over the days; the last group follows from the others, and a group never at
+        # risk on a failure day leaves V singular, hence the pseudo-inverse
+        spread = (total_failed * (total_at_risk - total_failed) / np.maximum(total_at_risk - 1, 1))[:, 0]
+        covariance = (np.einsum("d,dg->g", spread, share)[:, None] * np.eye(len(groups))
+                      - np.einsum("d,dg,dh->gh", spread, share, share))
+        difference = observed - expected
+        statistic = float(difference[:-1] @ np.linalg.pinv(covariance[:-1, :-1]) @ difference[:-1])
+
+        exposure = np.bincount(codes, weights=durations, minlength=len(groups))
+        counts = np.bincount(codes, minlength=len(groups))
+        curves = self.kaplan_meier(experiment_type, group_by, as_of)
+        rows = []
+        for g, group in enumerate(groups):
+            curve_days, _, _, survival = curves[group]
+            below = np.nonzero(survival <= 0.5)[0]
+            rows.append((group, int(counts[g]), int(observed[g]), float(exposure[g]),
+                         100 * observed[g] / exposure[g] if exposure[g] else None,
+                         int(curve_days[below[0]]) if len(below) else None, float(expected[g])))
+        return rows, statistic, len(groups) - 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare time to contamination between groups of experiments.")
+    parser.add_argument("experiment_type", choices=list(LIFETIME_GROUPS))
+    parser.add_argument("--by", default="variant", help="culture, recipe, variant, medium or week")
+    parser.add_argument("--as-of", default=date.today().strftime("%Y-%m-%d"))
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+    reader = database.reader()
+    with reader.snapshot():
+        rows, statistic, df = SurvivalAnalysis(reader).compare(args.experiment_type, args.by, args.as_of)
+
+    print(f"{args.by:24} {'n':>7} {'failed':>7} {'expected':>8} {'per 100 d':>9} {'median d':>8}")
+    for group, n, failures, _, rate, median, expected in rows:
+        print(f"{group or '-':24} {n:7d} {failures:7d} {expected:8.1f} "
+              f"{'' if rate is None else f'{rate:.2f}':>9} {'' if median is None else median:>8}")
+    print(f"log-rank chi-square {statistic:.2f} with {df} degrees of freedom")
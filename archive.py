@@ -0,0 +1,19 @@
+import argparse
+from datetime import date, timedelta
+
+from database import Database
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move experiments closed before a cutoff into yearly archives.")
+    parser.add_argument("--before", default=(date.today() - timedelta(days=365)).strftime("%Y-%m-%d"),
+                        help="cutoff date (YYYY-MM-DD), defaults to one year ago")
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+    archived = database.archive_closed_experiments(args.before)
+    for year, n in sorted(archived.items()):
+        print(f"{n} experiments archived to {database.archive_path(year)}")
+    if not archived:
+        print(f"No closed experiments before {args.before}.")
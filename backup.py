@@ -0,0 +1,103 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+
+
+class BackupRestarted(Exception):
+    pass
+
+
+class BackupScheduler(threading.Thread):
+    """Periodically copies a live database with the SQLite backup API into rotating, verified generations."""
+
+    def __init__(self, database_path, directory=os.path.join("data", "backups"), generations=7, interval=3600,
+                 pages=64, pause=0.01, max_restarts=3):
+        super().__init__(daemon=True)
+        self.database_path = database_path
+        self.directory = directory
+        self.generations = generations
+        self.interval = interval
+        self.pages = pages
+        self.pause = pause
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.remaining = None
+        self.stopped = threading.Event()
+        self.last_backup = None
+        self.last_error = None
+
+    def generation_path(self, generation):
+        name, extension = os.path.splitext(os.path.basename(self.database_path))
+        return os.path.join(self.directory, f"{name}.{generation}{extension}")
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.backup()
+            except sqlite3.Error as e:
+                self.last_error = e
+            self.stopped.wait(self.interval)
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.join(timeout)
+
+    def backup(self):
+        os.makedirs(self.directory, exist_ok=True)
+        target = os.path.join(self.directory, f"{os.path.basename(self.database_path)}.partial")
+
+        source = sqlite3.connect(self.database_path)
+        destination = sqlite3.connect(target)
+        self.restarts = 0
+        self.remaining = None
+        try:
+            source.backup(destination, pages=self.pages, progress=self.__yield)
+        except BackupRestarted:
+            # writes keep invalidating the stepped copy, take it in one step instead
+            source.backup(destination)
+        finally:
+            destination.close()
+            source.close()
+
+        if not self.verify(target):
+            os.remove(target)
+            raise sqlite3.DatabaseError(f"Backup of {self.database_path} failed the integrity check")
+
+        for generation in range(self.generations - 1, 0, -1):
+            if os.path.exists(self.generation_path(generation)):
+                os.replace(self.generation_path(generation), self.generation_path(generation + 1))
+        os.replace(target, self.generation_path(1))
+        self.last_backup = time.time()
+        self.last_error = None
+
+    def __yield(self, status, remaining, total):
+        # sqlite restarts the copy when another connection writes to the source in between steps
+        if self.remaining is not None and remaining > self.remaining:
+            self.restarts += 1
+            if self.restarts > self.max_restarts:
+                raise BackupRestarted
+        self.remaining = remaining
+        # the source is only locked during a step, sleeping between steps lets the UI's writes through
+        time.sleep(self.pause)
+
+    @staticmethod
+    def verify(path):
+        connection = sqlite3.connect(path)
+        try:
+            return connection.execute("PRAGMA integrity_check").fetchall() == [("ok",)]
+        finally:
+            connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Take one online backup of the lab book database.")
+    parser.add_argument("--database", default=os.path.join("data", "pyLabBook.db"))
+    parser.add_argument("--directory", default=os.path.join("data", "backups"))
+    parser.add_argument("--generations", type=int, default=7)
+    args = parser.parse_args()
+
+    scheduler = BackupScheduler(args.database, args.directory, args.generations)
+    scheduler.backup()
+    print(f"Backup written to {scheduler.generation_path(1)}")
@@ -0,0 +1,102 @@
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+from database import Database
+from sensors import simulate_readings, ingest
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def create_database(path, n_bags, bags_per_grain_spawn=20, grain_spawn_per_culture=10):
+    database = Database(path)
+    database.connect()
+    database.initialize_tables()
+    cursor = database.cursor
+
+    n_grain_spawn = n_bags // bags_per_grain_spawn + 1
+    n_cultures = n_grain_spawn // grain_spawn_per_culture + 1
+    cursor.execute("""INSERT INTO recipes(name, recipe_type, ingredients, instructions)
+                      VALUES ('Rye', 'Grain Spawn', 'rye, gypsum', 'soak and boil'),
+                             ('CVG', 'Substrate', 'coir, vermiculite, gypsum', 'mix and pasteurize')""")
+    cursor.executemany("""INSERT INTO cultures(name, created_at, variant, mushroom, medium)
+                          VALUES ('20230101C' || $i, '2023-01-01', 'Variant ' || ($i % 7), 'Mushroom ' || ($i % 5),
+                                  NULL)""",
+                       ({"i": i} for i in range(n_cultures)))
+    cursor.executemany("""INSERT INTO grain_spawn(name, created_at, culture_id, recipe_id)
+                          VALUES ('20230201GS' || $i, '2023-02-01', $culture_id, 1)""",
+                       ({"i": i, "culture_id": i // grain_spawn_per_culture + 1} for i in range(n_grain_spawn)))
+    cursor.executemany("""INSERT INTO bags(name, created_at, grain_spawn_id, recipe_id)
+                          VALUES ('20230301B' || $i, '2023-03-01', $grain_spawn_id, 2)""",
+                       ({"i": i, "grain_spawn_id": i // bags_per_grain_spawn + 1} for i in range(n_bags)))
+    database.connection.commit()
+    return database
+
+
+def measure(function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+
+    # tracing slows python down considerably, so the peak is measured in a second run
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+@benchmark
+def current_bags(database):
+    date = "2024-01-01"
+
+    def paged():
+        n, after_id = 0, 0
+        while page := database.get_current_bags_page(date, after_id, 1000):
+            n += len(page)
+            after_id = page[-1].id
+        return n
+
+    return {"get_current_bags": lambda: len(database.get_current_bags(date)),
+            "iter_current_bags": lambda: sum(1 for _ in database.iter_current_bags(date)),
+            "get_current_bags_page": paged}
+
+
+@benchmark
+def bulk_lookup(database):
+    n_bags, = database.cursor.execute("SELECT count(*) FROM bags").fetchone()
+    return {f"get_bags_by_id ({n} ids)": lambda n=n: len(database.get_bags_by_id(range(1, n + 1)))
+            for n in (10, 1000, n_bags)}
+
+
+@benchmark
+def sensor_ingestion(database):
+    start = datetime(2024, 1, 1)
+    readings = list(simulate_readings(["Incubator", "Grow Room 1", "Grow Room 2"], start, start + timedelta(days=1)))
+    return {"write_sensor_readings": lambda: ingest(database, readings),
+            "get_sensor_series (1 day)": lambda: len(database.get_sensor_series("Grow Room 1", "2024-01-01",
+                                                                                 "2024-01-02"))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time lab book database operations and measure their peak memory.")
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), help=", ".join(BENCHMARKS))
+    parser.add_argument("--bags", type=int, default=100000)
+    parser.add_argument("--memory", action="store_true", help="run against an in-memory database")
+    args = parser.parse_args()
+
+    path = ":memory:" if args.memory else os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    database = create_database(path, args.bags)
+    print(f"{'benchmark':32} {'rows':>9} {'seconds':>9} {'peak MiB':>9}")
+    for name in args.benchmarks:
+        for label, function in BENCHMARKS[name](database).items():
+            rows, elapsed, peak = measure(function)
+            print(f"{label:32} {rows:9d} {elapsed:9.3f} {peak / 2 ** 20:9.2f}")
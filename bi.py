@@ -0,0 +1,19 @@
+import argparse
+
+from database import Database
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring the BI fact tables up to date and print a summary.")
+    parser.add_argument("--by", choices=["strain", "recipe", "month"], default="strain")
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+    print(f"Refreshed {database.refresh_bi_tables()} bags.")
+
+    print(f"{args.by:24} {'bags':>6} {'harvested':>9} {'destroyed':>9} {'failed':>6} {'flushes':>7} "
+          f"{'yield':>8} {'per bag':>8}")
+    for label, n, n_harvested, n_destroyed, n_failed, n_flushes, harvested, per_bag in database.get_bi_summary(args.by):
+        print(f"{label or '-':24} {n:6d} {n_harvested:9d} {n_destroyed:9d} {n_failed:6d} {n_flushes:7d} "
+              f"{harvested:8.2f} {per_bag:8.2f}")
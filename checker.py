@@ -0,0 +1,123 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from database import Database, CHECKED_REFERENCES, OBSERVATION_TABLES
+
+CHECKS = ("references", "closed", "names", "validators")
+
+_database = None
+
+
+def _open_database(database_path, archive_directory):
+    # every worker process reads through a connection of its own
+    global _database
+    _database = Database(database_path, archive_directory)
+    _database.connect(read_only=True)
+    _database.connection.execute("PRAGMA query_only = 1")
+
+
+def check_chunk(check, subject, lo, hi, limit):
+    # (check, subject, number of problems, the first `limit` of them) for the rows of subject in [lo, hi); only
+    # the chunk's rows and problems are ever held in memory
+    with _database.snapshot():
+        if check == "references":
+            problems = [(value, f"{column} {target} does not exist")
+                        for value, column, target in _database.get_dangling_references(subject, lo, hi)]
+        elif check == "closed":
+            problems = [(name or id_, f"{count} observations after it was closed on {closed}, the last on {last}")
+                        for id_, name, closed, count, last in _database.get_late_observations(subject, lo, hi)]
+        elif check == "names":
+            problems = [(name, problem) for _, name, problem in _database.get_name_issues(subject, lo, hi)]
+        else:
+            _, _, observation_class = OBSERVATION_TABLES[subject]
+            problems = [(first, f"{count} observations with the action {action!r}, which "
+                                f"{observation_class.__name__} rejects")
+                        for action, count, first in _database.get_action_counts(subject, lo, hi)
+                        if action is not None and action not in observation_class.actions]
+    return check, subject, len(problems), problems[:limit]
+
+
+def compare_validators(database):
+    # the actions the observation tables and the validators of their records disagree on
+    out = []
+    for experiment_type, (table, _, observation_class) in OBSERVATION_TABLES.items():
+        allowed = database.get_allowed_actions(experiment_type)
+        if allowed is None:
+            continue
+        for action in allowed:
+            if action not in observation_class.actions:
+                out.append((table, f"the CHECK constraint allows {action!r}, {observation_class.__name__} rejects it"))
+        for action in observation_class.actions:
+            if action not in allowed:
+                out.append((table, f"{observation_class.__name__} allows {action!r}, the CHECK constraint rejects it"))
+    return out
+
+
+def plan_chunks(database, checks, chunk_size):
+    # (check, subject, lo, hi) covering every checked table in chunks of about chunk_size rows
+    subjects = {
+        "references": [(table, table, column) for table, (column, _) in CHECKED_REFERENCES.items()],
+        "closed": [(t, t, id_column) for t, (_, id_column, _) in OBSERVATION_TABLES.items()],
+        "names": [(t, t, id_column) for t, (_, id_column, _) in OBSERVATION_TABLES.items()],
+        "validators": [(t, table, id_column) for t, (table, id_column, _) in OBSERVATION_TABLES.items()],
+    }
+    for check in checks:
+        for subject, table, column in subjects[check]:
+            for lo, hi in database.iter_chunks(table, column, chunk_size):
+                yield check, subject, lo, hi
+
+
+def check_database(database_path, archive_directory, checks=CHECKS, chunk_size=50000, limit=20, workers=None):
+    # {(check, subject): [number of problems, their first `limit`]}, the schema's disagreements with the
+    # validators under ("validators", "schema")
+    database = Database(database_path, archive_directory)
+    database.connect(read_only=True)
+    with database.snapshot():
+        tasks = list(plan_chunks(database, checks, chunk_size))
+        results = {}
+        if "validators" in checks:
+            schema = compare_validators(database)
+            results[("validators", "schema")] = [len(schema), schema[:limit]]
+    database.connection.close()
+
+    with ProcessPoolExecutor(workers, initializer=_open_database,
+                             initargs=(database_path, archive_directory)) as executor:
+        futures = [executor.submit(check_chunk, *task, limit) for task in tasks]
+        for future in futures:
+            check, subject, count, problems = future.result()
+            result = results.setdefault((check, subject), [0, []])
+            result[0] += count
+            result[1].extend(problems[:limit - len(result[1])])
+    return results, len(tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the database for dangling references, observations after "
+                                                 "an experiment was closed, misnumbered names and actions the "
+                                                 "validators reject.")
+    parser.add_argument("--database", default=os.path.join("data", "pyLabBook.db"))
+    parser.add_argument("--archive-directory", default=os.path.join("data", "archive"))
+    parser.add_argument("--checks", nargs="+", choices=CHECKS, default=CHECKS)
+    parser.add_argument("--chunk-size", type=int, default=50000, help="rows checked by a worker at a time")
+    parser.add_argument("--limit", type=int, default=20, help="problems listed per check and table")
+    parser.add_argument("--workers", type=int, help="number of processes, defaults to the number of cores")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results, chunks = check_database(args.database, args.archive_directory, args.checks, args.chunk_size,
+                                     args.limit, args.workers)
+    elapsed = time.perf_counter() - start
+
+    total = 0
+    for (check, subject), (count, problems) in sorted(results.items()):
+        if not count:
+            continue
+        total += count
+        print(f"{check} {subject}: {count} problems")
+        for row, problem in problems:
+            print(f"    {row}: {problem}")
+        if count > len(problems):
+            print(f"    ... and {count - len(problems)} more")
+    print(f"{total} problems in {chunks} chunks, checked in {elapsed:.1f} s.")
@@ -1,19 +1,356 @@
 import os
+import re
+import json
 import sqlite3
+import pathlib
+import sys
 import itertools
-from datastructures import Recipe, Culture, GrainSpawn, Bag, CultureObservation, GrainSpawnObservation, BagObservation
+import contextlib
+from datetime import datetime
+import tracing
+from datastructures import Recipe, Culture, GrainSpawn, Bag, CultureObservation, GrainSpawnObservation, BagObservation, \
+    Inspection, SensorReading, CostEntry, Photo, Location
+
+# tables that closed lineages are moved out of into the yearly archive databases,
+# with the experiment table and id column their rows belong to
+ARCHIVE_TABLES = {
+    "cultures": ("cultures", "culture_id"),
+    "grain_spawn": ("grain_spawn", "grain_spawn_id"),
+    "bags": ("bags", "bag_id"),
+    "culture_observations": ("cultures", "culture_id"),
+    "grain_spawn_observations": ("grain_spawn", "grain_spawn_id"),
+    "bag_observations": ("bags", "bag_id"),
+}
+
+# tables whose writes are recorded in the change log, with their primary key columns
+CHANGE_LOG_TABLES = {
+    "recipes": ("recipe_id",),
+    "cultures": ("culture_id",),
+    "grain_spawn": ("grain_spawn_id",),
+    "bags": ("bag_id",),
+    "culture_observations": ("culture_id", "observed_at"),
+    "grain_spawn_observations": ("grain_spawn_id", "observed_at"),
+    "bag_observations": ("bag_id", "observed_at"),
+    "inspection_sweeps": ("experiment_type", "observed_at", "site", "room"),
+    "locations": ("location_id",),
+    "cost_entries": ("cost_entry_id",),
+    "observation_photos": ("experiment_type", "experiment_id", "observed_at", "digest"),
+}
+
+# experiment tables that carry a location, with their id column
+LOCATED_TABLES = {"cultures": "culture_id", "grain_spawn": "grain_spawn_id", "bags": "bag_id"}
+
+# measured quantities of the sensor readings, and the bucket of each rollup resolution
+SENSOR_METRICS = ("temperature", "humidity", "co2")
+SENSOR_RESOLUTIONS = {
+    "minute": "%Y-%m-%d %H:%M:00",
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d",
+}
+
+# columns of the cultures that are dictionary encoded, with the dimension table holding their distinct values;
+# the text columns stay as they are, the cultures carry the integer key of each value next to it
+DIMENSIONS = {"mushroom": "mushrooms", "variant": "variants", "medium": "media"}
+
+# the dimension keys in the rows read for each record class, by position, resolved to their names on hydration
+HYDRATED_COLUMNS = {
+    Culture: {2: "mushrooms", 3: "variants", 4: "media"},
+    GrainSpawn: {4: "mushrooms", 5: "variants"},
+    Bag: {4: "mushrooms", 5: "variants"},
+}
+
+# statements and record classes for the id lookups of Database.get_by_id
+BULK_LOOKUPS = {
+    "cultures": ("""
+        SELECT created_at, culture_id, mushroom_key, variant_key, medium_key, location_id
+        FROM cultures
+        WHERE culture_id IN ({ids})""", Culture),
+    "grain_spawn": ("""
+        SELECT grain_spawn.created_at, grain_spawn_id, culture_id, recipe_id, mushroom_key, variant_key,
+               grain_spawn.location_id
+        FROM grain_spawn
+        LEFT JOIN cultures USING (culture_id)
+        WHERE grain_spawn_id IN ({ids})""", GrainSpawn),
+    "bags": ("""
+        SELECT bags.created_at, bag_id, grain_spawn_id, bags.recipe_id, mushroom_key, variant_key, bags.location_id
+        FROM bags
+        LEFT JOIN grain_spawn USING (grain_spawn_id)
+        LEFT JOIN cultures USING (culture_id)
+        WHERE bag_id IN ({ids})""", Bag),
+    "recipes": ("""
+        SELECT recipe_id, name, recipe_type, ingredients, instructions
+        FROM recipes
+        WHERE recipe_id IN ({ids})""", Recipe),
+}
+LOOKUP_CHUNK_SIZE = 500
+
+# what the experiments of a type are grouped by in the survival analysis, and which action ends them successfully
+LIFETIME_GROUPS = {
+    "bags": {
+        "culture": "cultures.name",
+        "recipe": "recipes.name",
+        "variant": "trim(cultures.mushroom || ' ' || cultures.variant)",
+        "medium": "cultures.medium",
+        "week": "strftime('%Y-W%W', experiments.created_at)",
+    },
+    "grain_spawn": {
+        "culture": "cultures.name",
+        "recipe": "recipes.name",
+        "variant": "trim(cultures.mushroom || ' ' || cultures.variant)",
+        "medium": "cultures.medium",
+        "week": "strftime('%Y-W%W', experiments.created_at)",
+    },
+    "cultures": {
+        "culture": "cultures.name",
+        "variant": "trim(cultures.mushroom || ' ' || cultures.variant)",
+        "medium": "cultures.medium",
+        "week": "strftime('%Y-W%W', experiments.created_at)",
+    },
+}
+CLOSING_ACTIONS = {"bags": "Harvested", "grain_spawn": "Used", "cultures": None}
+
+# statements of the report sections, for the experiments and ledger entries of one period [$start, $end)
+REPORT_SECTIONS = {
+    "inventory": """
+        WITH
+
+        closings AS (
+            SELECT 'Cultures' AS experiment_type, culture_id AS id, min(date(observed_at)) AS closed_at
+            FROM {culture_observations}
+            WHERE action = 'Destroyed'
+            GROUP BY culture_id
+            UNION ALL
+            SELECT 'Grain Spawn', grain_spawn_id, min(date(observed_at))
+            FROM {grain_spawn_observations}
+            WHERE action in ('Used', 'Destroyed')
+            GROUP BY grain_spawn_id
+            UNION ALL
+            SELECT 'Bags', bag_id, min(date(observed_at))
+            FROM {bag_observations}
+            WHERE action in ('Harvested', 'Destroyed')
+            GROUP BY bag_id),
+
+        experiments AS (
+            SELECT 'Cultures' AS experiment_type, culture_id AS id, date(created_at) AS created_at FROM {cultures}
+            UNION ALL
+            SELECT 'Grain Spawn', grain_spawn_id, date(created_at) FROM {grain_spawn}
+            UNION ALL
+            SELECT 'Bags', bag_id, date(created_at) FROM {bags})
+
+        SELECT
+            experiment_type,
+            coalesce(sum(created_at >= $start AND created_at < $end), 0),
+            coalesce(sum(closed_at >= $start AND closed_at < $end), 0),
+            coalesce(sum(created_at < $end AND (closed_at IS NULL OR closed_at >= $end)), 0)
+        FROM experiments
+        LEFT JOIN closings USING (experiment_type, id)
+        GROUP BY experiment_type
+        ORDER BY experiment_type""",
+    "yields": """
+        SELECT
+            trim(coalesce(cultures.mushroom, '') || ' ' || coalesce(cultures.variant, '')) AS strain,
+            count(DISTINCT obs.bag_id),
+            count(*),
+            total(obs.harvested)
+        FROM {bag_observations} obs
+        JOIN {bags} bags USING (bag_id)
+        LEFT JOIN {grain_spawn} grain_spawn USING (grain_spawn_id)
+        LEFT JOIN {cultures} cultures USING (culture_id)
+        WHERE obs.harvested > 0 AND date(obs.observed_at) >= $start AND date(obs.observed_at) < $end
+        GROUP BY strain
+        ORDER BY strain""",
+    "losses": """
+        WITH
+
+        failures AS (
+            SELECT 'Cultures' AS experiment_type, culture_id, passed, action, observed_at
+            FROM {culture_observations}
+            UNION ALL
+            SELECT 'Grain Spawn', grain_spawn.culture_id, obs.passed, obs.action, obs.observed_at
+            FROM {grain_spawn_observations} obs
+            JOIN {grain_spawn} grain_spawn USING (grain_spawn_id)
+            UNION ALL
+            SELECT 'Bags', grain_spawn.culture_id, obs.passed, obs.action, obs.observed_at
+            FROM {bag_observations} obs
+            JOIN {bags} bags USING (bag_id)
+            JOIN {grain_spawn} grain_spawn USING (grain_spawn_id))
+
+        SELECT
+            experiment_type,
+            trim(coalesce(cultures.mushroom, '') || ' ' || coalesce(cultures.variant, '')) AS strain,
+            sum(passed = 0),
+            sum(action = 'Destroyed')
+        FROM failures
+        LEFT JOIN {cultures} cultures USING (culture_id)
+        WHERE (passed = 0 OR action = 'Destroyed')
+          AND date(observed_at) >= $start AND date(observed_at) < $end
+        GROUP BY experiment_type, strain
+        ORDER BY experiment_type, strain""",
+    "costs": """
+        SELECT
+            category,
+            count(*),
+            total(amount)
+        FROM cost_entries
+        WHERE date(booked_at) >= $start AND date(booked_at) < $end
+        GROUP BY category
+        ORDER BY category""",
+}
+
+# the tables each report section reads, and whether it only reads their rows dated within the period; a cached
+# section stays valid until one of the rows it may read changes
+REPORT_SECTION_TABLES = {
+    "inventory": {"cultures": False, "grain_spawn": False, "bags": False, "culture_observations": False,
+                  "grain_spawn_observations": False, "bag_observations": False},
+    "yields": {"cultures": False, "grain_spawn": False, "bags": False, "bag_observations": True},
+    "losses": {"cultures": False, "grain_spawn": False, "bags": False, "culture_observations": True,
+               "grain_spawn_observations": True, "bag_observations": True},
+    "costs": {"cost_entries": True},
+}
+
+# observation table, id column and observation class per experiment type
+OBSERVATION_TABLES = {
+    "cultures": ("culture_observations", "culture_id", CultureObservation),
+    "grain_spawn": ("grain_spawn_observations", "grain_spawn_id", GrainSpawnObservation),
+    "bags": ("bag_observations", "bag_id", BagObservation),
+}
+
+
+# references followed by the consistency checker per table, with the column its rows are checked in ranges of, as
+# (expression, referenced table, referenced column); NULL references are not dangling, as with foreign keys
+CHECKED_REFERENCES = {
+    "cultures": ("culture_id", [("location_id", "locations", "location_id")]),
+    "grain_spawn": ("grain_spawn_id", [("culture_id", "cultures", "culture_id"),
+                                       ("recipe_id", "recipes", "recipe_id"),
+                                       ("location_id", "locations", "location_id")]),
+    "bags": ("bag_id", [("grain_spawn_id", "grain_spawn", "grain_spawn_id"),
+                        ("recipe_id", "recipes", "recipe_id"),
+                        ("location_id", "locations", "location_id")]),
+    "culture_observations": ("culture_id", [("culture_id", "cultures", "culture_id")]),
+    "grain_spawn_observations": ("grain_spawn_id", [("grain_spawn_id", "grain_spawn", "grain_spawn_id")]),
+    "bag_observations": ("bag_id", [("bag_id", "bags", "bag_id")]),
+    "cost_entries": ("cost_entry_id", [("recipe_id", "recipes", "recipe_id"),
+                                       ("culture_id", "cultures", "culture_id"),
+                                       ("grain_spawn_id", "grain_spawn", "grain_spawn_id"),
+                                       ("bag_id", "bags", "bag_id")]),
+    # the photos' primary key starts with the experiment type, they are checked in ranges of their rowid
+    "observation_photos": ("rowid", [
+        (f"CASE WHEN experiment_type = '{experiment_type}' THEN experiment_id END", experiment_type, id_column)
+        for experiment_type, (_, id_column, _) in OBSERVATION_TABLES.items()]),
+}
+
+# the actions that end an experiment, no observation should follow them
+FINAL_ACTIONS = {"cultures": ("Destroyed",), "grain_spawn": ("Used", "Destroyed"), "bags": ("Harvested", "Destroyed")}
+
+# the letter between the date and the number of the day in the experiments' names
+NAME_CODES = {"cultures": "C", "grain_spawn": "GS", "bags": "B"}
 
 
 class Database:
-    def __init__(self):
+    def __init__(self, database_path=os.path.join("data", "pyLabBook.db"),
+                 archive_directory=os.path.join("data", "archive"), sparse_observations=False, working_copy=False):
+        # database_path may also be ":memory:"; with working_copy the file is loaded into memory on connect
+        # and only written back by flush
+        self.database_path = database_path
+        self.archive_directory = archive_directory
+        self.sparse_observations = sparse_observations
+        self.working_copy = working_copy
+        self.read_only = False
+        self.flushed_changes = 0
+        self.listeners = []
+        self.attached_years = set()
+        self.dimension_names = {table: {} for table in DIMENSIONS.values()}
         self.connection = None
         self.cursor = None
 
-    def connect(self):
-        database_path = os.path.join("data", "pyLabBook.db")
-        self.connection = sqlite3.connect(database_path)
+    def connect(self, read_only=False, **kwargs):
+        self.read_only = read_only
+        if self.working_copy:
+            self.connection = sqlite3.connect(":memory:", **kwargs)
+            if os.path.exists(self.database_path):
+                disk = sqlite3.connect(self.database_path)
+                try:
+                    disk.backup(self.connection)
+                finally:
+                    disk.close()
+            self.flushed_changes = self.connection.total_changes
+        elif read_only:
+            uri = pathlib.Path(self.database_path).absolute().as_uri() + "?mode=ro"
+            self.connection = sqlite3.connect(uri, uri=True, **kwargs)
+        else:
+            self.connection = sqlite3.connect(self.database_path, **kwargs)
         self.cursor = self.connection.cursor()
 
+    def reader(self, **kwargs):
+        # a read-only connection of its own for long reads, run them inside its snapshot(); with the database
+        # in WAL mode the writes on this connection never wait for it, and it never waits for them
+        if self.database_path == ":memory:" or self.working_copy:
+            # an in-memory database is only reachable through its one connection
+            return self
+        if not self.read_only:
+            self.connection.execute("PRAGMA journal_mode = WAL")
+        reader = Database(self.database_path, self.archive_directory, self.sparse_observations)
+        reader.connect(read_only=True, **kwargs)
+        reader.connection.execute("PRAGMA query_only = 1")
+        return reader
+
+    @contextlib.contextmanager
+    def snapshot(self):
+        # every read inside sees the database as it was when the snapshot began, whatever is committed meanwhile
+        years = [year for year, in self.cursor.execute("SELECT year FROM archives")]
+        for year in years:
+            # attaching ends a transaction, so every archive is attached up front
+            self.attach_archive(year)
+        self.connection.commit()
+        self.cursor.execute("BEGIN")
+        try:
+            # a WAL snapshot of each file starts with its first read, so all of them are read at once
+            for schema in ["main"] + [f"archive_{year}" for year in sorted(self.attached_years)]:
+                self.cursor.execute(f"SELECT count(*) FROM {schema}.sqlite_master").fetchone()
+            yield self
+        finally:
+            self.connection.rollback()
+
+    def flush(self):
+        # the working copy is written next to the database file and then swapped in, so a crash during the
+        # flush leaves the previous file intact
+        if not self.working_copy or self.connection.total_changes == self.flushed_changes:
+            return False
+        directory = os.path.dirname(os.path.abspath(self.database_path))
+        os.makedirs(directory, exist_ok=True)
+        partial = self.database_path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+
+        target = sqlite3.connect(partial)
+        try:
+            self.connection.backup(target)
+        finally:
+            target.close()
+        with open(partial, "rb") as file:
+            os.fsync(file.fileno())
+        os.replace(partial, self.database_path)
+        if hasattr(os, "O_DIRECTORY"):
+            descriptor = os.open(directory, os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+        self.flushed_changes = self.connection.total_changes
+        return True
+
+    def __initialize_auto_vacuum(self):
+        # freed pages are given back to the file system a few at a time by maintain(); a new file only needs the
+        # pragma before its first table, an existing one is rebuilt by a single VACUUM to take it
+        mode, = self.cursor.execute("PRAGMA main.auto_vacuum").fetchone()
+        if mode == 2:
+            return
+        self.connection.commit()
+        self.cursor.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        tables, = self.cursor.execute("SELECT count(*) FROM main.sqlite_master").fetchone()
+        if tables:
+            self.cursor.execute("VACUUM main")
+
     def __initialize_recipe_table(self):
 
         sql = """
@@ -66,6 +403,28 @@ class Database:
         self.cursor.execute(sql)
         self.connection.commit()
 
+    def __initialize_location_table(self):
+        sql = """
+        CREATE TABLE IF NOT EXISTS locations(
+            location_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site TEXT NOT NULL,
+            room TEXT NOT NULL DEFAULT '',
+            rack TEXT NOT NULL DEFAULT '',
+            UNIQUE (site, room, rack))"""
+        self.cursor.execute(sql)
+
+        for table, id_column in LOCATED_TABLES.items():
+            columns = [c for (_, c, *_) in self.cursor.execute(f"PRAGMA main.table_info({table})")]
+            if "location_id" not in columns:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN location_id INTEGER "
+                                    f"REFERENCES locations(location_id)")
+                # the change log triggers list the table's columns, they are created again with the new one
+                for event in ("insert", "update"):
+                    self.cursor.execute(f"DROP TRIGGER IF EXISTS {table}_change_log_{event}")
+            # the reads of one site or room look up its locations and then range scan their experiments
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_location ON {table}(location_id, {id_column})")
+        self.connection.commit()
+
     def __initialize_action_tables(self):
         sql = """
         CREATE TABLE IF NOT EXISTS culture_observations(
@@ -97,13 +456,527 @@ class Database:
             self.cursor.execute(statement)
         self.connection.commit()
 
+    def __initialize_inspection_sweep_table(self):
+        # a sweep row stands for "every live experiment of this type passed" on that day, at its site or in its
+        # room of the site; an empty site stands for every location
+        sql = """
+        CREATE TABLE IF NOT EXISTS inspection_sweeps(
+            experiment_type TEXT CHECK ( experiment_type in ('cultures', 'grain_spawn', 'bags') ),
+            observed_at DATETIME DEFAULT (current_date),
+            site TEXT NOT NULL DEFAULT '',
+            room TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (experiment_type, observed_at, site, room))"""
+        self.cursor.execute(sql)
+
+        columns = [c for (_, c, *_) in self.cursor.execute("PRAGMA main.table_info(inspection_sweeps)")]
+        if "site" not in columns:
+            # the primary key changes, so the table is copied; the sweeps from before covered every location.
+            # Its change log triggers go with the old table and are created again for the new one
+            self.cursor.execute("ALTER TABLE inspection_sweeps RENAME TO inspection_sweeps_unscoped")
+            self.cursor.execute(sql)
+            self.cursor.execute("""
+            INSERT INTO inspection_sweeps(experiment_type, observed_at)
+            SELECT experiment_type, observed_at FROM inspection_sweeps_unscoped""")
+            self.cursor.execute("DROP TABLE inspection_sweeps_unscoped")
+        self.connection.commit()
+
+    def __initialize_change_log(self):
+        sql = """
+        CREATE TABLE IF NOT EXISTS change_log(
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            committed_at DATETIME DEFAULT (current_timestamp),
+            table_name TEXT NOT NULL,
+            operation TEXT NOT NULL CHECK ( operation in ('upsert', 'delete') ),
+            row_data TEXT NOT NULL)"""
+        self.cursor.execute(sql)
+
+        # the dimension keys of cultures are derived from their names by a trigger, on every database alike; an
+        # update that only sets them is no change of its own
+        derived = {"cultures": {f"{column}_key" for column in DIMENSIONS}}
+        for table, keys in CHANGE_LOG_TABLES.items():
+            columns = [c for (_, c, *_) in self.cursor.execute(f"PRAGMA table_info({table})").fetchall()
+                       if c not in derived.get(table, ())]
+            new_row = ", ".join(f"'{c}', NEW.{c}" for c in columns)
+            old_key = ", ".join(f"'{c}', OLD.{c}" for c in keys)
+            changed = " OR ".join(f"NEW.{c} IS NOT OLD.{c}" for c in columns)
+            for event, operation, row, when in (("INSERT", "upsert", new_row, ""),
+                                                ("UPDATE", "upsert", new_row, f" WHEN {changed}"),
+                                                ("DELETE", "delete", old_key, "")):
+                self.cursor.execute(f"DROP TRIGGER IF EXISTS {table}_change_log_{event.lower()}")
+                sql = f"""
+                CREATE TRIGGER {table}_change_log_{event.lower()} AFTER {event} ON {table}{when}
+                BEGIN
+                    INSERT INTO change_log(table_name, operation, row_data)
+                    VALUES ('{table}', '{operation}', json_object({row}));
+                END"""
+                self.cursor.execute(sql)
+        self.connection.commit()
+
+    def __initialize_recipe_search(self):
+        exists = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'recipes_fts'").fetchone()
+        statements = ["""
+        CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+            name, ingredients, instructions,
+            content='recipes', content_rowid='recipe_id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_insert AFTER INSERT ON recipes
+        BEGIN
+            INSERT INTO recipes_fts(rowid, name, ingredients, instructions)
+            VALUES (NEW.recipe_id, NEW.name, NEW.ingredients, NEW.instructions);
+        END""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_delete AFTER DELETE ON recipes
+        BEGIN
+            INSERT INTO recipes_fts(recipes_fts, rowid, name, ingredients, instructions)
+            VALUES ('delete', OLD.recipe_id, OLD.name, OLD.ingredients, OLD.instructions);
+        END""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS recipes_fts_update AFTER UPDATE ON recipes
+        BEGIN
+            INSERT INTO recipes_fts(recipes_fts, rowid, name, ingredients, instructions)
+            VALUES ('delete', OLD.recipe_id, OLD.name, OLD.ingredients, OLD.instructions);
+            INSERT INTO recipes_fts(rowid, name, ingredients, instructions)
+            VALUES (NEW.recipe_id, NEW.name, NEW.ingredients, NEW.instructions);
+        END"""]
+        for statement in statements:
+            self.cursor.execute(statement)
+
+        if not exists:
+            # index the recipes written before the search table existed
+            self.cursor.execute("INSERT INTO recipes_fts(recipes_fts) VALUES ('rebuild')")
+        self.connection.commit()
+
+    def __initialize_archive_table(self):
+        sql = """
+        CREATE TABLE IF NOT EXISTS archives(
+            year INTEGER PRIMARY KEY,
+            archived_until DATETIME NOT NULL)"""
+        self.cursor.execute(sql)
+        self.connection.commit()
+
+    def __initialize_sensor_tables(self):
+        aggregates = ",\n".join(f"            {m}_n INTEGER, {m}_sum FLOAT, {m}_min FLOAT, {m}_max FLOAT"
+                                 for m in SENSOR_METRICS)
+        sql = f"""
+        CREATE TABLE IF NOT EXISTS sensor_readings(
+            location TEXT NOT NULL,
+            measured_at DATETIME NOT NULL,
+            temperature FLOAT,
+            humidity FLOAT,
+            co2 FLOAT,
+            PRIMARY KEY (location, measured_at)) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS sensor_rollups(
+            resolution TEXT CHECK ( resolution in ('minute', 'hour', 'day') ),
+            location TEXT NOT NULL,
+            bucket DATETIME NOT NULL,
+{aggregates},
+            PRIMARY KEY (resolution, location, bucket)) WITHOUT ROWID"""
+
+        for statement in sql.split(";"):
+            self.cursor.execute(statement)
+        self.connection.commit()
+
+    def __initialize_finance_tables(self):
+        # experiment_costs carries each experiment's own costs and number of children, the economics tables the
+        # per strain and per recipe totals; triggers keep all of them current, so the ledger is never re-read
+        exists = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'experiment_costs'").fetchone()
+        statements = ["""
+        CREATE TABLE IF NOT EXISTS cost_entries(
+            cost_entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            booked_at DATETIME DEFAULT (current_date),
+            category TEXT NOT NULL CHECK ( category in ('Substrate', 'Grain', 'Agar', 'Labour', 'Other') ),
+            amount FLOAT NOT NULL,
+            description TEXT,
+            recipe_id INTEGER,
+            culture_id INTEGER,
+            grain_spawn_id INTEGER,
+            bag_id INTEGER,
+            batch_type TEXT CHECK ( batch_type in ('cultures', 'grain_spawn', 'bags') OR batch_type IS NULL ),
+            batch_created_at DATETIME,
+            FOREIGN KEY (recipe_id) REFERENCES recipes(recipe_id),
+            FOREIGN KEY (culture_id) REFERENCES cultures(culture_id),
+            FOREIGN KEY (grain_spawn_id) REFERENCES grain_spawn(grain_spawn_id),
+            FOREIGN KEY (bag_id) REFERENCES bags(bag_id))""",
+                      """
+        CREATE TABLE IF NOT EXISTS experiment_costs(
+            experiment_type TEXT CHECK ( experiment_type in ('cultures', 'grain_spawn', 'bags') ),
+            experiment_id INTEGER,
+            parent_id INTEGER,
+            recipe_id INTEGER,
+            mushroom TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            direct_cost FLOAT NOT NULL DEFAULT 0,
+            n_children INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (experiment_type, experiment_id)) WITHOUT ROWID""",
+                      """
+        CREATE TABLE IF NOT EXISTS spawn_recipe_bags(
+            grain_spawn_id INTEGER,
+            recipe_id INTEGER,
+            n_bags INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (grain_spawn_id, recipe_id)) WITHOUT ROWID""",
+                      """
+        CREATE TABLE IF NOT EXISTS strain_economics(
+            mushroom TEXT,
+            variant TEXT,
+            cost FLOAT NOT NULL DEFAULT 0,
+            n_bags INTEGER NOT NULL DEFAULT 0,
+            harvested FLOAT NOT NULL DEFAULT 0,
+            PRIMARY KEY (mushroom, variant)) WITHOUT ROWID""",
+                      """
+        CREATE TABLE IF NOT EXISTS recipe_economics(
+            recipe_id INTEGER PRIMARY KEY,
+            direct_cost FLOAT NOT NULL DEFAULT 0,
+            n_bags INTEGER NOT NULL DEFAULT 0,
+            harvested FLOAT NOT NULL DEFAULT 0)""",
+                      """
+        CREATE VIEW IF NOT EXISTS cost_entry_targets AS
+            SELECT cost_entry_id, 'bags' AS experiment_type, bag_id AS experiment_id, 1.0 AS share
+            FROM cost_entries
+            WHERE bag_id IS NOT NULL
+            UNION ALL
+            SELECT cost_entry_id, 'grain_spawn', grain_spawn_id, 1.0
+            FROM cost_entries
+            WHERE bag_id IS NULL AND grain_spawn_id IS NOT NULL
+            UNION ALL
+            SELECT cost_entry_id, 'cultures', culture_id, 1.0
+            FROM cost_entries
+            WHERE bag_id IS NULL AND grain_spawn_id IS NULL AND culture_id IS NOT NULL
+            UNION ALL
+            SELECT cost_entry_id, batch_type, experiment_id, 1.0 / count(*) OVER (PARTITION BY cost_entry_id)
+            FROM cost_entries
+            JOIN (SELECT 'bags' AS experiment_type, bag_id AS experiment_id, date(created_at) AS created_at
+                  FROM bags
+                  UNION ALL
+                  SELECT 'grain_spawn', grain_spawn_id, date(created_at) FROM grain_spawn
+                  UNION ALL
+                  SELECT 'cultures', culture_id, date(created_at) FROM cultures) batch
+              ON batch.experiment_type = cost_entries.batch_type
+             AND batch.created_at = date(cost_entries.batch_created_at)
+            WHERE bag_id IS NULL AND grain_spawn_id IS NULL AND culture_id IS NULL""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS cultures_finance AFTER INSERT ON cultures
+        BEGIN
+            INSERT OR IGNORE INTO experiment_costs(experiment_type, experiment_id, mushroom, variant)
+            VALUES ('cultures', NEW.culture_id, coalesce(NEW.mushroom, ''), coalesce(NEW.variant, ''));
+        END""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS grain_spawn_finance AFTER INSERT ON grain_spawn
+        BEGIN
+            INSERT OR IGNORE INTO experiment_costs(experiment_type, experiment_id, parent_id, recipe_id,
+                                                   mushroom, variant)
+            SELECT 'grain_spawn', NEW.grain_spawn_id, NEW.culture_id, NEW.recipe_id,
+                   coalesce(c.mushroom, ''), coalesce(c.variant, '')
+            FROM (SELECT 1)
+            LEFT JOIN experiment_costs c ON c.experiment_type = 'cultures' AND c.experiment_id = NEW.culture_id;
+
+            UPDATE experiment_costs SET n_children = n_children + 1
+            WHERE experiment_type = 'cultures' AND experiment_id = NEW.culture_id;
+        END""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS bags_finance AFTER INSERT ON bags
+        BEGIN
+            INSERT OR IGNORE INTO experiment_costs(experiment_type, experiment_id, parent_id, recipe_id,
+                                                   mushroom, variant)
+            SELECT 'bags', NEW.bag_id, NEW.grain_spawn_id, NEW.recipe_id,
+                   coalesce(g.mushroom, ''), coalesce(g.variant, '')
+            FROM (SELECT 1)
+            LEFT JOIN experiment_costs g ON g.experiment_type = 'grain_spawn' AND g.experiment_id = NEW.grain_spawn_id;
+
+            UPDATE experiment_costs SET n_children = n_children + 1
+            WHERE experiment_type = 'grain_spawn' AND experiment_id = NEW.grain_spawn_id;
+
+            INSERT INTO spawn_recipe_bags(grain_spawn_id, recipe_id, n_bags)
+            SELECT NEW.grain_spawn_id, NEW.recipe_id, 1
+            WHERE NEW.grain_spawn_id IS NOT NULL AND NEW.recipe_id IS NOT NULL
+            ON CONFLICT (grain_spawn_id, recipe_id) DO UPDATE SET n_bags = n_bags + 1;
+
+            INSERT INTO strain_economics(mushroom, variant, n_bags)
+            SELECT mushroom, variant, 1
+            FROM experiment_costs
+            WHERE experiment_type = 'bags' AND experiment_id = NEW.bag_id
+            ON CONFLICT (mushroom, variant) DO UPDATE SET n_bags = n_bags + 1;
+
+            INSERT INTO recipe_economics(recipe_id, n_bags)
+            SELECT NEW.recipe_id, 1
+            WHERE NEW.recipe_id IS NOT NULL
+            ON CONFLICT (recipe_id) DO UPDATE SET n_bags = n_bags + 1;
+        END""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS cost_entries_finance AFTER INSERT ON cost_entries
+        BEGIN
+            UPDATE experiment_costs SET direct_cost = direct_cost + NEW.amount * t.share
+            FROM cost_entry_targets t
+            WHERE t.cost_entry_id = NEW.cost_entry_id
+              AND experiment_costs.experiment_type = t.experiment_type
+              AND experiment_costs.experiment_id = t.experiment_id;
+
+            INSERT INTO strain_economics(mushroom, variant, cost)
+            SELECT e.mushroom, e.variant, NEW.amount * sum(t.share)
+            FROM cost_entry_targets t
+            JOIN experiment_costs e ON e.experiment_type = t.experiment_type AND e.experiment_id = t.experiment_id
+            WHERE t.cost_entry_id = NEW.cost_entry_id
+            GROUP BY e.mushroom, e.variant
+            ON CONFLICT (mushroom, variant) DO UPDATE SET cost = cost + excluded.cost;
+
+            -- costs of bags count towards their substrate recipe, costs booked on nothing but a recipe towards
+            -- that recipe; grain spawn and culture costs are passed down to the bags when the economics are read
+            INSERT INTO recipe_economics(recipe_id, direct_cost)
+            SELECT e.recipe_id, NEW.amount * sum(t.share)
+            FROM cost_entry_targets t
+            JOIN experiment_costs e ON e.experiment_type = t.experiment_type AND e.experiment_id = t.experiment_id
+            WHERE t.cost_entry_id = NEW.cost_entry_id AND t.experiment_type = 'bags' AND e.recipe_id IS NOT NULL
+            GROUP BY e.recipe_id
+            ON CONFLICT (recipe_id) DO UPDATE SET direct_cost = direct_cost + excluded.direct_cost;
+
+            INSERT INTO recipe_economics(recipe_id, direct_cost)
+            SELECT NEW.recipe_id, NEW.amount
+            WHERE NEW.recipe_id IS NOT NULL
+              AND NOT EXISTS(SELECT 1 FROM cost_entry_targets t WHERE t.cost_entry_id = NEW.cost_entry_id)
+            ON CONFLICT (recipe_id) DO UPDATE SET direct_cost = direct_cost + excluded.direct_cost;
+        END""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS bag_observations_finance_insert AFTER INSERT ON bag_observations
+        WHEN coalesce(NEW.harvested, 0) != 0
+        BEGIN
+            UPDATE strain_economics SET harvested = harvested + NEW.harvested
+            FROM experiment_costs e
+            WHERE e.experiment_type = 'bags' AND e.experiment_id = NEW.bag_id
+              AND strain_economics.mushroom = e.mushroom AND strain_economics.variant = e.variant;
+
+            UPDATE recipe_economics SET harvested = harvested + NEW.harvested
+            FROM experiment_costs e
+            WHERE e.experiment_type = 'bags' AND e.experiment_id = NEW.bag_id
+              AND recipe_economics.recipe_id = e.recipe_id;
+        END""",
+                      """
+        CREATE TRIGGER IF NOT EXISTS bag_observations_finance_update AFTER UPDATE OF harvested ON bag_observations
+        WHEN coalesce(NEW.harvested, 0) != coalesce(OLD.harvested, 0)
+        BEGIN
+            UPDATE strain_economics
+            SET harvested = harvested + coalesce(NEW.harvested, 0) - coalesce(OLD.harvested, 0)
+            FROM experiment_costs e
+            WHERE e.experiment_type = 'bags' AND e.experiment_id = NEW.bag_id
+              AND strain_economics.mushroom = e.mushroom AND strain_economics.variant = e.variant;
+
+            UPDATE recipe_economics
+            SET harvested = harvested + coalesce(NEW.harvested, 0) - coalesce(OLD.harvested, 0)
+            FROM experiment_costs e
+            WHERE e.experiment_type = 'bags' AND e.experiment_id = NEW.bag_id
+              AND recipe_economics.recipe_id = e.recipe_id;
+        END"""]
+        for statement in statements:
+            self.cursor.execute(statement)
+
+        if not exists:
+            self.__rebuild_finance_tables()
+        self.connection.commit()
+
+    def __rebuild_finance_tables(self):
+        # experiments written before the finance tables existed; there are no costs yet, only counts and harvests
+        statements = ["""
+        INSERT OR IGNORE INTO experiment_costs(experiment_type, experiment_id, mushroom, variant, n_children)
+        SELECT 'cultures', culture_id, coalesce(mushroom, ''), coalesce(variant, ''),
+               (SELECT count(*) FROM grain_spawn WHERE grain_spawn.culture_id = cultures.culture_id)
+        FROM cultures""",
+                      """
+        INSERT OR IGNORE INTO experiment_costs(experiment_type, experiment_id, parent_id, recipe_id,
+                                               mushroom, variant, n_children)
+        SELECT 'grain_spawn', grain_spawn_id, culture_id, recipe_id, coalesce(mushroom, ''), coalesce(variant, ''),
+               (SELECT count(*) FROM bags WHERE bags.grain_spawn_id = grain_spawn.grain_spawn_id)
+        FROM grain_spawn
+        LEFT JOIN cultures USING (culture_id)""",
+                      """
+        INSERT OR IGNORE INTO experiment_costs(experiment_type, experiment_id, parent_id, recipe_id,
+                                               mushroom, variant)
+        SELECT 'bags', bag_id, grain_spawn_id, bags.recipe_id, coalesce(mushroom, ''), coalesce(variant, '')
+        FROM bags
+        LEFT JOIN grain_spawn USING (grain_spawn_id)
+        LEFT JOIN cultures USING (culture_id)""",
+                      """
+        INSERT OR IGNORE INTO spawn_recipe_bags(grain_spawn_id, recipe_id, n_bags)
+        SELECT grain_spawn_id, recipe_id, count(*)
+        FROM bags
+        WHERE grain_spawn_id IS NOT NULL AND recipe_id IS NOT NULL
+        GROUP BY grain_spawn_id, recipe_id""",
+                      """
+        INSERT OR IGNORE INTO strain_economics(mushroom, variant, n_bags, harvested)
+        SELECT mushroom, variant, count(*), total(harvested)
+        FROM experiment_costs e
+        LEFT JOIN (SELECT bag_id, total(harvested) AS harvested FROM bag_observations GROUP BY bag_id) obs
+               ON obs.bag_id = e.experiment_id
+        WHERE e.experiment_type = 'bags'
+        GROUP BY mushroom, variant""",
+                      """
+        INSERT OR IGNORE INTO recipe_economics(recipe_id, n_bags, harvested)
+        SELECT recipe_id, count(*), total(harvested)
+        FROM experiment_costs e
+        LEFT JOIN (SELECT bag_id, total(harvested) AS harvested FROM bag_observations GROUP BY bag_id) obs
+               ON obs.bag_id = e.experiment_id
+        WHERE e.experiment_type = 'bags' AND recipe_id IS NOT NULL
+        GROUP BY recipe_id"""]
+        for statement in statements:
+            self.cursor.execute(statement)
+
+    def __initialize_bi_tables(self):
+        # star schema for reporting, filled by refresh_bi_tables from the change log rather than by triggers
+        sql = """
+        CREATE TABLE IF NOT EXISTS dim_strain(
+            strain_key INTEGER PRIMARY KEY AUTOINCREMENT,
+            mushroom TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            UNIQUE (mushroom, variant));
+
+        CREATE TABLE IF NOT EXISTS dim_recipe(
+            recipe_key INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            recipe_type TEXT);
+
+        CREATE TABLE IF NOT EXISTS dim_date(
+            date_key DATETIME PRIMARY KEY,
+            year INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            week TEXT NOT NULL,
+            weekday INTEGER NOT NULL) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS fact_bags(
+            bag_id INTEGER PRIMARY KEY,
+            strain_key INTEGER REFERENCES dim_strain(strain_key),
+            recipe_key INTEGER REFERENCES dim_recipe(recipe_key),
+            grain_spawn_recipe_key INTEGER REFERENCES dim_recipe(recipe_key),
+            created_date DATETIME REFERENCES dim_date(date_key),
+            ended_date DATETIME REFERENCES dim_date(date_key),
+            outcome TEXT NOT NULL CHECK ( outcome in ('Open', 'Harvested', 'Destroyed') ),
+            n_failed INTEGER NOT NULL,
+            n_flushes INTEGER NOT NULL,
+            harvested FLOAT NOT NULL,
+            days_to_first_flush INTEGER);
+
+        CREATE TABLE IF NOT EXISTS fact_flushes(
+            bag_id INTEGER REFERENCES fact_bags(bag_id),
+            harvested_date DATETIME REFERENCES dim_date(date_key),
+            flush INTEGER NOT NULL,
+            strain_key INTEGER REFERENCES dim_strain(strain_key),
+            recipe_key INTEGER REFERENCES dim_recipe(recipe_key),
+            harvested FLOAT NOT NULL,
+            PRIMARY KEY (bag_id, harvested_date)) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS bi_state(
+            name TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL)"""
+
+        for statement in sql.split(";"):
+            self.cursor.execute(statement)
+        self.connection.commit()
+
+    def __initialize_schedule_rules(self):
+        # start_after and repeat_every are days, window the days a task may wait before it is overdue;
+        # 'Inspect' is done by any observation, other actions by an observation with that action
+        exists = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'schedule_rules'").fetchone()
+        sql = """
+        CREATE TABLE IF NOT EXISTS schedule_rules(
+            rule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            experiment_type TEXT CHECK ( experiment_type in ('cultures', 'grain_spawn', 'bags') ),
+            recipe_id INTEGER,
+            action TEXT NOT NULL,
+            start_after INTEGER NOT NULL,
+            repeat_every INTEGER,
+            window INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (recipe_id) REFERENCES recipes(recipe_id))"""
+        self.cursor.execute(sql)
+
+        if not exists:
+            sql = """
+            INSERT INTO schedule_rules(experiment_type, action, start_after, repeat_every, window)
+            VALUES ('cultures', 'Inspect', 3, 3, 1),
+                   ('grain_spawn', 'Inspect', 2, 2, 1),
+                   ('grain_spawn', 'Shaken', 7, NULL, 2),
+                   ('bags', 'Inspect', 2, 2, 1),
+                   ('bags', 'Kneaded', 10, NULL, 3),
+                   ('bags', 'Harvested', 21, NULL, 7)"""
+            self.cursor.execute(sql)
+        self.connection.commit()
+
+    def __initialize_photo_table(self):
+        # the images themselves live in the content-addressed store of photos.PhotoStore
+        sql = """
+        CREATE TABLE IF NOT EXISTS observation_photos(
+            experiment_type TEXT CHECK ( experiment_type in ('cultures', 'grain_spawn', 'bags') ),
+            experiment_id INTEGER,
+            observed_at DATETIME,
+            digest TEXT NOT NULL,
+            extension TEXT NOT NULL,
+            attached_at DATETIME DEFAULT (current_timestamp),
+            PRIMARY KEY (experiment_type, experiment_id, observed_at, digest))"""
+        self.cursor.execute(sql)
+        self.connection.commit()
+
+    def __initialize_dimension_tables(self):
+        for column, table in DIMENSIONS.items():
+            self.cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}(
+                {column}_key INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE)""")
+
+        columns = [name for _, name, *_ in self.cursor.execute("PRAGMA main.table_info(cultures)")]
+        migrated = all(f"{column}_key" in columns for column in DIMENSIONS)
+        for column, table in DIMENSIONS.items():
+            if f"{column}_key" not in columns:
+                self.cursor.execute(f"ALTER TABLE cultures ADD COLUMN {column}_key INTEGER "
+                                    f"REFERENCES {table}({column}_key)")
+
+        # the keys are set by a trigger, so cultures inserted by replication or by hand are encoded as well; the
+        # inserts must not conflict, an INSERT OR REPLACE into cultures would replace the dimension rows too
+        inserts = "".join(f"""
+            INSERT INTO {table}(name)
+            SELECT NEW.{column}
+            WHERE NEW.{column} IS NOT NULL AND NOT EXISTS(SELECT 1 FROM {table} WHERE name = NEW.{column});"""
+                          for column, table in DIMENSIONS.items())
+        keys = ",".join(f"""
+                {column}_key = (SELECT {column}_key FROM {table} WHERE name = NEW.{column})"""
+                        for column, table in DIMENSIONS.items())
+        self.cursor.execute("DROP TRIGGER IF EXISTS cultures_dimensions")
+        self.cursor.execute(f"""
+        CREATE TRIGGER cultures_dimensions AFTER INSERT ON cultures
+        BEGIN{inserts}
+            UPDATE cultures SET{keys}
+            WHERE culture_id = NEW.culture_id;
+        END""")
+
+        if not migrated:
+            # cultures written before the dimensions existed, in the hot table and in every archive
+            years = [year for year, in self.cursor.execute("SELECT year FROM archives")]
+            for year in years:
+                self.attach_archive(year)
+            for schema in ["main"] + [f"archive_{year}" for year in years]:
+                for column, table in DIMENSIONS.items():
+                    self.cursor.execute(f"""
+                    INSERT OR IGNORE INTO main.{table}(name)
+                    SELECT DISTINCT {column} FROM {schema}.cultures WHERE {column} IS NOT NULL""")
+                    self.cursor.execute(f"""
+                    UPDATE {schema}.cultures
+                    SET {column}_key = (SELECT {column}_key FROM main.{table} WHERE name = cultures.{column})""")
+        self.connection.commit()
+
     def initialize_tables(self):
+        self.__initialize_auto_vacuum()
         self.__initialize_recipe_table()
         self.__initialize_culture_table()
         self.__initialize_grain_spawn_table()
         self.__initialize_bag_table()
+        self.__initialize_location_table()
         self.__initialize_action_tables()
-        # todo: extend me with financial and bi-tables
+        self.__initialize_inspection_sweep_table()
+        self.__initialize_recipe_search()
+        self.__initialize_archive_table()
+        self.__initialize_sensor_tables()
+        self.__initialize_finance_tables()
+        self.__initialize_bi_tables()
+        self.__initialize_schedule_rules()
+        self.__initialize_photo_table()
+        # after every table whose writes it records
+        self.__initialize_change_log()
+        self.__initialize_dimension_tables()
 
     def get_unique(self, column, table):
         sql = f"""SELECT DISTINCT {column} FROM {table} ORDER BY {column}"""
@@ -111,30 +984,115 @@ class Database:
         return list(itertools.chain.from_iterable(result))
 
     def get_unique_mushrooms(self):
-        return self.get_unique("mushroom", "cultures")
+        # the dimension holds every mushroom once, however many cultures there are
+        return sorted(self.dimension_name("mushrooms", key) for key in self.get_dimension("mushrooms"))
+
+    def get_dimension(self, table):
+        # {key: name} of a dimension, the names interned so that every record shares one string per value
+        names = self.dimension_names[table]
+        sql = f"SELECT rowid, name FROM {table} WHERE rowid > $after_key ORDER BY rowid"
+        # dimensions only ever grow, so only keys past the last one read are new
+        for key, name in self.connection.execute(sql, {"after_key": max(names, default=0)}):
+            names[key] = sys.intern(name)
+        return names
+
+    def dimension_name(self, table, key):
+        if key is None:
+            return None
+        names = self.dimension_names[table]
+        if key not in names:
+            names = self.get_dimension(table)
+        return names.get(key)
+
+    def __hydrator(self, factory):
+        # records are built from rows holding dimension keys, which are resolved through the interned names
+        columns = HYDRATED_COLUMNS.get(factory)
+        if not columns:
+            return factory
+
+        def hydrate(*row):
+            row = list(row)
+            for i, table in columns.items():
+                row[i] = self.dimension_name(table, row[i])
+            return factory(*row)
+        return hydrate
 
     def get_unique_recipe_names(self, recipe_type):
         sql = """SELECT DISTINCT name FROM recipes WHERE recipe_type = $recipe_type"""
         result = self.connection.execute(sql, {"recipe_type": recipe_type})
         return list(itertools.chain.from_iterable(result))
 
+    def __iter_query(self, sql, params, factory, size):
+        # a cursor of its own, so other queries can run while the generator is consumed
+        cursor = self.connection.cursor()
+        with tracing.phase("query"):
+            cursor.execute(sql, params)
+        while True:
+            with tracing.phase("query"):
+                rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            with tracing.phase("hydrate"):
+                records = [factory(*row) for row in rows]
+            yield from records
+
+    def iter_recipes(self, recipe_type=None, after_id=0, limit=-1, size=500):
+        sql = """
+        SELECT recipe_id, name, recipe_type, ingredients, instructions
+        FROM recipes
+        WHERE ($recipe_type IS NULL OR recipe_type = $recipe_type)
+          AND recipe_id > $after_id
+        ORDER BY recipe_id
+        LIMIT $limit"""
+        params = {"recipe_type": recipe_type, "after_id": after_id, "limit": limit}
+        return self.__iter_query(sql, params, Recipe, size)
+
     def get_recipes(self, recipe_type=None):
-        sql = """SELECT recipe_id, name, recipe_type, ingredients, instructions FROM recipes"""
-        result = [Recipe(*r) for r in self.connection.execute(sql)]
+        return {r.name: r for r in self.iter_recipes(recipe_type)}
 
-        if recipe_type is not None:
-            out = {r.name: r for r in result if r.recipe_type == recipe_type}
-        else:
-            out = {r.name: r for r in result}
-        return out
+    def get_recipes_page(self, recipe_type=None, after_id=0, limit=500):
+        return list(self.iter_recipes(recipe_type, after_id, limit))
+
+    def search_recipes(self, query, recipe_type=None, limit=50):
+        # every word has to match, as a prefix, in the name, ingredients or instructions
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return {}
+
+        sql = """
+        SELECT
+            recipes.recipe_id,
+            recipes.name,
+            recipes.recipe_type,
+            recipes.ingredients,
+            recipes.instructions
+        FROM recipes_fts
+        JOIN recipes ON recipes.recipe_id = recipes_fts.rowid
+        WHERE recipes_fts MATCH $match
+          AND ($recipe_type IS NULL OR recipes.recipe_type = $recipe_type)
+        ORDER BY bm25(recipes_fts, 10.0, 5.0, 1.0)
+        LIMIT $limit"""
+        params = {"match": " ".join(f'"{t}"*' for t in terms), "recipe_type": recipe_type, "limit": limit}
+        return {r.name: r for r in (Recipe(*r) for r in self.cursor.execute(sql, params))}
 
     def get_n(self, table, created_at):
+        table = self.__history_tables(created_at).get(table, table)
         sql = f"SELECT count(*) FROM {table} WHERE date(created_at) = $created_at"
         result = self.cursor.execute(sql, {"created_at": created_at})
         out, = result.fetchone()
         return out
 
-    def get_current_bags(self, date):
+    @staticmethod
+    def __location_filter(alias, site, room):
+        # experiments of one site, or of one room of it; without a site those of every location
+        if site is None:
+            return ""
+        return f"""
+              AND {alias}.location_id IN (SELECT location_id
+                                         FROM locations
+                                         WHERE site = $site AND ($room IS NULL OR room = $room))"""
+
+    def iter_current_bags(self, date, after_id=0, limit=-1, size=500, site=None, room=None):
         sql = """
         WITH
         
@@ -143,37 +1101,48 @@ class Database:
                 bags.created_at,
                 bags.bag_id,
                 bags.grain_spawn_id,
-                bags.recipe_id
-            FROM bags
+                bags.recipe_id,
+                bags.location_id
+            FROM {bags} bags
             WHERE NOT EXISTS(SELECT 1
-                             FROM bag_observations obs
+                             FROM {bag_observations} obs
                              WHERE obs.bag_id = bags.bag_id
                                AND obs.action in ('Harvested', 'Destroyed')
                                AND obs.observed_at <= $date)
-              AND bags.created_at <= $date),
+              AND bags.created_at <= $date
+              AND bags.bag_id > $after_id{location}),
                                
         bag_info AS (
             SELECT
                 grain_spawn.grain_spawn_id,
-                cultures.mushroom,
-                cultures.variant
-            FROM grain_spawn
-            LEFT JOIN cultures USING (culture_id))
+                cultures.mushroom_key,
+                cultures.variant_key
+            FROM {grain_spawn} grain_spawn
+            LEFT JOIN {cultures} cultures USING (culture_id))
             
         SELECT 
             created_at,
             bag_id,
             grain_spawn_id,
             recipe_id,
-            mushroom,
-            variant
+            mushroom_key,
+            variant_key,
+            location_id
         FROM current_bags
         LEFT JOIN bag_info USING (grain_spawn_id)
-        """
-        out = [Bag(*b) for b in self.cursor.execute(sql, {"date": date})]
-        return out
+        ORDER BY bag_id
+        LIMIT $limit
+        """.format(location=self.__location_filter("bags", site, room), **self.__history_tables(date))
+        params = {"date": date, "after_id": after_id, "limit": limit, "site": site, "room": room}
+        return self.__iter_query(sql, params, self.__hydrator(Bag), size)
+
+    def get_current_bags(self, date, site=None, room=None):
+        return list(self.iter_current_bags(date, site=site, room=room))
 
-    def get_current_grain_spawn(self, date):
+    def get_current_bags_page(self, date, after_id=0, limit=500, site=None, room=None):
+        return list(self.iter_current_bags(date, after_id, limit, site=site, room=room))
+
+    def iter_current_grain_spawn(self, date, after_id=0, limit=-1, size=500, site=None, room=None):
         sql = """
         WITH 
         
@@ -182,57 +1151,97 @@ class Database:
                 date(created_at) as created_at,
                 grain_spawn_id,
                 culture_id,
-                recipe_id
-            FROM grain_spawn gra
+                recipe_id,
+                location_id
+            FROM {grain_spawn} gra
             WHERE NOT EXISTS(SELECT 1
-                             FROM grain_spawn_observations obs
+                             FROM {grain_spawn_observations} obs
                              WHERE obs.grain_spawn_id = gra.grain_spawn_id
                                AND (obs.action in ('Destroyed', 'Used') AND obs.observed_at < $date))
-              AND gra.created_at <= $date),
+              AND gra.created_at <= $date
+              AND gra.grain_spawn_id > $after_id{location}),
         
         grain_spawn_info AS (
             SELECT
                 culture_id,
-                mushroom,
-                variant
-            FROM cultures)
+                mushroom_key,
+                variant_key
+            FROM {cultures} cultures)
             
         SELECT
             created_at,
             grain_spawn_id,
             culture_id,
             recipe_id,
-            mushroom,
-            variant
+            mushroom_key,
+            variant_key,
+            location_id
         FROM current_grain_spawn
-        LEFT JOIN grain_spawn_info USING (culture_id)                     
-        """
-        print(sql)
-        out = [GrainSpawn(*g) for g in self.cursor.execute(sql, {"date": date})]
-        return out
+        LEFT JOIN grain_spawn_info USING (culture_id)
+        ORDER BY grain_spawn_id
+        LIMIT $limit
+        """.format(location=self.__location_filter("gra", site, room), **self.__history_tables(date))
+        params = {"date": date, "after_id": after_id, "limit": limit, "site": site, "room": room}
+        return self.__iter_query(sql, params, self.__hydrator(GrainSpawn), size)
+
+    def get_current_grain_spawn(self, date, site=None, room=None):
+        return list(self.iter_current_grain_spawn(date, site=site, room=room))
+
+    def get_current_grain_spawn_page(self, date, after_id=0, limit=500, site=None, room=None):
+        return list(self.iter_current_grain_spawn(date, after_id, limit, site=site, room=room))
 
-    def get_current_cultures(self, date):
+    def iter_current_cultures(self, date, after_id=0, limit=-1, size=500, site=None, room=None):
         sql = """
         SELECT 
             cul.created_at, 
             cul.culture_id,
-            cul.mushroom,
-            cul.variant,
-            cul.medium
-        FROM cultures cul
+            cul.mushroom_key,
+            cul.variant_key,
+            cul.medium_key,
+            cul.location_id
+        FROM {cultures} cul
         WHERE NOT EXISTS(SELECT 1
-                         FROM culture_observations obs
+                         FROM {culture_observations} obs
                          WHERE obs.culture_id = cul.culture_id
                            AND obs.action = 'Destroyed'
                            AND (obs.observed_at < $date AND cul.created_at >= $date))
-        """
-        out = [Culture(*c) for c in self.cursor.execute(sql, {"date": date})]
-        return out
+          AND cul.culture_id > $after_id{location}
+        ORDER BY cul.culture_id
+        LIMIT $limit
+        """.format(location=self.__location_filter("cul", site, room), **self.__history_tables(date))
+        params = {"date": date, "after_id": after_id, "limit": limit, "site": site, "room": room}
+        return self.__iter_query(sql, params, self.__hydrator(Culture), size)
+
+    def get_current_cultures(self, date, site=None, room=None):
+        return list(self.iter_current_cultures(date, site=site, room=room))
+
+    def get_current_cultures_page(self, date, after_id=0, limit=500, site=None, room=None):
+        return list(self.iter_current_cultures(date, after_id, limit, site=site, room=room))
+
+    def get_locations(self):
+        sql = "SELECT location_id, site, room, rack FROM locations ORDER BY site, room, rack"
+        return [Location(*row) for row in self.cursor.execute(sql)]
 
-    def write(self, obj):
+    def add_listener(self, listener):
+        # listeners are called with every object once it is written
+        self.listeners.append(listener)
+
+    def write(self, obj, commit=True):
+        try:
+            self.__write(obj)
+        except Exception:
+            if commit:
+                self.connection.rollback()
+            raise
+        if commit:
+            self.connection.commit()
+        for listener in self.listeners:
+            listener(obj)
+
+    def __write(self, obj):
         if isinstance(obj, list):
             for o in obj:
-                self.write(o)
+                self.__write(o)
         elif isinstance(obj, Recipe):
             self.__write_recipe(obj)
         elif isinstance(obj, Culture):
@@ -247,6 +1256,14 @@ class Database:
             self.__write_grain_spawn_observation(obj)
         elif isinstance(obj, BagObservation):
             self.__write_bag_observation(obj)
+        elif isinstance(obj, Inspection):
+            self.__write_inspection(obj)
+        elif isinstance(obj, CostEntry):
+            self.__write_cost_entry(obj)
+        elif isinstance(obj, Photo):
+            self.__write_photo(obj)
+        elif isinstance(obj, Location):
+            self.__write_location(obj)
         else:
             raise NotImplementedError
 
@@ -260,41 +1277,46 @@ class Database:
         INSERT INTO recipes(name, recipe_type, ingredients, instructions) 
         VALUES ($name, $recipe_type, $ingredients, $instructions)"""
         self.cursor.execute(sql, params)
-        self.connection.commit()
 
     def __write_culture(self, culture):
         params = {'name': str(culture),
                   'created_at': culture.created_at,
                   'variant': culture.variant,
                   'mushroom': culture.mushroom,
-                  'medium': culture.medium}
+                  'medium': culture.medium,
+                  'location_id': culture.location_id}
         sql = """
-        INSERT INTO cultures(name, created_at, variant, mushroom, medium)
-        VALUES ($name, $created_at, $variant, $mushroom, $medium)"""
+        INSERT INTO cultures(name, created_at, variant, mushroom, medium, location_id)
+        VALUES ($name, $created_at, $variant, $mushroom, $medium, $location_id)"""
         self.cursor.execute(sql, params)
-        self.connection.commit()
 
     def __write_grain_spawn(self, grain_spawn):
         params = {'name': str(grain_spawn),
                   'created_at': grain_spawn.created_at,
                   'culture_id': grain_spawn.culture_id,
-                  'recipe_id': grain_spawn.recipe_id}
+                  'recipe_id': grain_spawn.recipe_id,
+                  'location_id': grain_spawn.location_id}
         sql = """
-        INSERT INTO grain_spawn(name, created_at, culture_id, recipe_id)
-        VALUES ($name, $created_at, $culture_id, $recipe_id)"""
+        INSERT INTO grain_spawn(name, created_at, culture_id, recipe_id, location_id)
+        VALUES ($name, $created_at, $culture_id, $recipe_id, $location_id)"""
         self.cursor.execute(sql, params)
-        self.connection.commit()
 
     def __write_bag(self, bag):
         params = {'name': bag.name,
                   'created_at': bag.created_at,
                   'grain_spawn_id': bag.grain_spawn_id,
-                  'recipe_id': bag.recipe_id}
+                  'recipe_id': bag.recipe_id,
+                  'location_id': bag.location_id}
         sql = """
-        INSERT INTO bags(name, created_at, grain_spawn_id, recipe_id)
-        VALUES ($name, $created_at, $grain_spawn_id, $recipe_id)"""
+        INSERT INTO bags(name, created_at, grain_spawn_id, recipe_id, location_id)
+        VALUES ($name, $created_at, $grain_spawn_id, $recipe_id, $location_id)"""
         self.cursor.execute(sql, params)
-        self.connection.commit()
+
+    def __write_location(self, location: Location):
+        sql = """
+        INSERT INTO locations(site, room, rack) VALUES ($site, $room, $rack)
+        ON CONFLICT (site, room, rack) DO NOTHING"""
+        self.cursor.execute(sql, {"site": location.site, "room": location.room, "rack": location.rack})
 
     def __write_culture_observation(self, culture_observation: CultureObservation):
         params = {'culture_id': culture_observation.experiment.id,
@@ -307,7 +1329,6 @@ class Database:
         VALUES ($culture_id, $observed_at, $action, $passed)
         ON CONFLICT (culture_id, observed_at) DO UPDATE SET action=excluded.action, passed=excluded.passed"""
         self.cursor.execute(sql, params)
-        self.connection.commit()
 
     def __write_grain_spawn_observation(self, grain_spawn_observation: GrainSpawnObservation):
         params = {'grain_spawn_id': grain_spawn_observation.experiment.id,
@@ -320,7 +1341,6 @@ class Database:
         VALUES ($grain_spawn_id, $observed_at, $action, $passed)
         ON CONFLICT (grain_spawn_id, observed_at) DO UPDATE SET action=excluded.action, passed=excluded.passed"""
         self.cursor.execute(sql, params)
-        self.connection.commit()
 
     def __write_bag_observation(self, bag_observation: BagObservation):
         params = {'bag_id': bag_observation.experiment.id,
@@ -336,22 +1356,397 @@ class Database:
         DO UPDATE SET action=excluded.action, passed=excluded.passed, harvested=excluded.harvested
         """
         self.cursor.execute(sql, params)
-        self.connection.commit()
 
-    def get_culture_by_id(self, ids):
+    def __write_inspection(self, inspection: Inspection):
+        if not self.sparse_observations:
+            self.__write(inspection.observations)
+            return
+
+        # only deviations from "passed, nothing done" get a row of their own, the sweep covers the rest
+        table, id_column, _ = OBSERVATION_TABLES[inspection.experiment_type]
+        deviations, passed = [], []
+        for o in inspection.observations:
+            if not o.passed or o.action or getattr(o, "harvested", None):
+                deviations.append(o)
+            else:
+                passed.append(o)
+
+        sql = """
+        INSERT INTO inspection_sweeps(experiment_type, observed_at, site, room)
+        VALUES ($experiment_type, $observed_at, $site, $room)
+        ON CONFLICT (experiment_type, observed_at, site, room) DO NOTHING"""
+        self.cursor.execute(sql, {"experiment_type": inspection.experiment_type,
+                                  "observed_at": inspection.observed_at,
+                                  "site": inspection.site or "",
+                                  "room": inspection.site and inspection.room or ""})
+        self.__write(deviations)
+
+        sql = f"DELETE FROM {table} WHERE {id_column} = $id AND observed_at = $observed_at"
+        self.cursor.executemany(sql, ({"id": o.experiment.id, "observed_at": inspection.observed_at} for o in passed))
+
+    def __write_cost_entry(self, cost_entry: CostEntry):
+        params = {'booked_at': cost_entry.booked_at,
+                  'category': cost_entry.category,
+                  'amount': cost_entry.amount,
+                  'description': cost_entry.description,
+                  'recipe_id': cost_entry.recipe_id,
+                  'culture_id': cost_entry.culture_id,
+                  'grain_spawn_id': cost_entry.grain_spawn_id,
+                  'bag_id': cost_entry.bag_id,
+                  'batch_type': cost_entry.batch_type,
+                  'batch_created_at': cost_entry.batch_created_at}
+
+        sql = """
+        INSERT INTO cost_entries(booked_at, category, amount, description, recipe_id, culture_id, grain_spawn_id,
+                                 bag_id, batch_type, batch_created_at)
+        VALUES ($booked_at, $category, $amount, $description, $recipe_id, $culture_id, $grain_spawn_id,
+                $bag_id, $batch_type, $batch_created_at)"""
+        self.cursor.execute(sql, params)
+
+    def __write_photo(self, photo: Photo):
+        params = {'experiment_type': photo.experiment_type,
+                  'experiment_id': photo.experiment_id,
+                  'observed_at': photo.observed_at,
+                  'digest': photo.digest,
+                  'extension': photo.extension}
+
+        sql = """
+        INSERT INTO observation_photos(experiment_type, experiment_id, observed_at, digest, extension)
+        VALUES ($experiment_type, $experiment_id, $observed_at, $digest, $extension)
+        ON CONFLICT (experiment_type, experiment_id, observed_at, digest) DO NOTHING"""
+        self.cursor.execute(sql, params)
+
+    def get_photo_counts(self, experiment_type, ids):
+        sql = """
+        SELECT experiment_id, count(*)
+        FROM json_each($ids) ids
+        JOIN observation_photos ON experiment_type = $experiment_type AND experiment_id = ids.value
+        GROUP BY experiment_id"""
+        params = {"experiment_type": experiment_type, "ids": json.dumps(list(ids))}
+        return dict(self.cursor.execute(sql, params).fetchall())
+
+    def get_photos(self, experiment_type, experiment_id):
+        sql = """
+        SELECT experiment_type, experiment_id, observed_at, digest, extension
+        FROM observation_photos
+        WHERE experiment_type = $experiment_type AND experiment_id = $experiment_id
+        ORDER BY observed_at, attached_at"""
+        params = {"experiment_type": experiment_type, "experiment_id": experiment_id}
+        return [Photo(*row) for row in self.cursor.execute(sql, params)]
+
+    def get_observations(self, experiment_type, experiments, observed_at, passed=False):
+        table, id_column, observation_class = OBSERVATION_TABLES[experiment_type]
+        harvested = "harvested" if experiment_type == "bags" else "NULL"
         sql = f"""
-        SELECT 
-            created_at, 
-            culture_id, 
-            mushroom, 
-            variant,
-            medium 
-        FROM cultures
-        WHERE culture_id in ({','.join(['?'] * len(ids))})"""
+        SELECT obs.{id_column}, obs.passed, obs.action, {harvested}
+        FROM json_each($ids) ids
+        JOIN {table} obs ON obs.{id_column} = ids.value AND obs.observed_at = $observed_at"""
+        params = {"ids": json.dumps([e.id for e in experiments]), "observed_at": observed_at}
+        with tracing.phase("query"):
+            recorded = {row[0]: row[1:] for row in self.cursor.execute(sql, params)}
 
-        return {c[1]: Culture(*c) for c in self.cursor.execute(sql, ids)}
+            swept = self.__swept(experiment_type, [e.id for e in experiments], observed_at)
 
-    def get_actions(self):
+        out = []
+        with tracing.phase("hydrate"):
+            for experiment in experiments:
+                default = passed or experiment.id in swept
+                observation = observation_class(experiment, None, default, None)
+                observation.passed, observation.action, harvested = recorded.get(experiment.id, (default, None, None))
+                if experiment_type == "bags":
+                    observation.harvested = harvested
+                # observed_at is assigned after construction, the same way InspectPanel.confirm does it
+                observation.observed_at = observed_at
+                out.append(observation)
+        return out
+
+    def iter_chunks(self, table, column, size):
+        # [lo, hi) ranges of the column over the table and its archived rows, of about `size` rows each; every bound
+        # is one seek and a short walk along the column's index, gaps in the ids make no empty chunks
+        table = self.__history_tables().get(table, table)
+        sql = f"SELECT {column} FROM {table} WHERE {column} >= $lo ORDER BY {column} LIMIT 1 OFFSET $offset"
+        row = self.cursor.execute(sql, {"lo": -sys.maxsize, "offset": 0}).fetchone()
+        while row is not None:
+            lo, = row
+            row = self.cursor.execute(sql, {"lo": lo, "offset": size}).fetchone()
+            if row is None:
+                last, = self.cursor.execute(f"SELECT max({column}) FROM {table}").fetchone()
+                yield lo, last + 1
+            else:
+                # a value repeated over more than `size` rows, the observations of one experiment, is a chunk
+                # of its own
+                hi = max(row[0], lo + 1)
+                yield lo, hi
+                row = self.cursor.execute(sql, {"lo": hi, "offset": 0}).fetchone()
+
+    def get_dangling_references(self, table, lo, hi):
+        # (range value, column, value) of every reference of the rows in [lo, hi) to a row that does not exist
+        tables = self.__history_tables()
+        column, references = CHECKED_REFERENCES[table]
+        selects = [f"""
+        SELECT range_value, '{expression.replace("'", "''")}', value
+        FROM (SELECT {column} AS range_value, {expression} AS value
+              FROM {tables.get(table, table)}
+              WHERE {column} >= $lo AND {column} < $hi) checked
+        WHERE value IS NOT NULL
+          AND NOT EXISTS (SELECT 1
+                          FROM {tables.get(referenced, referenced)} referenced
+                          WHERE referenced.{referenced_column} = checked.value)"""
+                   for expression, referenced, referenced_column in references]
+        return self.cursor.execute(" UNION ALL ".join(selects), {"lo": lo, "hi": hi}).fetchall()
+
+    def get_late_observations(self, experiment_type, lo, hi):
+        # (id, name, closed, observations, last observed) of the experiments in [lo, hi) observed after the day
+        # they were used up, harvested or destroyed
+        table, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        tables = self.__history_tables()
+        sql = f"""
+        WITH
+
+        observations AS (
+            SELECT {id_column} AS id, date(observed_at) AS day, action
+            FROM {tables[table]}
+            WHERE {id_column} >= $lo AND {id_column} < $hi),
+
+        closings AS (
+            SELECT id, min(day) AS closed
+            FROM observations
+            WHERE action IN ({", ".join(f"'{action}'" for action in FINAL_ACTIONS[experiment_type])})
+            GROUP BY id)
+
+        SELECT
+            id,
+            (SELECT name FROM {tables[experiment_type]} WHERE {id_column} = id),
+            closed,
+            count(*),
+            max(day)
+        FROM closings
+        JOIN observations USING (id)
+        WHERE day > closed
+        GROUP BY id
+        ORDER BY id"""
+        return self.cursor.execute(sql, {"lo": lo, "hi": hi}).fetchall()
+
+    def get_name_issues(self, experiment_type, lo, hi):
+        # (id, name, problem) of the experiments in [lo, hi) whose name is not the date they were created on and
+        # their number of that day, is taken twice, or whose number came before the one of an earlier experiment
+        # of the same day or skipped one; names are only looked up through their unique indexes
+        _, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        table = self.__history_tables()[experiment_type]
+        sql = f"""
+        WITH
+
+        named AS (
+            SELECT
+                {id_column} AS id,
+                name,
+                strftime('%Y%m%d', created_at) || $code AS prefix,
+                CAST(substr(name, length($code) + 9) AS INTEGER) AS number
+            FROM {table}
+            WHERE {id_column} >= $lo AND {id_column} < $hi),
+
+        previous AS (
+            SELECT
+                named.*,
+                (SELECT {id_column}
+                 FROM {table}
+                 WHERE name = prefix || printf('%03d', number - 1)
+                 ORDER BY {id_column}
+                 LIMIT 1) AS previous_id
+            FROM named)
+
+        SELECT
+            id,
+            name,
+            CASE
+                WHEN name <> prefix || printf('%03d', number) THEN 'does not match its creation date'
+                WHEN EXISTS (SELECT 1 FROM {table} WHERE name = previous.name AND {id_column} <> id) THEN 'duplicate'
+                WHEN number > 1 AND previous_id IS NULL THEN 'follows a gap'
+                WHEN previous_id > id THEN 'numbered before an earlier experiment'
+            END AS problem
+        FROM previous
+        WHERE problem IS NOT NULL
+        ORDER BY id"""
+        return self.cursor.execute(sql, {"code": NAME_CODES[experiment_type], "lo": lo, "hi": hi}).fetchall()
+
+    def get_action_counts(self, experiment_type, lo, hi):
+        # (action, observations, first id) of the observations of the experiments in [lo, hi)
+        table, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        sql = f"""
+        SELECT action, count(*), min({id_column})
+        FROM {self.__history_tables()[table]}
+        WHERE {id_column} >= $lo AND {id_column} < $hi
+        GROUP BY action"""
+        return self.cursor.execute(sql, {"lo": lo, "hi": hi}).fetchall()
+
+    def get_allowed_actions(self, experiment_type):
+        # the actions the CHECK constraint of the observation table admits, None without one
+        table, _, _ = OBSERVATION_TABLES[experiment_type]
+        sql, = self.cursor.execute("SELECT sql FROM main.sqlite_master WHERE name = $table",
+                                   {"table": table}).fetchone()
+        match = re.search(r"action in \(([^)]*)\)", sql, re.IGNORECASE)
+        if match is None:
+            return None
+        return tuple(re.findall(r"'([^']*)'", match.group(1)))
+
+    def get_unit_economics(self, by="strain"):
+        # (label, cost, bags, harvested, cost per bag, cost per kg) from the rollups the triggers keep current
+        if by == "strain":
+            sql = """
+            SELECT
+                trim(mushroom || ' ' || variant),
+                cost,
+                n_bags,
+                harvested
+            FROM strain_economics
+            ORDER BY mushroom, variant"""
+        elif by == "recipe":
+            # a grain spawn's costs, with its share of the culture's, are split evenly over its bags
+            sql = """
+            WITH
+
+            spawn_costs AS (
+                SELECT
+                    g.experiment_id AS grain_spawn_id,
+                    (g.direct_cost + coalesce(c.direct_cost / nullif(c.n_children, 0), 0))
+                        / nullif(g.n_children, 0) AS cost_per_bag
+                FROM experiment_costs g
+                LEFT JOIN experiment_costs c ON c.experiment_type = 'cultures' AND c.experiment_id = g.parent_id
+                WHERE g.experiment_type = 'grain_spawn'),
+
+            allocated_costs AS (
+                SELECT
+                    recipe_id,
+                    total(n_bags * cost_per_bag) AS cost
+                FROM spawn_recipe_bags
+                JOIN spawn_costs USING (grain_spawn_id)
+                GROUP BY recipe_id)
+
+            SELECT
+                recipes.name,
+                economics.direct_cost + coalesce(allocated_costs.cost, 0),
+                economics.n_bags,
+                economics.harvested
+            FROM recipe_economics economics
+            JOIN recipes USING (recipe_id)
+            LEFT JOIN allocated_costs USING (recipe_id)
+            ORDER BY recipes.name"""
+        else:
+            raise ValueError(f"Unknown dimension {by}")
+
+        return [(label, cost, n_bags, harvested, cost / n_bags if n_bags else None,
+                 cost / harvested if harvested else None)
+                for label, cost, n_bags, harvested in self.cursor.execute(sql)]
+
+    def get_schedule_rules(self):
+        sql = """
+        SELECT rule_id, experiment_type, recipe_id, action, start_after, repeat_every, window
+        FROM schedule_rules
+        ORDER BY rule_id"""
+        return self.cursor.execute(sql).fetchall()
+
+    def get_last_observations(self, experiment_type, ids):
+        # {(id, action): date of the last observation with that action}, any observation counts as 'Inspect'
+        table, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        sql = f"""
+        SELECT obs.{id_column}, coalesce(obs.action, 'Inspect'), max(date(obs.observed_at))
+        FROM json_each($ids) ids
+        JOIN {table} obs ON obs.{id_column} = ids.value
+        GROUP BY 1, 2"""
+        last = {}
+        for id_, action, observed_at in self.cursor.execute(sql, {"ids": json.dumps(list(ids))}):
+            last[(id_, action)] = observed_at
+            last[(id_, "Inspect")] = max(last.get((id_, "Inspect"), observed_at), observed_at)
+
+        # in sparse mode the passed inspections only left a sweep behind
+        for id_, swept in self.__swept(experiment_type, ids).items():
+            last[(id_, "Inspect")] = max(last.get((id_, "Inspect"), swept[:10]), swept[:10])
+        return last
+
+    def __swept(self, experiment_type, ids, observed_at=None):
+        # {id: the last sweep that covered it}, only counting the sweeps of observed_at if given; a sweep covers
+        # the experiments of its site, or of its room of the site, and every experiment without a site
+        sql = """
+        SELECT site, room, max(observed_at)
+        FROM inspection_sweeps
+        WHERE experiment_type = $experiment_type AND ($observed_at IS NULL OR observed_at = $observed_at)
+        GROUP BY site, room"""
+        sweeps = self.cursor.execute(sql, {"experiment_type": experiment_type, "observed_at": observed_at}).fetchall()
+        everywhere = max((last for site, _, last in sweeps if not site), default=None)
+        swept = {id_: everywhere for id_ in ids} if everywhere else {}
+        if all(not site for site, _, _ in sweeps):
+            return swept
+
+        _, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        sql = f"""
+        SELECT ids.value, locations.site, locations.room
+        FROM json_each($ids) ids
+        JOIN {experiment_type} e ON e.{id_column} = ids.value
+        JOIN locations ON locations.location_id = e.location_id"""
+        for id_, site, room in self.cursor.execute(sql, {"ids": json.dumps(list(ids))}).fetchall():
+            for sweep_site, sweep_room, last in sweeps:
+                if sweep_site == site and sweep_room in ("", room) and last > swept.get(id_, ""):
+                    swept[id_] = last
+        return swept
+
+    def get_failed_ids(self, experiment_type, ids, observed_at):
+        # the experiments among ids that failed an inspection up to observed_at; observations may carry a time of
+        # day, so the day itself is included up to its end
+        table, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        sql = f"""
+        SELECT DISTINCT obs.{id_column}
+        FROM json_each($ids) ids
+        JOIN {table} obs ON obs.{id_column} = ids.value
+        WHERE obs.passed = 0 AND obs.observed_at < date($observed_at, '+1 day')"""
+        params = {"ids": json.dumps(list(ids)), "observed_at": observed_at}
+        return [id_ for id_, in self.cursor.execute(sql, params)]
+
+    def get_ids_by_name(self, experiment_type, names):
+        _, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        sql = f"""
+        SELECT name, {id_column}
+        FROM json_each($names) names
+        JOIN {experiment_type} ON {experiment_type}.name = names.value"""
+        return dict(self.cursor.execute(sql, {"names": json.dumps(list(names))}).fetchall())
+
+    def iter_by_id(self, table, ids):
+        # every chunk runs the same statement with LOOKUP_CHUNK_SIZE placeholders, padded with NULLs, so it is
+        # compiled once and stays far below SQLite's variable limit however many ids are looked up
+        sql, factory = BULK_LOOKUPS[table]
+        factory = self.__hydrator(factory)
+        sql = sql.format(ids=", ".join(["?"] * LOOKUP_CHUNK_SIZE))
+        cursor = self.connection.cursor()
+        ids = list(dict.fromkeys(ids))
+        for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+            chunk = ids[start:start + LOOKUP_CHUNK_SIZE]
+            with tracing.phase("query"):
+                rows = cursor.execute(sql, chunk + [None] * (LOOKUP_CHUNK_SIZE - len(chunk))).fetchall()
+            with tracing.phase("hydrate"):
+                records = [factory(*row) for row in rows]
+            yield from records
+
+    def get_by_id(self, table, ids):
+        return {r.id: r for r in self.iter_by_id(table, ids)}
+
+    def get_cultures_by_id(self, ids):
+        return self.get_by_id("cultures", ids)
+
+    def get_grain_spawn_by_id(self, ids):
+        return self.get_by_id("grain_spawn", ids)
+
+    def get_bags_by_id(self, ids):
+        return self.get_by_id("bags", ids)
+
+    def get_recipes_by_id(self, ids):
+        return self.get_by_id("recipes", ids)
+
+    def iter_culture_by_id(self, ids):
+        return self.iter_by_id("cultures", ids)
+
+    def get_culture_by_id(self, ids):
+        return self.get_cultures_by_id(ids)
+
+    def iter_actions(self, after_date=None, size=500):
         sql = """
         WITH
         
@@ -361,7 +1756,7 @@ class Database:
                 'Created' AS action,
                 'Bags Created' AS event,
                 count(*) AS n_events
-            FROM bags
+            FROM {bags}
             WHERE event IS NOT NULL
             GROUP BY 1, 2, 3
         ),
@@ -372,7 +1767,7 @@ class Database:
                 action,
                 'Bags ' || action as event,
                 count(*) AS n_events
-            FROM bag_observations
+            FROM {bag_observations}
             WHERE event IS NOT NULL
             GROUP BY 1, 2, 3
         ),
@@ -383,7 +1778,7 @@ class Database:
                 'Created' AS action,
                 'Grain Spawn Created' AS event,
                 count(*) AS n_events
-            FROM grain_spawn
+            FROM {grain_spawn}
             WHERE event IS NOT NULL
             GROUP BY 1, 2, 3
         ),
@@ -394,7 +1789,7 @@ class Database:
                 action,
                 'Grain Spawn ' || action as event,
                 count(*)
-            FROM grain_spawn_observations
+            FROM {grain_spawn_observations}
             WHERE event IS NOT NULL
             GROUP BY 1, 2, 3
         ),
@@ -405,7 +1800,7 @@ class Database:
                 'Created' AS action,
                 'Cultures Created' AS event,
                 count(*) AS n_events
-            FROM cultures
+            FROM {cultures}
             WHERE event IS NOT NULL
             GROUP BY 1, 2, 3
         ),
@@ -416,7 +1811,7 @@ class Database:
                 action,
                 'Culture ' || action AS event,
                 count(*) as n_events
-            FROM culture_observations
+            FROM {culture_observations}
             WHERE event IS NOT NULL
             GROUP BY 1, 2, 3
         )
@@ -433,6 +1828,7 @@ class Database:
             SELECT * FROM grain_spawn_observation_actions UNION ALL
             SELECT * FROM culture_actions UNION ALL
             SELECT * FROM culture_observation_actions)
+        WHERE $after_date IS NULL OR "date" > $after_date
         ORDER BY "date", CASE action 
             WHEN 'Created' THEN 0              
             WHEN 'Harvested' THEN 1
@@ -440,8 +1836,598 @@ class Database:
             WHEN 'Kneaded' THEN 3 
             WHEN 'Shaken' THEN 4
             WHEN 'Destroyed' THEN 5 END
-        """
-        return [(date, f"{n_events} {event}", action) for (date, action, event, n_events) in self.cursor.execute(sql)]
+        """.format(**self.__history_tables(after_date))
+        return self.__iter_query(sql, {"after_date": after_date},
+                                 lambda date, action, event, n_events: (date, f"{n_events} {event}", action), size)
+
+    def get_actions(self):
+        return list(self.iter_actions())
+
+    def get_changes(self, after_seq=0, limit=1000):
+        sql = """
+        SELECT seq, table_name, operation, row_data
+        FROM change_log
+        WHERE seq > $after_seq
+        ORDER BY seq
+        LIMIT $limit"""
+        return self.cursor.execute(sql, {"after_seq": after_seq, "limit": limit}).fetchall()
+
+    def refresh_bi_tables(self):
+        # only bags touched since the watermark are recomputed; the first refresh covers everything, archives
+        # included, because the change log does not reach back to the beginning of the lab book
+        seq = self.cursor.execute("SELECT seq FROM bi_state WHERE name = 'change_log'").fetchone()
+        last_seq, = self.cursor.execute("SELECT coalesce(max(seq), 0) FROM change_log").fetchone()
+        sources = self.__history_tables() if seq is None else {table: f"main.{table}" for table in ARCHIVE_TABLES}
+
+        statements = ["""
+        CREATE TEMP TABLE IF NOT EXISTS bi_affected(
+            bag_id INTEGER PRIMARY KEY)""",
+                      "DELETE FROM temp.bi_affected"]
+        if seq is None:
+            statements.append("INSERT INTO temp.bi_affected SELECT bag_id FROM {bags}")
+        else:
+            statements += ["""
+        INSERT OR IGNORE INTO temp.bi_affected
+        SELECT json_extract(row_data, '$.bag_id')
+        FROM change_log
+        WHERE seq > $seq AND seq <= $last_seq AND table_name in ('bags', 'bag_observations')""",
+                           """
+        INSERT OR IGNORE INTO temp.bi_affected
+        SELECT bag_id
+        FROM {bags}
+        WHERE grain_spawn_id IN (SELECT json_extract(row_data, '$.grain_spawn_id')
+                                 FROM change_log
+                                 WHERE seq > $seq AND seq <= $last_seq AND table_name = 'grain_spawn'
+                                 UNION
+                                 SELECT grain_spawn_id
+                                 FROM {grain_spawn}
+                                 WHERE culture_id IN (SELECT json_extract(row_data, '$.culture_id')
+                                                      FROM change_log
+                                                      WHERE seq > $seq AND seq <= $last_seq
+                                                        AND table_name = 'cultures'))""",
+                           # archived bags keep the facts they had when they were moved out
+                           "DELETE FROM temp.bi_affected WHERE bag_id NOT IN (SELECT bag_id FROM {bags})"]
+
+        statements += ["""
+        INSERT INTO dim_recipe(recipe_key, name, recipe_type)
+        SELECT recipe_id, name, recipe_type FROM recipes WHERE true
+        ON CONFLICT (recipe_key) DO UPDATE SET name = excluded.name, recipe_type = excluded.recipe_type""",
+                       """
+        INSERT OR IGNORE INTO dim_strain(mushroom, variant)
+        SELECT DISTINCT coalesce(cultures.mushroom, ''), coalesce(cultures.variant, '')
+        FROM temp.bi_affected
+        JOIN {bags} bags USING (bag_id)
+        LEFT JOIN {grain_spawn} grain_spawn USING (grain_spawn_id)
+        LEFT JOIN {cultures} cultures USING (culture_id)""",
+                       "DELETE FROM fact_flushes WHERE bag_id IN (SELECT bag_id FROM temp.bi_affected)",
+                       "DELETE FROM fact_bags WHERE bag_id IN (SELECT bag_id FROM temp.bi_affected)",
+                       """
+        INSERT INTO fact_bags
+        WITH
+
+        observations AS (
+            SELECT
+                bag_id,
+                max(action = 'Destroyed') AS destroyed,
+                max(action = 'Harvested') AS closed,
+                min(CASE WHEN action in ('Harvested', 'Destroyed') THEN date(observed_at) END) AS ended_date,
+                sum(passed = 0) AS n_failed,
+                sum(harvested > 0) AS n_flushes,
+                total(harvested) AS harvested,
+                min(CASE WHEN harvested > 0 THEN date(observed_at) END) AS first_flush
+            FROM {bag_observations}
+            WHERE bag_id IN (SELECT bag_id FROM temp.bi_affected)
+            GROUP BY bag_id)
+
+        SELECT
+            bags.bag_id,
+            dim_strain.strain_key,
+            bags.recipe_id,
+            grain_spawn.recipe_id,
+            date(bags.created_at),
+            observations.ended_date,
+            CASE WHEN observations.destroyed THEN 'Destroyed' WHEN observations.closed THEN 'Harvested'
+                 ELSE 'Open' END,
+            coalesce(observations.n_failed, 0),
+            coalesce(observations.n_flushes, 0),
+            coalesce(observations.harvested, 0),
+            CAST(julianday(observations.first_flush) - julianday(date(bags.created_at)) AS INTEGER)
+        FROM temp.bi_affected
+        JOIN {bags} bags USING (bag_id)
+        LEFT JOIN {grain_spawn} grain_spawn USING (grain_spawn_id)
+        LEFT JOIN {cultures} cultures USING (culture_id)
+        LEFT JOIN dim_strain
+               ON dim_strain.mushroom = coalesce(cultures.mushroom, '')
+              AND dim_strain.variant = coalesce(cultures.variant, '')
+        LEFT JOIN observations USING (bag_id)""",
+                       """
+        INSERT INTO fact_flushes
+        SELECT
+            obs.bag_id,
+            date(obs.observed_at),
+            row_number() OVER (PARTITION BY obs.bag_id ORDER BY obs.observed_at),
+            fact_bags.strain_key,
+            fact_bags.recipe_key,
+            obs.harvested
+        FROM {bag_observations} obs
+        JOIN fact_bags USING (bag_id)
+        WHERE obs.bag_id IN (SELECT bag_id FROM temp.bi_affected) AND obs.harvested > 0""",
+                       """
+        INSERT OR IGNORE INTO dim_date(date_key, year, month, week, weekday)
+        SELECT DISTINCT date_key,
+               CAST(strftime('%Y', date_key) AS INTEGER),
+               strftime('%Y-%m', date_key),
+               strftime('%Y-W%W', date_key),
+               CAST(strftime('%w', date_key) AS INTEGER)
+        FROM (SELECT created_date AS date_key FROM fact_bags
+              WHERE bag_id IN (SELECT bag_id FROM temp.bi_affected)
+              UNION ALL
+              SELECT ended_date FROM fact_bags
+              WHERE bag_id IN (SELECT bag_id FROM temp.bi_affected)
+              UNION ALL
+              SELECT harvested_date FROM fact_flushes
+              WHERE bag_id IN (SELECT bag_id FROM temp.bi_affected))
+        WHERE date_key IS NOT NULL""",
+                       """
+        INSERT INTO bi_state(name, seq) VALUES ('change_log', $last_seq)
+        ON CONFLICT (name) DO UPDATE SET seq = excluded.seq"""]
+
+        try:
+            for statement in statements:
+                self.cursor.execute(statement.format(**sources), {"seq": seq[0] if seq else 0, "last_seq": last_seq})
+            n, = self.cursor.execute("SELECT count(*) FROM temp.bi_affected").fetchone()
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+        return n
+
+    def get_bi_summary(self, by="strain"):
+        # (label, bags, harvested bags, destroyed bags, bags with failed inspections, flushes, yield, yield per bag)
+        labels = {
+            "strain": ("trim(dim_strain.mushroom || ' ' || dim_strain.variant)",
+                       "LEFT JOIN dim_strain USING (strain_key)"),
+            "recipe": ("dim_recipe.name", "LEFT JOIN dim_recipe USING (recipe_key)"),
+            "month": ("dim_date.month", "LEFT JOIN dim_date ON dim_date.date_key = fact_bags.created_date"),
+        }
+        if by not in labels:
+            raise ValueError(f"Unknown dimension {by}")
+        label, join = labels[by]
+        sql = f"""
+        SELECT
+            {label} AS label,
+            count(*),
+            sum(outcome = 'Harvested'),
+            sum(outcome = 'Destroyed'),
+            sum(n_failed > 0),
+            sum(n_flushes),
+            total(harvested),
+            total(harvested) / count(*)
+        FROM fact_bags
+        {join}
+        GROUP BY label
+        ORDER BY label"""
+        return self.cursor.execute(sql).fetchall()
+
+    def get_report_section(self, section, start, end):
+        sql = REPORT_SECTIONS[section].format(**self.__history_tables(start))
+        return self.cursor.execute(sql, {"start": start, "end": end}).fetchall()
+
+    def get_change_watermarks(self):
+        # {(table, month): seq of the last change to a row of the table dated in that month}; month is None for the
+        # deletes, which only carry the row's key. Rows are dated by when they were observed, booked or created
+        sql = """
+        SELECT
+            table_name,
+            substr(coalesce(json_extract(row_data, '$.observed_at'), json_extract(row_data, '$.booked_at'),
+                            json_extract(row_data, '$.created_at')), 1, 7),
+            max(seq)
+        FROM change_log
+        GROUP BY 1, 2"""
+        return {(table, month): seq for table, month, seq in self.cursor.execute(sql)}
+
+    def get_generation(self):
+        # grows with every recorded write, so anything derived from the data can be cached against it
+        generation, = self.cursor.execute("SELECT coalesce(max(seq), 0) FROM change_log").fetchone()
+        return generation
+
+    def get_lifetimes(self, experiment_type, group_by, as_of):
+        # (group, created, failed, censored) in julian days per experiment: the first failed inspection or
+        # destruction is the failure, otherwise the experiment is censored when it was used up, or at as_of
+        table, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        tables = self.__history_tables()
+        joins = {
+            "bags": """
+            LEFT JOIN {grain_spawn} grain_spawn USING (grain_spawn_id)
+            LEFT JOIN {cultures} cultures ON cultures.culture_id = grain_spawn.culture_id
+            LEFT JOIN recipes ON recipes.recipe_id = experiments.recipe_id""",
+            "grain_spawn": """
+            LEFT JOIN {cultures} cultures USING (culture_id)
+            LEFT JOIN recipes ON recipes.recipe_id = experiments.recipe_id""",
+            "cultures": """
+            JOIN {cultures} cultures USING (culture_id)""",
+        }
+        sql = f"""
+        WITH
+
+        observations AS (
+            SELECT
+                {id_column},
+                min(CASE WHEN passed = 0 OR action = 'Destroyed' THEN julianday(date(observed_at)) END) AS failed,
+                min(CASE WHEN action = $closing_action THEN julianday(date(observed_at)) END) AS closed
+            FROM {tables[table]}
+            GROUP BY {id_column})
+
+        SELECT
+            coalesce({LIFETIME_GROUPS[experiment_type][group_by]}, '') AS label,
+            julianday(date(experiments.created_at)),
+            observations.failed,
+            coalesce(observations.closed, julianday($as_of))
+        FROM {tables[experiment_type]} experiments
+        {joins[experiment_type].format(**tables)}
+        LEFT JOIN observations USING ({id_column})
+        WHERE date(experiments.created_at) <= $as_of"""
+        params = {"closing_action": CLOSING_ACTIONS[experiment_type], "as_of": as_of}
+        return self.cursor.execute(sql, params).fetchall()
+
+    def get_labels(self, experiment_type, first=None, last=None, names=None):
+        # (name, created, strain, recipe) of the experiments with the given names or created from first to last,
+        # for their labels; the cultures have their medium where the others have a recipe
+        _, id_column, _ = OBSERVATION_TABLES[experiment_type]
+        tables = self.__history_tables(first)
+        joins = {
+            "bags": """
+            LEFT JOIN {grain_spawn} grain_spawn USING (grain_spawn_id)
+            LEFT JOIN {cultures} cultures ON cultures.culture_id = grain_spawn.culture_id
+            LEFT JOIN recipes ON recipes.recipe_id = experiments.recipe_id""",
+            "grain_spawn": """
+            LEFT JOIN {cultures} cultures USING (culture_id)
+            LEFT JOIN recipes ON recipes.recipe_id = experiments.recipe_id""",
+            "cultures": """
+            JOIN {cultures} cultures USING (culture_id)""",
+        }
+        group = "cultures.medium" if experiment_type == "cultures" else "recipes.name"
+        sql = f"""
+        SELECT
+            experiments.name,
+            date(experiments.created_at),
+            trim(coalesce(cultures.mushroom, '') || ' ' || coalesce(cultures.variant, '')),
+            coalesce({group}, '')
+        FROM {tables[experiment_type]} experiments
+        {joins[experiment_type].format(**tables)}
+        WHERE ($names IS NULL OR experiments.name IN (SELECT value FROM json_each($names)))
+          AND ($first IS NULL OR date(experiments.created_at) >= $first)
+          AND ($last IS NULL OR date(experiments.created_at) <= $last)
+        ORDER BY experiments.{id_column}"""
+        params = {"names": None if names is None else json.dumps(list(names)), "first": first, "last": last}
+        return self.cursor.execute(sql, params).fetchall()
+
+    def get_bag_history(self):
+        # (bag, created, closed, mushroom, variant, recipe) of every bag, archived ones included, the dates in
+        # julian days; closed is NULL while the bag is alive
+        sql = """
+        WITH
+
+        closings AS (
+            SELECT bag_id, min(julianday(date(observed_at))) AS closed
+            FROM {bag_observations}
+            WHERE action in ('Harvested', 'Destroyed')
+            GROUP BY bag_id)
+
+        SELECT
+            bags.bag_id,
+            julianday(date(bags.created_at)),
+            closings.closed,
+            coalesce(cultures.mushroom, ''),
+            coalesce(cultures.variant, ''),
+            bags.recipe_id
+        FROM {bags} bags
+        LEFT JOIN {grain_spawn} grain_spawn USING (grain_spawn_id)
+        LEFT JOIN {cultures} cultures USING (culture_id)
+        LEFT JOIN closings USING (bag_id)""".format(**self.__history_tables())
+        return self.cursor.execute(sql).fetchall()
+
+    def get_harvests(self):
+        # (bag, observed, harvested) of every flush, the day in julian days
+        sql = """
+        SELECT bag_id, julianday(date(observed_at)), harvested
+        FROM {bag_observations}
+        WHERE harvested > 0""".format(**self.__history_tables())
+        return self.cursor.execute(sql).fetchall()
+
+    def archive_path(self, year):
+        name, extension = os.path.splitext(os.path.basename(self.database_path))
+        return os.path.join(self.archive_directory, f"{name}-{year}{extension}")
+
+    def attach_archive(self, year):
+        if year in self.attached_years:
+            return
+        path = self.archive_path(year)
+        if self.read_only and not os.path.exists(path):
+            # a reader can neither create the archive nor write to it; the writer creates it on its next attach
+            return
+        if self.connection.in_transaction:
+            # SQLite only attaches outside of a transaction, and ending the caller's would commit its pending writes
+            raise sqlite3.OperationalError(f"archive_{year} cannot be attached within a transaction")
+        if not self.read_only:
+            os.makedirs(self.archive_directory, exist_ok=True)
+        self.cursor.execute(f"ATTACH DATABASE $path AS archive_{year}", {"path": path})
+
+        if not self.read_only:
+            # creating and migrating the archive is left to the writer
+            for table in ARCHIVE_TABLES:
+                sql, = self.cursor.execute("SELECT sql FROM main.sqlite_master WHERE name = $table",
+                                           {"table": table}).fetchone()
+                sql = sql.replace(f"CREATE TABLE {table}", f"CREATE TABLE IF NOT EXISTS archive_{year}.{table}", 1)
+                self.cursor.execute(sql)
+
+                # archives created before a column was added to the hot table get it too, the history views and
+                # the archival copy rows by position
+                columns = self.cursor.execute(f"PRAGMA main.table_info({table})").fetchall()
+                archived = {name for _, name, *_ in self.cursor.execute(f"PRAGMA archive_{year}.table_info({table})")}
+                for _, name, column_type, _, _, _ in columns:
+                    if name not in archived:
+                        self.cursor.execute(f"ALTER TABLE archive_{year}.{table} ADD COLUMN {name} {column_type}")
+        self.attached_years.add(year)
+
+        # the history views span the hot tables and every attached archive; they are temporary, so query-only
+        # connections may create them too
+        query_only, = self.cursor.execute("PRAGMA query_only").fetchone()
+        self.cursor.execute("PRAGMA query_only = 0")
+        try:
+            for table in ARCHIVE_TABLES:
+                sources = [f"main.{table}"] + [f"archive_{y}.{table}" for y in sorted(self.attached_years)]
+                self.cursor.execute(f"DROP VIEW IF EXISTS temp.history_{table}")
+                self.cursor.execute(f"CREATE TEMP VIEW history_{table} AS " +
+                                    " UNION ALL ".join(f"SELECT * FROM {source}" for source in sources))
+            self.connection.commit()
+        finally:
+            self.cursor.execute(f"PRAGMA query_only = {query_only}")
+
+    def __history_tables(self, date=None):
+        # queries only need the archives if they reach back to before the last archived experiment was closed,
+        # and then only the archives of the years from `date` on
+        sql = """
+        SELECT year
+        FROM archives
+        WHERE ($date IS NULL OR archived_until >= $date)
+          AND ($date IS NULL OR year >= CAST(substr($date, 1, 4) AS INTEGER))"""
+        years = [year for year, in self.cursor.execute(sql, {"date": date})]
+        for year in years:
+            self.attach_archive(year)
+
+        if self.attached_years.intersection(years):
+            return {table: f"temp.history_{table}" for table in ARCHIVE_TABLES}
+        return {table: f"main.{table}" for table in ARCHIVE_TABLES}
+
+    def archive_closed_experiments(self, cutoff):
+        # bags closed before the cutoff; grain spawn and cultures once they and all their children are closed
+        statements = ["""
+        CREATE TEMP TABLE IF NOT EXISTS archive_candidates(
+            table_name TEXT,
+            id INTEGER,
+            closed_at DATETIME,
+            PRIMARY KEY (table_name, id))""",
+                      "DELETE FROM temp.archive_candidates",
+                      """
+        INSERT INTO temp.archive_candidates
+        SELECT 'bags', bag_id, max(observed_at)
+        FROM main.bag_observations
+        GROUP BY bag_id
+        HAVING max(action in ('Harvested', 'Destroyed')) = 1 AND max(observed_at) < $cutoff""",
+                      """
+        INSERT INTO temp.archive_candidates
+        SELECT 'grain_spawn', grain_spawn_id, max(observed_at)
+        FROM main.grain_spawn_observations obs
+        GROUP BY grain_spawn_id
+        HAVING max(action in ('Used', 'Destroyed')) = 1 AND max(observed_at) < $cutoff
+           AND NOT EXISTS(SELECT 1
+                          FROM main.bags
+                          WHERE bags.grain_spawn_id = obs.grain_spawn_id
+                            AND bags.bag_id NOT IN (SELECT id FROM temp.archive_candidates
+                                                    WHERE table_name = 'bags'))""",
+                      """
+        INSERT INTO temp.archive_candidates
+        SELECT 'cultures', culture_id, max(observed_at)
+        FROM main.culture_observations obs
+        GROUP BY culture_id
+        HAVING max(action = 'Destroyed') = 1 AND max(observed_at) < $cutoff
+           AND NOT EXISTS(SELECT 1
+                          FROM main.grain_spawn
+                          WHERE grain_spawn.culture_id = obs.culture_id
+                            AND grain_spawn.grain_spawn_id NOT IN (SELECT id FROM temp.archive_candidates
+                                                                   WHERE table_name = 'grain_spawn'))"""]
+        for statement in statements:
+            self.cursor.execute(statement, {"cutoff": cutoff} if "$cutoff" in statement else {})
+        self.connection.commit()
+
+        sql = """
+        SELECT CAST(substr(closed_at, 1, 4) AS INTEGER) AS year, max(closed_at), count(*)
+        FROM temp.archive_candidates
+        GROUP BY 1"""
+        years = self.cursor.execute(sql).fetchall()
+        for year, _, _ in years:
+            self.attach_archive(year)
+
+        try:
+            for year, archived_until, _ in years:
+                for table, (experiment_table, id_column) in ARCHIVE_TABLES.items():
+                    sql = f"""
+                    INSERT OR IGNORE INTO archive_{year}.{table}
+                    SELECT * FROM main.{table}
+                    WHERE {id_column} IN (SELECT id
+                                          FROM temp.archive_candidates
+                                          WHERE table_name = '{experiment_table}'
+                                            AND substr(closed_at, 1, 4) = '{year}')"""
+                    self.cursor.execute(sql)
+
+                sql = """
+                INSERT INTO archives(year, archived_until) VALUES ($year, $archived_until)
+                ON CONFLICT (year) DO UPDATE SET archived_until = max(archived_until, excluded.archived_until)"""
+                self.cursor.execute(sql, {"year": year, "archived_until": archived_until})
+
+            for table, (experiment_table, id_column) in ARCHIVE_TABLES.items():
+                sql = f"""
+                DELETE FROM main.{table}
+                WHERE {id_column} IN (SELECT id
+                                      FROM temp.archive_candidates
+                                      WHERE table_name = '{experiment_table}')"""
+                self.cursor.execute(sql)
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+        return {year: n for year, _, n in years}
+
+    def write_sensor_readings(self, readings):
+        # readings are staged, so re-delivered ones are dropped before they are counted into the rollups
+        sql = """
+        CREATE TEMP TABLE IF NOT EXISTS sensor_batch(
+            location TEXT NOT NULL,
+            measured_at DATETIME NOT NULL,
+            temperature FLOAT,
+            humidity FLOAT,
+            co2 FLOAT,
+            PRIMARY KEY (location, measured_at))"""
+        self.cursor.execute(sql)
+        try:
+            sql = """
+            INSERT OR IGNORE INTO temp.sensor_batch(location, measured_at, temperature, humidity, co2)
+            VALUES (?, ?, ?, ?, ?)"""
+            self.cursor.executemany(sql, ((r.location, r.measured_at, r.temperature, r.humidity, r.co2)
+                                          if isinstance(r, SensorReading) else r for r in readings))
+            sql = """
+            DELETE FROM temp.sensor_batch
+            WHERE EXISTS(SELECT 1
+                         FROM sensor_readings r
+                         WHERE r.location = sensor_batch.location
+                           AND r.measured_at = sensor_batch.measured_at)"""
+            self.cursor.execute(sql)
+            self.cursor.execute("INSERT INTO sensor_readings SELECT * FROM temp.sensor_batch")
+
+            for resolution, bucket in SENSOR_RESOLUTIONS.items():
+                columns = ", ".join(f"{m}_n, {m}_sum, {m}_min, {m}_max" for m in SENSOR_METRICS)
+                aggregates = ", ".join(f"count({m}), total({m}), min({m}), max({m})" for m in SENSOR_METRICS)
+                updates = ", ".join(f"{m}_n = {m}_n + excluded.{m}_n, "
+                                    f"{m}_sum = {m}_sum + excluded.{m}_sum, "
+                                    f"{m}_min = min(coalesce({m}_min, excluded.{m}_min), "
+                                    f"coalesce(excluded.{m}_min, {m}_min)), "
+                                    f"{m}_max = max(coalesce({m}_max, excluded.{m}_max), "
+                                    f"coalesce(excluded.{m}_max, {m}_max))"
+                                    for m in SENSOR_METRICS)
+                sql = f"""
+                INSERT INTO sensor_rollups(resolution, location, bucket, {columns})
+                SELECT '{resolution}', location, strftime('{bucket}', measured_at), {aggregates}
+                FROM temp.sensor_batch
+                GROUP BY location, strftime('{bucket}', measured_at)
+                ON CONFLICT (resolution, location, bucket) DO UPDATE SET {updates}"""
+                self.cursor.execute(sql)
+
+            self.cursor.execute("DELETE FROM temp.sensor_batch")
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+
+    def get_sensor_series(self, location, start, end, resolution=None):
+        # the coarsest rollup that still gives a useful number of points, raw readings for short ranges
+        if resolution is None:
+            days = (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds() / 86400
+            resolution = "raw" if days <= 0.25 else "minute" if days <= 2 else "hour" if days <= 90 else "day"
+
+        if resolution == "raw":
+            sql = """
+            SELECT measured_at, temperature, humidity, co2
+            FROM sensor_readings
+            WHERE location = $location AND measured_at >= $start AND measured_at < $end
+            ORDER BY measured_at"""
+        else:
+            averages = ", ".join(f"{m}_sum / nullif({m}_n, 0)" for m in SENSOR_METRICS)
+            sql = f"""
+            SELECT bucket, {averages}
+            FROM sensor_rollups
+            WHERE resolution = $resolution AND location = $location AND bucket >= $start AND bucket < $end
+            ORDER BY bucket"""
+        params = {"resolution": resolution, "location": location, "start": start, "end": end}
+        return self.cursor.execute(sql, params).fetchall()
+
+    def get_bag_conditions(self, location, bag_ids):
+        # daily rollups over each bag's lifetime, from its creation up to its harvest or destruction (or today)
+        aggregates = ", ".join(f"total(r.{m}_sum) / nullif(total(r.{m}_n), 0), min(r.{m}_min), max(r.{m}_max)"
+                               for m in SENSOR_METRICS)
+        sql = f"""
+        WITH
+
+        lifetimes AS (
+            SELECT
+                bags.bag_id,
+                date(bags.created_at) AS started_at,
+                coalesce((SELECT min(date(obs.observed_at))
+                          FROM bag_observations obs
+                          WHERE obs.bag_id = bags.bag_id
+                            AND obs.action in ('Harvested', 'Destroyed')), current_date) AS ended_at
+            FROM json_each($bag_ids) ids
+            JOIN bags ON bags.bag_id = ids.value)
+
+        SELECT
+            lifetimes.bag_id,
+            count(r.bucket),
+            {aggregates}
+        FROM lifetimes
+        LEFT JOIN sensor_rollups r
+               ON r.resolution = 'day'
+              AND r.location = $location
+              AND r.bucket BETWEEN lifetimes.started_at AND lifetimes.ended_at
+        GROUP BY lifetimes.bag_id"""
+        params = {"location": location, "bag_ids": json.dumps(list(bag_ids))}
+        return {row[0]: row[1:] for row in self.cursor.execute(sql, params)}
+
+    def get_storage_stats(self, detailed=False):
+        # size and fragmentation of the main file; detailed reads every page through dbstat, which takes as long
+        # as reading the file
+        stats = {name: self.cursor.execute(f"PRAGMA main.{name}").fetchone()[0]
+                 for name in ("page_size", "page_count", "freelist_count", "auto_vacuum")}
+        in_memory = self.database_path == ":memory:" or self.working_copy
+        stats["file_bytes"] = (stats["page_size"] * stats["page_count"] if in_memory
+                               else os.path.getsize(self.database_path))
+        wal = self.database_path + "-wal"
+        stats["wal_bytes"] = os.path.getsize(wal) if not in_memory and os.path.exists(wal) else 0
+        stats["free_ratio"] = stats["freelist_count"] / max(stats["page_count"], 1)
+        if detailed:
+            # unused bytes inside the pages in use, and leaves not stored right after the leaf before them in key
+            # order, which turns a range scan into random reads
+            sql = """
+            SELECT count(*), sum(unused), sum(scattered)
+            FROM (
+                SELECT unused,
+                       pageno != lag(pageno) OVER (PARTITION BY name ORDER BY path) + 1 AS scattered
+                FROM dbstat('main')
+                WHERE pagetype = 'leaf')"""
+            leaves, unused, scattered = self.cursor.execute(sql).fetchone()
+            stats["unused_ratio"] = (unused or 0) / max(leaves * stats["page_size"], 1)
+            stats["scattered_ratio"] = (scattered or 0) / max(leaves, 1)
+        return stats
+
+    def maintain(self, pages=256, analyze=False, detailed=False):
+        # one bounded step of upkeep for idle time: fresh statistics for the query planner, then at most `pages`
+        # free pages given back; returns the storage stats before and after
+        before = self.get_storage_stats(detailed)
+        self.connection.commit()
+        if analyze:
+            # each index is sampled rather than read whole, so this stays quick however large the tables grow
+            self.cursor.execute("PRAGMA analysis_limit = 1000")
+            self.cursor.execute("ANALYZE main")
+            self.connection.commit()
+        if before["auto_vacuum"] == 2 and before["freelist_count"]:
+            # every step of the statement frees one page, and execute() stops a statement without columns after
+            # its first step; executescript() runs it to the end
+            self.connection.executescript(f"PRAGMA main.incremental_vacuum({int(pages)});")
+        return before, self.get_storage_stats(detailed)
+
+    def optimize(self):
+        # refreshes the statistics the queries of this connection showed to be stale; meant for before closing
+        self.connection.commit()
+        self.cursor.execute("PRAGMA optimize")
 
     def drop_tables(self):
         tables = ("bag_observations", "grain_spawn_observations", "culture_observations",
@@ -20,6 +20,7 @@ class Culture(Experiment):
     mushroom: str
     variant: str
     medium: (str, None)
+    location_id: (int, None) = None
 
     def __post_init__(self):
         super().__post_init__()
@@ -37,6 +38,7 @@ class Bag(Experiment):
     recipe_id: int
     mushroom: str = None
     variant: str = None
+    location_id: (int, None) = None
 
     def __post_init__(self):
         super().__post_init__()
@@ -51,6 +53,7 @@ class GrainSpawn(Experiment):
     recipe_id: int
     mushroom: str = None
     variant: str = None
+    location_id: (int, None) = None
 
     def __post_init__(self):
         super().__post_init__()
@@ -89,24 +92,100 @@ class Observation:
 
 @dataclass
 class CultureObservation(Observation):
+    # the actions the validator accepts, checker.py compares them with the CHECK constraints
+    actions = ("Created", "Destroyed")
 
     def __post_init__(self):
         super().__post_init__()
-        assert self.action in [None, "Created", "Destroyed"]
+        assert self.action in [None, *self.actions]
 
 
 @dataclass
 class GrainSpawnObservation(Observation):
+    actions = ("Created", "Destroyed", "Used")
 
     def __post_init__(self):
         super().__post_init__()
-        assert self.action in [None, "Created", "Destroyed", "Used"]
+        assert self.action in [None, *self.actions]
 
 
 @dataclass
 class BagObservation(Observation):
+    actions = ("Created", "Destroyed", "Harvested", "Induced Pinning")
     harvested: float = None
 
     def __post_init__(self):
         super().__post_init__()
-        assert self.action in [None, "Created", "Destroyed", "Harvested", "Induced Pinning"]
\ No newline at end of file
+        assert self.action in [None, *self.actions]
+
+
+@dataclass
+class Inspection:
+    experiment_type: str
+    observed_at: str
+    observations: list
+    # the site, or the room of it, the inspection was limited to; None for everywhere
+    site: (str, None) = None
+    room: (str, None) = None
+
+    def __post_init__(self):
+        assert self.experiment_type in ["cultures", "grain_spawn", "bags"]
+
+
+@dataclass
+class SensorReading:
+    location: str
+    measured_at: (str, datetime)
+    temperature: (float, None) = None
+    humidity: (float, None) = None
+    co2: (float, None) = None
+
+    def __post_init__(self):
+        if isinstance(self.measured_at, datetime):
+            self.measured_at = self.measured_at.strftime("%Y-%m-%d %H:%M:%S")
+
+
+@dataclass
+class CostEntry:
+    booked_at: str
+    category: str
+    amount: float
+    description: (str, None) = None
+    recipe_id: (int, None) = None
+    culture_id: (int, None) = None
+    grain_spawn_id: (int, None) = None
+    bag_id: (int, None) = None
+    batch_type: (str, None) = None
+    batch_created_at: (str, None) = None
+
+    def __post_init__(self):
+        assert self.category in ["Substrate", "Grain", "Agar", "Labour", "Other"]
+        assert self.batch_type in [None, "cultures", "grain_spawn", "bags"]
+        self.amount = float(self.amount)
+
+
+@dataclass
+class Photo:
+    experiment_type: str
+    experiment_id: int
+    observed_at: str
+    digest: str
+    extension: str
+
+    def __post_init__(self):
+        assert self.experiment_type in ["cultures", "grain_spawn", "bags"]
+
+
+@dataclass
+class Location:
+    id: (int, None)
+    site: str
+    room: str = ""
+    rack: str = ""
+
+    def __post_init__(self):
+        self.site, self.room, self.rack = (v.strip() if v else "" for v in (self.site, self.room, self.rack))
+        assert self.site, "site cannot be empty"
+
+    def __str__(self):
+        return " / ".join(v for v in (self.site, self.room, self.rack) if v)
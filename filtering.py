@@ -0,0 +1,82 @@
+import time
+import bisect
+import argparse
+from datetime import date, datetime
+
+from database import Database
+
+
+class RowIndex:
+    """Sorted indexes over every column of a panel's rows, built once per populate; filtering and sorting them
+    is a few binary searches and one pass over the rows, without going back to the database."""
+
+    def __init__(self, rows):
+        # rows are dicts with the same columns, None values are best replaced by something comparable beforehand
+        self.size = len(rows)
+        self.columns = {}
+        for column in rows[0] if rows else ():
+            order = sorted(range(len(rows)), key=lambda i: rows[i][column])
+            self.columns[column] = ([rows[i][column] for i in order], order)
+
+    def values(self, column):
+        # the distinct values of a column in order, for the filter selections
+        keys, _ = self.columns.get(column, ([], []))
+        return [key for i, key in enumerate(keys) if i == 0 or key != keys[i - 1]]
+
+    def between(self, column, low=None, high=None):
+        # positions of the rows whose value lies in [low, high], either end open when None
+        keys, order = self.columns[column]
+        lo = 0 if low is None else bisect.bisect_left(keys, low)
+        hi = len(keys) if high is None else bisect.bisect_right(keys, high)
+        return order[lo:hi]
+
+    def select(self, equal=None, between=None):
+        # positions of the rows matching every filter, all rows without any
+        selected = None
+        ranges = [(column, value, value) for column, value in (equal or {}).items()]
+        ranges += [(column, low, high) for column, (low, high) in (between or {}).items()
+                   if low is not None or high is not None]
+        # the narrowest filter is applied first, every further one only shrinks the set
+        for positions in sorted((self.between(*r) for r in ranges), key=len):
+            selected = set(positions) if selected is None else selected.intersection(positions)
+            if not selected:
+                break
+        return set(range(self.size)) if selected is None else selected
+
+    def sort(self, positions, column=None, descending=False):
+        # the positions in the order of a column, ties in the order the rows came in; in that order without one
+        order = self.columns[column][1] if column is not None else range(self.size)
+        out = [i for i in order if i in positions]
+        return out[::-1] if descending else out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filter and sort the live bags the way the inspect panel does, "
+                                                 "and time it.")
+    parser.add_argument("--date", default=date.today().strftime("%Y-%m-%d"))
+    parser.add_argument("--mushroom")
+    parser.add_argument("--min-age", type=int)
+    parser.add_argument("--max-age", type=int)
+    parser.add_argument("--sort", default="age", choices=["name", "mushroom", "variant", "recipe", "age"])
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+    today = datetime.strptime(args.date, "%Y-%m-%d")
+    bags = database.get_current_bags(args.date)
+    recipes = {r.id: r.name for r in database.get_recipes().values()}
+
+    start = time.perf_counter()
+    index = RowIndex([{"name": b.name, "mushroom": b.mushroom or "", "variant": b.variant or "",
+                       "recipe": recipes.get(b.recipe_id, ""), "age": (today - b.created_at).days} for b in bags])
+    built = time.perf_counter()
+    equal = {"mushroom": args.mushroom} if args.mushroom else {}
+    shown = index.sort(index.select(equal, {"age": (args.min_age, args.max_age)}), args.sort)
+    elapsed = time.perf_counter() - built
+
+    for i in shown[:20]:
+        bag = bags[i]
+        print(f"{bag.name:16} {bag.mushroom or '':16} {bag.variant or '':16} {(today - bag.created_at).days:4d} days")
+    print(f"{len(shown)} of {len(bags)} bags, indexed in {(built - start) * 1000:.1f} ms, filtered and sorted in "
+          f"{elapsed * 1000:.1f} ms.")
@@ -0,0 +1,210 @@
+import time
+import argparse
+from datetime import date, datetime
+
+import numpy as np
+
+from datastructures import Bag, BagObservation, Inspection
+from database import Database
+
+# julian day of date.fromordinal(0), to compare python dates with julianday() in SQL
+JULIAN_OFFSET = 1721424.5
+
+# the groups of past bags a live bag's yield curve is taken from, the most specific one with enough bags first
+LEVELS = ("recipe", "strain", "all")
+
+
+def _julian(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    elif not isinstance(value, date):
+        value = date.fromisoformat(str(value)[:10])
+    return value.toordinal() + JULIAN_OFFSET
+
+
+def _smooth(values, window):
+    # centered moving sum along the rows, flushes a few days earlier or later still count for the same day
+    padded = np.pad(values, ((0, 0), (window // 2, window - 1 - window // 2)))
+    total = np.concatenate([np.zeros((len(values), 1)), np.cumsum(padded, axis=1)], axis=1)
+    return total[:, window:] - total[:, :-window]
+
+
+class YieldForecast:
+    """Projects the harvest of the live bags from the yield per bag and day of age of the earlier bags of their
+    strain and recipe, of their strain if there are too few of those, or of all bags."""
+
+    def __init__(self, database, max_age=120, smoothing=7, min_bags=10):
+        self.database = database
+        self.max_age = max_age
+        self.smoothing = smoothing
+        self.min_bags = min_bags
+        self.reset()
+
+    def reset(self):
+        self.index = {}
+        self.created = np.empty(0)
+        self.closed = np.empty(0)
+        self.flushes = {}
+        self.groups = {level: {} for level in LEVELS}
+        self.codes = {level: np.empty(0, dtype=int) for level in LEVELS}
+        # kg harvested, and changes of the number of closed bags, per group and day of age
+        self.harvested = {level: np.zeros((0, self.max_age + 1)) for level in LEVELS}
+        self.closed_exposure = {level: np.zeros((0, self.max_age + 2)) for level in LEVELS}
+        self.curves = None
+
+    def load(self):
+        self.reset()
+        self.add_bags(self.database.get_bag_history())
+        self.add_harvests(self.database.get_harvests())
+
+    def __code(self, level, key):
+        groups = self.groups[level]
+        if key not in groups:
+            groups[key] = len(groups)
+            self.harvested[level] = np.vstack([self.harvested[level], np.zeros((1, self.max_age + 1))])
+            self.closed_exposure[level] = np.vstack([self.closed_exposure[level], np.zeros((1, self.max_age + 2))])
+        return groups[key]
+
+    def __add_exposure(self, bags):
+        # a closed bag counts towards the yield per bag on every day of age from 0 to the day it closed
+        ends = np.clip(self.closed[bags] - self.created[bags], 0, self.max_age).astype(int)
+        for level in LEVELS:
+            codes = self.codes[level][bags]
+            np.add.at(self.closed_exposure[level], (codes, 0), 1)
+            np.add.at(self.closed_exposure[level], (codes, ends + 1), -1)
+        self.curves = None
+
+    def add_bags(self, rows):
+        # rows of (bag, created, closed, mushroom, variant, recipe), dates in julian days
+        if not rows:
+            return
+        ids, created, closed, mushrooms, variants, recipes = zip(*rows)
+        start = len(self.created)
+        self.index.update((bag_id, start + i) for i, bag_id in enumerate(ids))
+        self.created = np.append(self.created, np.array(created, dtype=float))
+        self.closed = np.append(self.closed, np.array(closed, dtype=float))
+        keys = {"recipe": zip(mushrooms, variants, recipes), "strain": zip(mushrooms, variants),
+                "all": [()] * len(ids)}
+        for level in LEVELS:
+            codes = [self.__code(level, key) for key in keys[level]]
+            self.codes[level] = np.append(self.codes[level], np.array(codes, dtype=int))
+
+        bags = start + np.arange(len(ids))
+        self.__add_exposure(bags[~np.isnan(self.closed[bags])])
+
+    def add_harvests(self, rows):
+        # rows of (bag, observed, kg); a flush recorded again on the same day replaces the earlier amount
+        rows = [(self.index[bag_id], observed, kg) for bag_id, observed, kg in rows if bag_id in self.index]
+        if not rows:
+            return
+        deltas = []
+        for bag, observed, kg in rows:
+            deltas.append(kg - self.flushes.get((bag, observed), 0.0))
+            self.flushes[(bag, observed)] = kg
+        bags, observed, _ = (np.array(column) for column in zip(*rows))
+        bags = bags.astype(int)
+        ages = (observed - self.created[bags]).astype(int)
+        within = (ages >= 0) & (ages <= self.max_age)
+        for level in LEVELS:
+            np.add.at(self.harvested[level], (self.codes[level][bags[within]], ages[within]),
+                      np.array(deltas)[within])
+        self.curves = None
+
+    def close(self, bag_id, closed):
+        bag = self.index.get(bag_id)
+        if bag is None or not np.isnan(self.closed[bag]):
+            return
+        self.closed[bag] = closed
+        self.__add_exposure(np.array([bag]))
+
+    def on_write(self, obj):
+        # follows the database's writes, registered with Database.add_listener
+        created = []
+        for o in obj if isinstance(obj, list) else [obj]:
+            if isinstance(o, Inspection):
+                self.on_write(o.observations)
+            elif isinstance(o, BagObservation):
+                observed = _julian(o.observed_at)
+                if o.harvested:
+                    self.add_harvests([(o.experiment.id, observed, float(o.harvested))])
+                if o.action in ("Harvested", "Destroyed"):
+                    self.close(o.experiment.id, observed)
+            elif isinstance(o, Bag):
+                created.append(o.name)
+
+        # written bags only carry their number of the day, their rows are looked up by name
+        if created:
+            ids = self.database.get_ids_by_name("bags", created)
+            bags = self.database.get_by_id("bags", ids.values()).values()
+            self.add_bags([(b.id, _julian(b.created_at), None, b.mushroom or "", b.variant or "", b.recipe_id)
+                           for b in bags if b.id not in self.index])
+
+    def __fit(self, today):
+        # kg per bag and day of age per group, over the closed bags and the live ones up to their current age
+        if self.curves is not None and self.curves[0] == today:
+            return self.curves[1]
+        live = np.nonzero(np.isnan(self.closed) & (self.created <= today))[0]
+        ages = np.clip(today - self.created[live], 0, self.max_age).astype(int)
+        fits = {}
+        for level in LEVELS:
+            exposure = self.closed_exposure[level].copy()
+            np.add.at(exposure, (self.codes[level][live], 0), 1)
+            np.add.at(exposure, (self.codes[level][live], ages + 1), -1)
+            exposure = np.cumsum(exposure, axis=1)[:, :self.max_age + 1]
+            # the rate of each day is smoothed rather than the sums, bags closing right after a flush would
+            # otherwise leave too few bag days around it and inflate it
+            rate = np.divide(self.harvested[level], exposure, out=np.zeros_like(exposure), where=exposure > 0)
+            fits[level] = (_smooth(rate, self.smoothing) / self.smoothing, exposure[:, 0])
+        self.curves = (today, fits)
+        return fits
+
+    def forecast(self, today=None, weeks=4):
+        # (days, expected kg per day, {strain: expected kg per day}) for the live bags, from the day after today
+        today = _julian(today or date.today())
+        fits = self.__fit(today)
+        live = np.nonzero(np.isnan(self.closed) & (self.created <= today))[0]
+        ages = (today - self.created[live]).astype(int)
+        future = ages[:, None] + np.arange(1, weeks * 7 + 1)[None, :]
+        beyond = future > self.max_age
+        future = np.minimum(future, self.max_age)
+
+        expected = np.zeros(future.shape)
+        chosen = np.zeros(len(live), dtype=bool)
+        for level in LEVELS:
+            curve, n_bags = fits[level]
+            codes = self.codes[level][live]
+            use = ~chosen & ((n_bags[codes] >= self.min_bags) | (level == LEVELS[-1]))
+            expected[use] = curve[codes[use][:, None], future[use]]
+            chosen |= use
+        expected[beyond] = 0
+
+        strains = [" ".join(k for k in key if k) for key in self.groups["strain"]]
+        by_strain = np.zeros((len(strains), expected.shape[1]))
+        np.add.at(by_strain, self.codes["strain"][live], expected)
+        days = [date.fromordinal(int(today - JULIAN_OFFSET) + i) for i in range(1, weeks * 7 + 1)]
+        return days, expected.sum(axis=0), {strains[i]: row for i, row in enumerate(by_strain) if row.any()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast the harvest of the live bags for the coming weeks.")
+    parser.add_argument("--date", default=date.today().strftime("%Y-%m-%d"))
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--min-bags", type=int, default=10,
+                        help="past bags a strain and recipe needs before its own yield curve is used")
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+    forecast = YieldForecast(database, min_bags=args.min_bags)
+    forecast.load()
+    start = time.perf_counter()
+    days, total, by_strain = forecast.forecast(args.date, args.weeks)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'week from':12} {'total kg':>9} " + " ".join(f"{strain[:14]:>14}" for strain in by_strain))
+    for week in range(args.weeks):
+        span = slice(week * 7, week * 7 + 7)
+        print(f"{days[week * 7].strftime('%Y-%m-%d'):12} {total[span].sum():9.2f} " +
+              " ".join(f"{row[span].sum():14.2f}" for row in by_strain.values()))
+    print(f"Forecast for {int(np.isnan(forecast.closed).sum())} live bags in {elapsed * 1000:.1f} ms.")
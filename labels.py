@@ -0,0 +1,201 @@
+import os
+import html
+import json
+import time
+import hashlib
+import argparse
+import functools
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+from database import Database
+
+# bump when the rendering changes, so cached sheets are not reused
+RENDER_VERSION = 1
+
+# label sheets in millimetres: paper size, labels across and down, label size, top left margin and gaps between
+LAYOUTS = {
+    "L7651": {"paper": (210, 297), "grid": (5, 13), "label": (38.1, 21.2), "margin": (4.7, 10.7), "gap": (2.5, 0)},
+    "L7160": {"paper": (210, 297), "grid": (3, 7), "label": (63.5, 38.1), "margin": (7.2, 15.1), "gap": (2.5, 0)},
+}
+
+# bar and space widths in modules of the Code 128 symbols, by value; 103 to 105 start code sets A, B and C
+CODE128 = (
+    "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212", "221213",
+    "221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221", "223211", "221132",
+    "221231", "213212", "223112", "312131", "311222", "321122", "321221", "312212", "322112", "322211",
+    "212123", "212321", "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
+    "231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121", "313121", "211331",
+    "231131", "213113", "213311", "213131", "311123", "311321", "331121", "312113", "312311", "332111",
+    "314111", "221411", "431111", "111224", "111422", "121124", "121421", "141122", "141221", "112214",
+    "112412", "122114", "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
+    "111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
+    "214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311", "113141",
+    "114131", "311141", "411131", "211412", "211214", "211232",
+)
+CODE128_STOP = "2331112"
+START_B, START_C, SWITCH_B, SWITCH_C = 104, 105, 100, 99
+QUIET_ZONE = 10
+
+_cache_directory = None
+
+
+@functools.lru_cache(maxsize=4096)
+def encode(text):
+    # Code 128 symbol values of the text, check symbol included; runs of four or more digits are packed two to a
+    # symbol in code set C, which keeps the mostly numeric names short
+    values, code_set, i = [], None, 0
+    while i < len(text):
+        digits = len(text[i:]) - len(text[i:].lstrip("0123456789"))
+        if digits >= 4 or code_set == "C" and digits >= 2:
+            if code_set != "C":
+                values.append(START_C if code_set is None else SWITCH_C)
+                code_set = "C"
+            for j in range(i, i + digits - digits % 2, 2):
+                values.append(int(text[j:j + 2]))
+            i += digits - digits % 2
+        else:
+            if code_set != "B":
+                values.append(START_B if code_set is None else SWITCH_B)
+                code_set = "B"
+            if not 32 <= ord(text[i]) < 128:
+                raise ValueError(f"{text[i]!r} cannot be encoded in Code 128")
+            values.append(ord(text[i]) - 32)
+            i += 1
+    values.append((values[0] + sum(i * v for i, v in enumerate(values[1:], start=1))) % 103)
+    return tuple(values)
+
+
+@functools.lru_cache(maxsize=None)
+def _symbol(widths, module, height):
+    # the bars of one symbol as a relative path, drawn once per symbol and size and reused by every label
+    parts, bar = [], True
+    for width in widths:
+        if bar:
+            parts.append(f"h{int(width) * module:.3f}v{height:.3f}h{-int(width) * module:.3f}z")
+        parts.append(f"m{int(width) * module:.3f},0")
+        bar = not bar
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=4096)
+def barcode(text, width, height):
+    # an SVG path of the text's barcode fitted into width, quiet zones included; starts at the origin
+    values = encode(text)
+    modules = 11 * len(values) + sum(map(int, CODE128_STOP)) + 2 * QUIET_ZONE
+    module = width / modules
+    return (f"M{QUIET_ZONE * module:.3f},0" + "".join(_symbol(CODE128[v], module, height) for v in values) +
+            _symbol(CODE128_STOP, module, height))
+
+
+@functools.lru_cache(maxsize=4096)
+def _text(value, size, width):
+    # escaped and cut to what fits the label at roughly 0.55 em per character
+    fits = max(int(width / (size * 0.55)), 1)
+    value = value if len(value) <= fits else value[:fits - 1] + "…"
+    return html.escape(value)
+
+
+@functools.lru_cache(maxsize=4096)
+def render_label(name, created, strain, recipe, layout):
+    # one label in its own coordinates, cached so a label printed again costs nothing
+    width, height = LAYOUTS[layout]["label"]
+    pad = 1.5
+    inner = width - 2 * pad
+    size = min(height / 7, 3.2)
+    bar_height = height - 2 * pad - 3.4 * size
+    return (f'<text x="{width / 2:.2f}" y="{pad + size:.2f}" font-size="{size * 1.1:.2f}" font-weight="bold" '
+            f'text-anchor="middle" font-family="monospace">{_text(name, size * 1.1, inner)}</text>'
+            f'<path transform="translate({pad:.2f},{pad + 1.3 * size:.2f})" d="{barcode(name, inner, bar_height)}"/>'
+            f'<text x="{pad:.2f}" y="{height - pad - 1.1 * size:.2f}" font-size="{size:.2f}">'
+            f'{_text(strain, size, inner)}</text>'
+            f'<text x="{pad:.2f}" y="{height - pad:.2f}" font-size="{size * 0.9:.2f}">'
+            f'{_text(" · ".join(v for v in (created, recipe) if v), size * 0.9, inner)}</text>')
+
+
+def render_sheet(rows, layout):
+    settings = LAYOUTS[layout]
+    paper_width, paper_height = settings["paper"]
+    columns, _ = settings["grid"]
+    width, height = settings["label"]
+    left, top = settings["margin"]
+    gap_x, gap_y = settings["gap"]
+    labels = []
+    for i, row in enumerate(rows):
+        x = left + (i % columns) * (width + gap_x)
+        y = top + (i // columns) * (height + gap_y)
+        labels.append(f'<g transform="translate({x:.2f},{y:.2f})">{render_label(*row, layout)}</g>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{paper_width}mm" height="{paper_height}mm" '
+            f'viewBox="0 0 {paper_width} {paper_height}" font-family="sans-serif">{"".join(labels)}</svg>')
+
+
+def _set_cache(cache_directory):
+    global _cache_directory
+    _cache_directory = cache_directory
+
+
+def build_sheet(rows, layout):
+    # the sheet's SVG and whether it came from the cache; a sheet is only rendered again when a label changed
+    digest = hashlib.sha256(json.dumps([RENDER_VERSION, layout, rows]).encode()).hexdigest()
+    path = os.path.join(_cache_directory, f"{digest}.svg")
+    if os.path.exists(path):
+        with open(path) as file:
+            return file.read(), True
+
+    sheet = render_sheet(rows, layout)
+    with open(path + ".partial", "w") as file:
+        file.write(sheet)
+    os.replace(path + ".partial", path)
+    return sheet, False
+
+
+def write_sheets(rows, directory=os.path.join("data", "labels"), prefix="labels", layout="L7651", workers=None):
+    # one SVG per sheet, the sheets rendered in worker processes once there are several of them
+    cache_directory = os.path.join(directory, ".cache")
+    os.makedirs(cache_directory, exist_ok=True)
+    columns, lines = LAYOUTS[layout]["grid"]
+    per_sheet = columns * lines
+    sheets = [[tuple(row) for row in rows[i:i + per_sheet]] for i in range(0, len(rows), per_sheet)]
+
+    if len(sheets) > 1 and workers != 1:
+        with ProcessPoolExecutor(workers, initializer=_set_cache, initargs=(cache_directory,)) as executor:
+            results = list(executor.map(build_sheet, sheets, [layout] * len(sheets)))
+    else:
+        _set_cache(cache_directory)
+        results = [build_sheet(sheet, layout) for sheet in sheets]
+
+    paths = []
+    for i, (sheet, _) in enumerate(results, start=1):
+        path = os.path.join(directory, f"{prefix}-{i:03d}.svg")
+        with open(path, "w") as file:
+            file.write(sheet)
+        paths.append(path)
+    return paths, sum(cached for _, cached in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render print-ready label sheets with barcodes for the experiments "
+                                                 "created in a date range, or with the given names.")
+    parser.add_argument("experiment_type", choices=["cultures", "grain_spawn", "bags"])
+    parser.add_argument("first", nargs="?", default=date.today().strftime("%Y-%m-%d"),
+                        help="first day of creation (YYYY-MM-DD)")
+    parser.add_argument("last", nargs="?", help="last day of creation (YYYY-MM-DD), defaults to the first")
+    parser.add_argument("--names", nargs="+", help="only these experiments, whenever they were created")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="L7651")
+    parser.add_argument("--output", default=os.path.join("data", "labels"))
+    parser.add_argument("--workers", type=int, help="number of processes, defaults to the number of cores")
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+    if args.names:
+        rows = database.get_labels(args.experiment_type, names=args.names)
+    else:
+        rows = database.get_labels(args.experiment_type, args.first, args.last or args.first)
+
+    start = time.perf_counter()
+    paths, reused = write_sheets(rows, args.output, f"{args.experiment_type}-{args.first}", args.layout, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {len(rows)} labels on {len(paths)} sheets to {args.output} in {elapsed:.2f} s, "
+          f"{reused} sheets were unchanged.")
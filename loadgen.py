@@ -0,0 +1,145 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+import contextlib
+from datetime import date, timedelta
+
+from datastructures import Recipe, Culture, GrainSpawn, Bag, BagObservation
+from database import Database
+from server import LabServer, RemoteDatabase
+
+
+def seed(database, n_bags):
+    today = date.today().strftime("%Y-%m-%d")
+    # experiments are stored with a time of day, so they are only listed as current from the next day on
+    yesterday = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+    for recipe_type in ("Grain Spawn", "Substrate"):
+        try:
+            database.write(Recipe(None, f"Load Test {recipe_type}", recipe_type, "-", "-"))
+        except sqlite3.DatabaseError:
+            pass
+    recipes = database.get_recipes()
+
+    database.write(Culture(yesterday, database.get_n("cultures", yesterday) + 1, "Oyster", "Load Test", None))
+    culture = database.get_current_cultures(today)[-1]
+    database.write(GrainSpawn(yesterday, database.get_n("grain_spawn", yesterday) + 1, culture.id,
+                              recipes["Load Test Grain Spawn"].id))
+    grain_spawn = database.get_current_grain_spawn(today)[-1]
+
+    start = database.get_n("bags", yesterday) + 1
+    database.write([Bag(yesterday, i, grain_spawn.id, recipes["Load Test Substrate"].id)
+                    for i in range(start, start + n_bags)])
+
+
+def worker(database, deadline, write_ratio, latencies):
+    today = date.today().strftime("%Y-%m-%d")
+    bags = database.get_current_bags(today)
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        if random.random() < write_ratio:
+            observation = BagObservation(random.choice(bags), None, True, "")
+            observation.observed_at = today
+            database.write(observation)
+            latencies["write"].append(time.perf_counter() - start)
+        else:
+            database.get_current_bags(today)
+            latencies["read"].append(time.perf_counter() - start)
+
+
+def analytics_worker(database, deadline, latencies, snapshot=True):
+    # the history and a year of report sections, the kind of long reads that used to share the UI's connection
+    today = date.today()
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        with database.snapshot() if snapshot else contextlib.nullcontext():
+            database.get_actions()
+            for section in ("inventory", "yields", "losses"):
+                database.get_report_section(section, (today - timedelta(days=365)).strftime("%Y-%m-%d"),
+                                            today.strftime("%Y-%m-%d"))
+        latencies["analytics"].append(time.perf_counter() - start)
+
+
+def run_analytics(path, n_bags, duration, shared):
+    # a write loop and an analytics loop side by side on a local database, the analytics either on a snapshot
+    # reader or, with shared, on a second ordinary connection in the default journal mode
+    database = Database(path)
+    database.connect(check_same_thread=False)
+    database.initialize_tables()
+    seed(database, n_bags)
+    if shared:
+        reader = Database(path)
+        reader.connect(check_same_thread=False)
+    else:
+        reader = database.reader(check_same_thread=False)
+
+    latencies = {"write": [], "analytics": []}
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=worker, args=(database, deadline, 1.0, latencies)),
+               threading.Thread(target=analytics_worker, args=(reader, deadline, latencies, not shared))]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(latencies, time.monotonic() - start)
+
+
+def percentile(values, p):
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def report(latencies, elapsed):
+    print(f"{'':9} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        values = sorted(values)
+        print(f"{kind:9} {len(values):9d} {len(values) / elapsed:9.1f} " +
+              " ".join(f"{percentile(values, p) * 1000:8.2f}" for p in (0.5, 0.95, 0.99, 1.0)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate load against a lab server and report latencies.")
+    parser.add_argument("--url", help="server to test; by default a server on a temporary database is started")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--write-ratio", type=float, default=0.5)
+    parser.add_argument("--bags", type=int, default=200)
+    parser.add_argument("--analytics", action="store_true",
+                        help="run a write loop and an analytics loop side by side on a local database instead")
+    parser.add_argument("--shared", action="store_true",
+                        help="with --analytics, read on an ordinary connection instead of a snapshot reader")
+    args = parser.parse_args()
+
+    if args.analytics:
+        run_analytics(os.path.join(tempfile.mkdtemp(), "loadgen.db"), args.bags, args.duration, args.shared)
+        raise SystemExit
+
+    server = None
+    url = args.url
+    if url is None:
+        directory = tempfile.mkdtemp()
+        server = LabServer(("127.0.0.1", 0), os.path.join(directory, "loadgen.db"))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    seed(RemoteDatabase(url), args.bags)
+
+    latencies = {"read": [], "write": []}
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=worker, args=(RemoteDatabase(url), deadline, args.write_ratio, latencies))
+               for _ in range(args.clients)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(latencies, time.monotonic() - start)
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
@@ -1,15 +1,26 @@
 import os
+import base64
 import sqlite3
+import argparse
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
+from tkinter import filedialog
 from datetime import date, datetime
 
 import tkcalendar
 from tkcalendar import DateEntry
 
-from datastructures import Recipe, Bag, Culture, GrainSpawn, CultureObservation, GrainSpawnObservation, BagObservation
+import labels
+import tracing
+from datastructures import Recipe, Bag, Culture, GrainSpawn, Inspection, CostEntry, Location
 from database import Database
+from filtering import RowIndex
+from server import RemoteDatabase
+from backup import BackupScheduler
+from maintenance import MaintenanceScheduler
+from scheduler import Scheduler
+from photos import PhotoStore
 
 
 def _create_popup(parent):
@@ -76,9 +87,11 @@ def _place_counter(parent, variable, row, column, width=None, **kwargs):
 
 
 class CreatePanel(tk.Frame):
-    def __init__(self, parent, database, observed_at, padx=None, pady=None):
+    def __init__(self, parent, database, observed_at, padx=None, pady=None, location=None):
         super().__init__(parent)
         self.database = database
+        # new experiments are placed at the selected location, parents are offered from anywhere on its site
+        self.location = location
 
         self.buttons = {
             "Bag": self.create_bag,
@@ -107,6 +120,7 @@ class CreatePanel(tk.Frame):
         for i, (text, command) in enumerate(self.buttons.items()):
             _place_button(self.label_frame, text, command, i, 0, padx=5, pady=5)
 
+    @tracing.traced
     def create_bag(self):
         def write_bag():
             nonlocal popup, grain_spawn
@@ -114,18 +128,23 @@ class CreatePanel(tk.Frame):
                 count = count_var.get()
                 starter = grain_spawn[grain_spawn_name_var.get()]
                 recipe = recipes[recipe_name_var.get()]
+                location_id = self.get_location_id()
                 start = self.database.get_n("bags", created_at_var.get()) + 1
+                names = []
                 for i in range(start, start + count):
                     bag = Bag(id=i,
                               created_at=created_at_var.get(),
                               grain_spawn_id=starter.id,
-                              recipe_id=recipe.id)
+                              recipe_id=recipe.id,
+                              location_id=location_id)
                     self.database.write(bag)
+                    names.append(bag.name)
 
                 bag_str = 'Bag was' if count == 1 else 'Bags were'
                 row_str = 's' if count != 1 else ''
-                msg = f"{bag_str} added to database ({count} row{row_str})."
-                messagebox.showinfo("", msg, parent=popup)
+                msg = f"{bag_str} added to database ({count} row{row_str}). Print labels?"
+                if messagebox.askyesno("", msg, parent=popup):
+                    self.print_labels("bags", names, popup)
                 popup.destroy()
 
             except (sqlite3.DatabaseError, sqlite3.IntegrityError) as e:
@@ -169,6 +188,7 @@ class CreatePanel(tk.Frame):
         grain_spawn_name_var.trace_add("write", update_description_labels)
         recipe_name_var = tk.StringVar()
         recipe_name_var.trace_add("write", update_recipe_panel)
+        recipe_search_var = tk.StringVar()
         created_at_var = tk.StringVar(value=date.today().strftime("%Y-%m-%d"))
         created_at_var.trace_add("write", update_bag_title)
         count_var = tk.IntVar(value=1)
@@ -189,22 +209,27 @@ class CreatePanel(tk.Frame):
         mushroom_label = _place_label(control_panel, "Mushroom", row=2, column=0, sticky="news")
         variant_label = _place_label(control_panel, "Variant", row=2, column=1, sticky="news")
 
-        _place_label(control_panel, "Recipe:", row=3, column=0, sticky="news")
-        _place_selection(control_panel, list(recipes.keys()), recipe_name_var, row=3, column=1, sticky="news")
+        _place_label(control_panel, "Search Recipes:", row=3, column=0, sticky="news")
+        _place_entry(control_panel, recipe_search_var, row=3, column=1, sticky="news")
+        _place_label(control_panel, "Recipe:", row=4, column=0, sticky="news")
+        recipe_selection_widget = _place_selection(control_panel, list(recipes.keys()), recipe_name_var,
+                                                   row=4, column=1, sticky="news")
+        self.bind_recipe_search(recipe_search_var, recipe_selection_widget, recipes, "Substrate")
 
-        _place_label(control_panel, "Created At:", row=4, column=0, sticky="news")
+        _place_label(control_panel, "Created At:", row=5, column=0, sticky="news")
         created_at_widget = DateEntry(control_panel, date_pattern='y-mm-dd', textvariable=created_at_var)
-        created_at_widget.grid(row=4, column=1, sticky="news")
+        created_at_widget.grid(row=5, column=1, sticky="news")
 
-        _place_label(control_panel, "Amount:", row=5, column=0, sticky="news")
-        _place_counter(control_panel, count_var, row=5, column=1)
-        _place_button(control_panel, "Okay", write_bag, row=6, column=0, columnspan=2)
+        _place_label(control_panel, "Amount:", row=6, column=0, sticky="news")
+        _place_counter(control_panel, count_var, row=6, column=1)
+        _place_button(control_panel, "Okay", write_bag, row=7, column=0, columnspan=2)
 
         _place_label(recipe_panel, "Ingredients", row=0, column=0)
         ingredients_panel = _place_text(recipe_panel, row=1, column=0, width=70, height=10, disable=True)
         _place_label(recipe_panel, "Instructions", row=2, column=0)
         instructions_panel = _place_text(recipe_panel, row=3, column=0, width=70, disable=True)
 
+    @tracing.traced
     def create_grain_spawn(self):
         def write_grain_spawn():
             nonlocal popup
@@ -212,15 +237,20 @@ class CreatePanel(tk.Frame):
                 count = count_var.get()
                 culture = cultures[culture_name_var.get()]
                 recipe = recipes[recipe_name_var.get()]
+                location_id = self.get_location_id()
                 start = self.database.get_n("grain_spawn", created_at_var.get()) + 1
+                names = []
                 for i in range(start, start + count):
                     grain_spawn = GrainSpawn(id=i,
                                              created_at=created_at_var.get(),
                                              culture_id=culture.id,
-                                             recipe_id=recipe.id)
+                                             recipe_id=recipe.id,
+                                             location_id=location_id)
                     self.database.write(grain_spawn)
-                msg = f"Grain Spawn was added to database ({count} row{'s' if count != 1 else ''})."
-                messagebox.showinfo("", msg, parent=popup)
+                    names.append(grain_spawn.name)
+                msg = f"Grain Spawn was added to database ({count} row{'s' if count != 1 else ''}). Print labels?"
+                if messagebox.askyesno("", msg, parent=popup):
+                    self.print_labels("grain_spawn", names, popup)
                 popup.destroy()
 
             except (sqlite3.DatabaseError, sqlite3.IntegrityError) as e:
@@ -263,6 +293,7 @@ class CreatePanel(tk.Frame):
         culture_name_var.trace_add("write", update_description_labels)
         recipe_name_var = tk.StringVar()
         recipe_name_var.trace_add("write", update_recipe_panel)
+        recipe_search_var = tk.StringVar()
         created_at_var = tk.StringVar(value=date.today().strftime("%Y-%m-%d"))
         created_at_var.trace_add("write", update_grain_spawn_title)
         count_var = tk.IntVar(value=1)
@@ -283,29 +314,67 @@ class CreatePanel(tk.Frame):
         mushroom_label = _place_label(control_panel, "Mushroom", row=2, column=0, sticky="news")
         variant_label = _place_label(control_panel, "Variant", row=2, column=1, sticky="news")
 
-        _place_label(control_panel, "Recipe:", row=3, column=0, sticky="news")
-        _place_selection(control_panel, list(recipes.keys()), recipe_name_var, row=3, column=1, sticky="news")
+        _place_label(control_panel, "Search Recipes:", row=3, column=0, sticky="news")
+        _place_entry(control_panel, recipe_search_var, row=3, column=1, sticky="news")
+        _place_label(control_panel, "Recipe:", row=4, column=0, sticky="news")
+        recipe_selection_widget = _place_selection(control_panel, list(recipes.keys()), recipe_name_var,
+                                                   row=4, column=1, sticky="news")
+        self.bind_recipe_search(recipe_search_var, recipe_selection_widget, recipes, "Grain Spawn")
 
-        _place_label(control_panel, "Created At:", row=4, column=0, sticky="news")
+        _place_label(control_panel, "Created At:", row=5, column=0, sticky="news")
         created_at_widget = DateEntry(control_panel, date_pattern='y-mm-dd', textvariable=created_at_var)
-        created_at_widget.grid(row=4, column=1, sticky="news")
+        created_at_widget.grid(row=5, column=1, sticky="news")
 
-        _place_label(control_panel, "Amount:", row=5, column=0, sticky="news")
-        _place_counter(control_panel, count_var, row=5, column=1)
-        _place_button(control_panel, "Okay", write_grain_spawn, row=6, column=0, columnspan=2)
+        _place_label(control_panel, "Amount:", row=6, column=0, sticky="news")
+        _place_counter(control_panel, count_var, row=6, column=1)
+        _place_button(control_panel, "Okay", write_grain_spawn, row=7, column=0, columnspan=2)
 
         _place_label(recipe_panel, "Ingredients", row=0, column=0)
         ingredients_panel = _place_text(recipe_panel, row=1, column=0, width=70, height=10, disable=True)
         _place_label(recipe_panel, "Instructions", row=2, column=0)
         instructions_panel = _place_text(recipe_panel, row=3, column=0, width=70, disable=True)
 
+    def bind_recipe_search(self, search_var, selection_widget, recipes, recipe_type):
+        def search():
+            nonlocal pending
+            pending = None
+            if not selection_widget.winfo_exists():
+                return
+            if query := search_var.get().strip():
+                found = self.database.search_recipes(query, recipe_type)
+                recipes.update(found)
+                selection_widget["values"] = list(found.keys())
+            else:
+                selection_widget["values"] = list(recipes.keys())
+
+        def schedule_search(var, index, mode):
+            nonlocal pending
+            # only query once typing pauses
+            if pending is not None:
+                self.after_cancel(pending)
+            pending = self.after(150, search)
+
+        pending = None
+        search_var.trace_add("write", schedule_search)
+
+    def get_location_id(self):
+        return self.location.get_location_id() if self.location is not None else None
+
+    def print_labels(self, experiment_type, names, parent):
+        # label sheets of a batch just created, written where labels.py writes them
+        rows = self.database.get_labels(experiment_type, names=names)
+        paths, _ = labels.write_sheets(rows, prefix=f"{experiment_type}-{names[0]}")
+        messagebox.showinfo("", f"{len(rows)} labels on {len(paths)} sheets written to {os.path.dirname(paths[0])}.",
+                            parent=parent)
+
     def get_current_experiments(self, experiment_type, observed_at):
+        site = self.location.scope()[0] if self.location is not None else None
         if experiment_type == "cultures":
-            return {str(c): c for c in self.database.get_current_cultures(observed_at)}
+            return {str(c): c for c in self.database.get_current_cultures(observed_at, site)}
         elif experiment_type == "grain_spawn":
-            return {str(g): g for g in self.database.get_current_grain_spawn(observed_at)}
+            return {str(g): g for g in self.database.get_current_grain_spawn(observed_at, site)}
         elif experiment_type == "bags":
-            return {str(b): b for b in self.database.get_current_bags(observed_at)}
+            return {str(b): b for b in self.database.get_current_bags(observed_at, site)}
 
     def get_next_culture_title(self, created_at):
         counter = self.database.get_n(table="cultures", created_at=created_at) + 1
@@ -332,6 +401,7 @@ class CreatePanel(tk.Frame):
                   grain_spawn_id=-1)
         return str(bag)
 
+    @tracing.traced
     def create_culture(self):
         def write_culture():
             nonlocal popup
@@ -340,7 +410,8 @@ class CreatePanel(tk.Frame):
                                   variant=variant_name.get(),
                                   created_at=created_at_var.get(),
                                   medium=medium_var.get(),
-                                  mushroom=mushroom_var.get())
+                                  mushroom=mushroom_var.get(),
+                                  location_id=self.get_location_id())
 
                 self.database.write(culture)
                 messagebox.showinfo("", "Culture was added to database.", parent=popup)
@@ -376,6 +447,7 @@ class CreatePanel(tk.Frame):
         mushroom_var = tk.StringVar()
         medium_var = tk.StringVar()
         medium_var.trace_add("write", update_recipe_panel)
+        recipe_search_var = tk.StringVar()
         created_at_var = tk.StringVar(value=date.today().strftime("%Y-%m-%d"))
         created_at_var.trace_add("write", update_culture_title)
 
@@ -393,20 +465,25 @@ class CreatePanel(tk.Frame):
 
         _place_label(control_panel, "Mushroom:", row=2, column=0, sticky="news")
         _place_selection(control_panel, mushrooms, mushroom_var, row=2, column=1, sticky="news")
-        _place_label(control_panel, "Medium:", row=3, column=0, sticky="news")
-        _place_selection(control_panel, list(recipes.keys()), medium_var, row=3, column=1, sticky="news")
-
-        _place_label(control_panel, "Created At:", row=4, column=0, sticky="news")
+        _place_label(control_panel, "Search Media:", row=3, column=0, sticky="news")
+        _place_entry(control_panel, recipe_search_var, row=3, column=1, sticky="news")
+        _place_label(control_panel, "Medium:", row=4, column=0, sticky="news")
+        medium_selection_widget = _place_selection(control_panel, list(recipes.keys()), medium_var,
+                                                   row=4, column=1, sticky="news")
+        self.bind_recipe_search(recipe_search_var, medium_selection_widget, recipes, "Growth Medium")
+
+        _place_label(control_panel, "Created At:", row=5, column=0, sticky="news")
         created_at_widget = DateEntry(control_panel, date_pattern='y-mm-dd', textvariable=created_at_var)
-        created_at_widget.grid(row=4, column=1, sticky="news")
+        created_at_widget.grid(row=5, column=1, sticky="news")
 
-        _place_button(control_panel, "Okay", write_culture, row=5, column=0, columnspan=2)
+        _place_button(control_panel, "Okay", write_culture, row=6, column=0, columnspan=2)
 
         _place_label(recipe_panel, "Ingredients", row=0, column=0)
         ingredients_panel = _place_text(recipe_panel, row=1, column=0, width=70, height=10, disable=True)
         _place_label(recipe_panel, "Instructions", row=2, column=0)
         instructions_panel = _place_text(recipe_panel, row=3, column=0, width=70, disable=True)
 
+    @tracing.traced
     def create_recipe(self):
         def write_recipe():
             nonlocal popup
@@ -453,18 +530,34 @@ class CreatePanel(tk.Frame):
 
 
 class InspectPanel(tk.Frame):
-    def __init__(self, parent, title, database, observed_at, width=None):
+    experiment_type = None
+    # what the third filter selects by, the cultures have a medium where grain spawn and bags have a recipe
+    group_label = "Recipe"
+    # the headers that sort the rows, with the column of the index they sort by
+    sort_columns = {"Mushroom": "mushroom", "Variant": "variant", "Created At": "created"}
+    any_value = "All"
+
+    def __init__(self, parent, title, database, observed_at, width=None, photo_store=None, location=None):
         super().__init__(parent)
         # todo: look at this again... try to make widget-canvas resize with window
         self.database = database
+        self.photo_store = photo_store
+        self.location = location
         self.entries = []
         self.check_results = []
         self.actions = []
         self.observed_at = observed_at
+        # the widgets of every entry's row, the index over the entries and the positions of the rows shown
+        self.rows = []
+        self.headers = {}
+        self.index = RowIndex([])
+        self.shown = []
+        self.sort_column, self.descending = None, False
 
         self.label_frame = ttk.LabelFrame(self, text=title, width=width)
         self.label_frame.grid(row=0, column=0, pady=(20, 5), padx=20, sticky="news")
         self.label_frame.grid_columnconfigure(0, weight=1)
+        self.place_filters()
         self.canvas = tk.Canvas(self.label_frame, borderwidth=0, width=width)
 
         self.frame = tk.Frame(self.canvas, width=width)
@@ -494,12 +587,167 @@ class InspectPanel(tk.Frame):
         self.entries = []
         self.check_results = []
         self.actions = []
+        self.rows = []
+        self.headers = {}
+        self.shown = []
         for widget in self.frame.winfo_children():
             widget.destroy()
 
     def populate(self):
         raise NotImplementedError
 
+    def place_filters(self):
+        # the filters only narrow down the rows of the last populate, through its index
+        frame = ttk.Frame(self.label_frame)
+        frame.pack(side="top", fill="x", pady=(0, 5))
+        self.filters = {column: tk.StringVar(value=self.any_value) for column in ("mushroom", "variant", "group")}
+        self.filter_widgets = {}
+        for i, (text, column) in enumerate((("Mushroom:", "mushroom"), ("Variant:", "variant"),
+                                            (f"{self.group_label}:", "group"))):
+            _place_label(frame, text, row=0, column=2 * i, padx=(5, 2))
+            self.filter_widgets[column] = _place_selection(frame, [self.any_value], self.filters[column],
+                                                           row=0, column=2 * i + 1)
+            self.filter_widgets[column].config(width=12)
+
+        self.min_age, self.max_age = tk.StringVar(), tk.StringVar()
+        _place_label(frame, "Age:", row=0, column=6, padx=(5, 2))
+        _place_entry(frame, self.min_age, row=0, column=7).config(width=4)
+        _place_label(frame, "to", row=0, column=8, padx=2)
+        _place_entry(frame, self.max_age, row=0, column=9).config(width=4)
+        _place_label(frame, "days", row=0, column=10, padx=(2, 5))
+        self.failed_only = tk.IntVar(value=0)
+        _place_label(frame, "Failed only:", row=0, column=11, padx=(5, 2))
+        _place_checkbox(frame, self.failed_only, row=0, column=12)
+        _place_button(frame, "Clear", self.clear_filters, row=0, column=13, padx=5)
+
+        for variable in (*self.filters.values(), self.min_age, self.max_age, self.failed_only):
+            variable.trace_add("write", lambda var, index, mode: self.apply_filters())
+
+    def place_headers(self, headers):
+        # a click on a sortable header sorts the rows by it, another one reverses the order
+        for i, text in enumerate(headers):
+            label = _place_label(self.frame, text=text, row=0, column=i)
+            if text in self.sort_columns:
+                self.headers[self.sort_columns[text]] = (label, text)
+                label.config(cursor="hand2")
+                label.bind("<Button-1>", lambda event, column=self.sort_columns[text]: self.sort_by(column))
+        self.__mark_sort()
+
+    def __mark_sort(self):
+        # an arrow on the header the rows are sorted by
+        arrow = " \u25bc" if self.descending else " \u25b2"
+        for column, (label, text) in self.headers.items():
+            label.config(text=text + arrow if column == self.sort_column else text)
+
+    def build_index(self, groups):
+        # one index per populate over what the filters and sorting need, groups being each entry's recipe or medium
+        observed_at = self.observed_at.get()
+        today = datetime.strptime(observed_at, "%Y-%m-%d")
+        failed = set(self.database.get_failed_ids(self.experiment_type, [e.experiment.id for e in self.entries],
+                                                  observed_at))
+        self.index = RowIndex([{"name": e.experiment.name,
+                                "mushroom": e.experiment.mushroom or "",
+                                "variant": e.experiment.variant or "",
+                                "group": group or "",
+                                "created": e.experiment.created_at,
+                                "age": (today - e.experiment.created_at).days,
+                                "failed": e.experiment.id in failed}
+                               for e, group in zip(self.entries, groups)])
+        for column, widget in self.filter_widgets.items():
+            widget.config(values=[self.any_value] + [value for value in self.index.values(column) if value])
+        self.apply_filters()
+
+    @staticmethod
+    def __age(variable):
+        try:
+            return int(variable.get())
+        except ValueError:
+            return None
+
+    @tracing.traced
+    def apply_filters(self):
+        equal = {column: variable.get() for column, variable in self.filters.items()
+                 if variable.get() not in ("", self.any_value)}
+        if self.failed_only.get():
+            equal["failed"] = True
+        between = {"age": (self.__age(self.min_age), self.__age(self.max_age))}
+        shown = self.index.sort(self.index.select(equal, between), self.sort_column, self.descending)
+
+        # the rows' widgets are only moved, hidden ones keep their place in the grid to come back to
+        with tracing.phase("render", rows=len(shown)):
+            for i in set(self.shown).difference(shown):
+                for widget in self.rows[i]:
+                    widget.grid_remove()
+            for row, i in enumerate(shown, start=1):
+                for widget in self.rows[i]:
+                    widget.grid(row=row)
+        self.shown = shown
+
+    def sort_by(self, column):
+        self.descending = not self.descending if column == self.sort_column else False
+        self.sort_column = column
+        self.__mark_sort()
+        self.apply_filters()
+
+    def clear_filters(self):
+        for variable in self.filters.values():
+            variable.set(self.any_value)
+        self.min_age.set("")
+        self.max_age.set("")
+        self.failed_only.set(0)
+
+    def scope(self):
+        # (site, room) of the experiments shown, None for all
+        return self.location.scope() if self.location is not None else (None, None)
+
+    def place_photo_buttons(self, column):
+        # only the number of photos is read here, the thumbnails load once a row's photos are opened
+        if self.photo_store is None:
+            return
+        _place_label(self.frame, text="Photos", row=0, column=column)
+        counts = self.database.get_photo_counts(self.experiment_type, [e.experiment.id for e in self.entries])
+        for i, entry in enumerate(self.entries):
+            self.rows[i].append(_place_button(self.frame, str(counts.get(entry.experiment.id, 0)),
+                                              lambda experiment=entry.experiment: self.show_photos(experiment),
+                                              row=i + 1, column=column, padx=5))
+
+    @tracing.traced
+    def show_photos(self, experiment):
+        def add_photo():
+            paths = filedialog.askopenfilenames(parent=popup, title="Add Photos",
+                                                filetypes=[("Images", "*.jpg *.jpeg *.png *.tif *.tiff")])
+            for path in paths:
+                self.photo_store.attach(self.experiment_type, experiment.id, self.observed_at.get(), path)
+            if paths:
+                popup.destroy()
+                self.show_photos(experiment)
+                self.populate()
+
+        def poll():
+            for label, future in list(loading):
+                if future.done():
+                    loading.remove((label, future))
+                    try:
+                        label.image = tk.PhotoImage(data=base64.b64encode(future.result()))
+                        label.config(image=label.image, text="")
+                    except Exception as e:
+                        label.config(text=str(e))
+            if loading:
+                popup.after(50, poll)
+
+        popup = _create_popup(self)
+        popup.title(f"Photos of {experiment}")
+        loading = []
+        for i, photo in enumerate(self.database.get_photos(self.experiment_type, experiment.id)):
+            frame = ttk.Frame(popup)
+            frame.grid(row=i // 4, column=i % 4, padx=5, pady=5)
+            label = _place_label(frame, "Loading...", row=0, column=0)
+            _place_label(frame, photo.observed_at, row=1, column=0)
+            loading.append((label, self.photo_store.thumbnail(photo)))
+        _place_button(popup, "Add Photos", add_photo, row=len(loading) // 4 + 1, column=0, columnspan=4, pady=5)
+        poll()
+
+    @tracing.traced
     def confirm(self):
         try:
             observed_at = self.observed_at.get()
@@ -508,7 +756,7 @@ class InspectPanel(tk.Frame):
                 entry.action = action.get()
                 entry.observed_at = observed_at
 
-            self.database.write(self.entries)
+            self.database.write(Inspection(self.experiment_type, observed_at, self.entries, *self.scope()))
             messagebox.showinfo("", "Observations written to database.", parent=self)
         except Exception as e:
             messagebox.showerror("Error!", str(e))
@@ -520,6 +768,7 @@ class InspectPanel(tk.Frame):
             check.set(False)
 
     def mark_all_ok(self):
+        # every row, hidden ones too: confirm writes all of them, and a sweep in sparse mode covers them anyway
         for check in self.check_results:
             check.set(True)
 
@@ -529,38 +778,48 @@ class InspectPanel(tk.Frame):
 
 
 class InspectBagPanel(InspectPanel):
-    def __init__(self, parent, title, database, observed_at, width=None):
-        super().__init__(parent, title, database, observed_at, width)
+    experiment_type = "bags"
+
+    def __init__(self, parent, title, database, observed_at, width=None, photo_store=None, location=None):
+        super().__init__(parent, title, database, observed_at, width, photo_store, location)
         self.harvested = []
 
     def clear(self):
         super().clear()
         self.harvested = []
 
+    @tracing.traced
     def populate(self):
 
         self.clear()
         observed_at = self.observed_at.get()
         action_values = ['', 'Created', 'Destroyed', 'Kneaded', 'Harvested']
-        self.entries = [BagObservation(g, observed_at, False, "") for g in self.database.get_current_bags(observed_at)]
-        self.check_results = [tk.IntVar(self, value=0) for _ in self.entries]
-        self.actions = [tk.StringVar(value="") for _ in self.entries]
-        self.harvested = [tk.DoubleVar() for _ in self.entries]
-
-        for i, text in enumerate(["Bag", "Mushroom", "Variant", "Created At", "Passed", "Action", "Yield"]):
-            _place_label(self.frame, text=text, row=0, column=i)
-
-        for i, _ in enumerate(self.entries):
-            _place_label(self.frame, text=str(self.entries[i].experiment), row=i + 1, column=0, padx=5)
-            _place_label(self.frame, text=self.entries[i].experiment.mushroom, row=i + 1, column=1, padx=5)
-            _place_label(self.frame, text=self.entries[i].experiment.variant, row=i + 1, column=2, padx=5)
-            _place_label(self.frame,
-                         text=self.entries[i].experiment.created_at.strftime("%Y-%m-%d"),
-                         row=i + 1, column=3, padx=5)
-            _place_checkbox(self.frame, self.check_results[i], row=i + 1, column=4, padx=5)
-            _place_selection(self.frame, values=action_values, variable=self.actions[i], row=i + 1, column=5, padx=5)
-            _place_entry(self.frame, variable=self.harvested[i], row=i + 1, column=6, padx=5)
-
+        bags = self.database.get_current_bags(observed_at, *self.scope())
+        self.entries = self.database.get_observations("bags", bags, observed_at)
+        self.check_results = [tk.IntVar(self, value=e.passed) for e in self.entries]
+        self.actions = [tk.StringVar(value=e.action or "") for e in self.entries]
+        self.harvested = [tk.DoubleVar(value=e.harvested or 0.0) for e in self.entries]
+
+        with tracing.phase("render", rows=len(self.entries)):
+            self.place_headers(["Bag", "Mushroom", "Variant", "Created At", "Passed", "Action", "Yield"])
+
+            for i, _ in enumerate(self.entries):
+                self.rows.append([
+                    _place_label(self.frame, text=str(self.entries[i].experiment), row=i + 1, column=0, padx=5),
+                    _place_label(self.frame, text=self.entries[i].experiment.mushroom, row=i + 1, column=1, padx=5),
+                    _place_label(self.frame, text=self.entries[i].experiment.variant, row=i + 1, column=2, padx=5),
+                    _place_label(self.frame,
+                                 text=self.entries[i].experiment.created_at.strftime("%Y-%m-%d"),
+                                 row=i + 1, column=3, padx=5),
+                    _place_checkbox(self.frame, self.check_results[i], row=i + 1, column=4, padx=5),
+                    _place_selection(self.frame, values=action_values, variable=self.actions[i], row=i + 1,
+                                     column=5, padx=5),
+                    _place_entry(self.frame, variable=self.harvested[i], row=i + 1, column=6, padx=5)])
+        self.place_photo_buttons(column=7)
+        recipes = self.database.get_recipes_by_id({bag.recipe_id for bag in bags})
+        self.build_index([recipes[bag.recipe_id].name if bag.recipe_id in recipes else "" for bag in bags])
+
+    @tracing.traced
     def confirm(self):
         try:
             observed_at = self.observed_at.get()
@@ -570,7 +829,7 @@ class InspectBagPanel(InspectPanel):
                 entry.observed_at = observed_at
                 entry.harvested = harvested.get()
 
-            self.database.write(self.entries)
+            self.database.write(Inspection(self.experiment_type, observed_at, self.entries, *self.scope()))
             messagebox.showinfo("", "Observations written to database.",
                                 parent=self)
         except Exception as e:
@@ -579,52 +838,176 @@ class InspectBagPanel(InspectPanel):
 
 
 class InspectGrainSpawnPanel(InspectPanel):
-    def __init__(self, parent, title, database, observed_at, width=None):
-        super().__init__(parent, title, database, observed_at, width)
+    experiment_type = "grain_spawn"
+
+    def __init__(self, parent, title, database, observed_at, width=None, photo_store=None, location=None):
+        super().__init__(parent, title, database, observed_at, width, photo_store, location)
 
+    @tracing.traced
     def populate(self):
         self.clear()
         obs = self.observed_at.get()
         action_values = ['', 'Created', 'Inoculated', 'Shaken', 'Destroyed', 'Used']
-        self.entries = [GrainSpawnObservation(g, obs, False, "") for g in self.database.get_current_grain_spawn(obs)]
-        self.check_results = [tk.IntVar(self, value=0) for _ in self.entries]
-        self.actions = [tk.StringVar(value="") for _ in self.entries]
-
-        for i, text in enumerate(["Grain Spawn", "Mushroom", "Variant", "Created At", "Passed", "Action"]):
-            _place_label(self.frame, text=text, row=0, column=i)
-
-        for i, _ in enumerate(self.entries):
-            _place_label(self.frame, text=str(self.entries[i].experiment), row=i + 1, column=0, padx=5)
-            _place_label(self.frame, text=self.entries[i].experiment.mushroom, row=i + 1, column=1, padx=5)
-            _place_label(self.frame, text=self.entries[i].experiment.variant, row=i + 1, column=2, padx=5)
-            _place_label(self.frame, text=self.entries[i].experiment.created_at.strftime("%Y-%m-%d"),
-                         row=i + 1, column=3, padx=5)
-            _place_checkbox(self.frame, self.check_results[i], row=i + 1, column=4, padx=5)
-            _place_selection(self.frame, values=action_values, variable=self.actions[i], row=i + 1, column=5, padx=5)
+        grain_spawn = self.database.get_current_grain_spawn(obs, *self.scope())
+        self.entries = self.database.get_observations("grain_spawn", grain_spawn, obs)
+        self.check_results = [tk.IntVar(self, value=e.passed) for e in self.entries]
+        self.actions = [tk.StringVar(value=e.action or "") for e in self.entries]
+
+        with tracing.phase("render", rows=len(self.entries)):
+            self.place_headers(["Grain Spawn", "Mushroom", "Variant", "Created At", "Passed", "Action"])
+
+            for i, _ in enumerate(self.entries):
+                self.rows.append([
+                    _place_label(self.frame, text=str(self.entries[i].experiment), row=i + 1, column=0, padx=5),
+                    _place_label(self.frame, text=self.entries[i].experiment.mushroom, row=i + 1, column=1, padx=5),
+                    _place_label(self.frame, text=self.entries[i].experiment.variant, row=i + 1, column=2, padx=5),
+                    _place_label(self.frame, text=self.entries[i].experiment.created_at.strftime("%Y-%m-%d"),
+                                 row=i + 1, column=3, padx=5),
+                    _place_checkbox(self.frame, self.check_results[i], row=i + 1, column=4, padx=5),
+                    _place_selection(self.frame, values=action_values, variable=self.actions[i], row=i + 1,
+                                     column=5, padx=5)])
+        self.place_photo_buttons(column=6)
+        recipes = self.database.get_recipes_by_id({spawn.recipe_id for spawn in grain_spawn})
+        self.build_index([recipes[spawn.recipe_id].name if spawn.recipe_id in recipes else ""
+                          for spawn in grain_spawn])
 
 
 class InspectCulturePanel(InspectPanel):
-    def __init__(self, parent, title, database, observed_at, width=None):
-        super().__init__(parent, title, database, observed_at, width)
+    experiment_type = "cultures"
+    group_label = "Medium"
+    sort_columns = {"Mushroom": "mushroom", "Variant": "variant", "Medium": "group"}
 
+    def __init__(self, parent, title, database, observed_at, width=None, photo_store=None, location=None):
+        super().__init__(parent, title, database, observed_at, width, photo_store, location)
+
+    @tracing.traced
     def populate(self):
         self.clear()
         obs = self.observed_at.get()
         action_values = ['', 'Created', 'Destroyed']
-        self.entries = [CultureObservation(c, obs, True, "") for c in self.database.get_current_cultures(obs)]
-        self.check_results = [tk.IntVar(self, value=1) for _ in self.entries]
-        self.actions = [tk.StringVar(value="") for _ in self.entries]
-
-        for i, text in enumerate(["Culture", "Mushroom", "Variant", "Medium", "Passed"]):
-            _place_label(self.frame, text=text, row=0, column=i)
-#
-        for i, _ in enumerate(self.entries):
-            _place_label(self.frame, text=str(self.entries[i].experiment.name), row=i+1, column=0, padx=5)
-            _place_label(self.frame, text=self.entries[i].experiment.mushroom, row=i+1, column=1, padx=5)
-            _place_label(self.frame, text=self.entries[i].experiment.variant, row=i+1, column=2, padx=5)
-            _place_label(self.frame, text=self.entries[i].experiment.medium, row=i+1, column=3, padx=5)
-            _place_checkbox(self.frame, self.check_results[i], row=i+1, column=4, padx=5)
-            _place_selection(self.frame, values=action_values, variable=self.actions[i], row=i+1, column=5, padx=5)
+        cultures = self.database.get_current_cultures(obs, *self.scope())
+        self.entries = self.database.get_observations("cultures", cultures, obs, passed=True)
+        self.check_results = [tk.IntVar(self, value=e.passed) for e in self.entries]
+        self.actions = [tk.StringVar(value=e.action or "") for e in self.entries]
+
+        with tracing.phase("render", rows=len(self.entries)):
+            self.place_headers(["Culture", "Mushroom", "Variant", "Medium", "Passed"])
+
+            for i, _ in enumerate(self.entries):
+                self.rows.append([
+                    _place_label(self.frame, text=str(self.entries[i].experiment.name), row=i+1, column=0, padx=5),
+                    _place_label(self.frame, text=self.entries[i].experiment.mushroom, row=i+1, column=1, padx=5),
+                    _place_label(self.frame, text=self.entries[i].experiment.variant, row=i+1, column=2, padx=5),
+                    _place_label(self.frame, text=self.entries[i].experiment.medium, row=i+1, column=3, padx=5),
+                    _place_checkbox(self.frame, self.check_results[i], row=i+1, column=4, padx=5),
+                    _place_selection(self.frame, values=action_values, variable=self.actions[i], row=i+1, column=5,
+                                     padx=5)])
+        self.place_photo_buttons(column=6)
+        self.build_index([culture.medium for culture in cultures])
+
+
+class DuePanel(tk.Frame):
+    columns = ("Due", "Deadline", "Action")
+
+    def __init__(self, parent, scheduler, observed_at):
+        super().__init__(parent)
+        self.scheduler = scheduler
+        self.observed_at = observed_at
+
+        self.view = ttk.Treeview(self, columns=self.columns)
+        self.view.heading("#0", text="Experiment")
+        for column in self.columns:
+            self.view.heading(column, text=column)
+        self.view.tag_configure("overdue", foreground="red")
+        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.view.yview)
+        self.view.configure(yscrollcommand=scrollbar.set)
+        self.view.grid(row=0, column=0, sticky="news")
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.populate()
+
+    @tracing.traced
+    def populate(self):
+        today = datetime.strptime(self.observed_at.get(), "%Y-%m-%d").date()
+        self.view.delete(*self.view.get_children())
+        for task in self.scheduler.due(today):
+            self.view.insert("", tk.END, text=task.name, values=(task.due, task.deadline, task.action),
+                             tags=("overdue",) if task.overdue(today) else ())
+
+
+class LocationSelector(ttk.LabelFrame):
+    everywhere = "All"
+
+    def __init__(self, parent, database, command=None):
+        super().__init__(parent, text="Location")
+        self.database = database
+        self.command = command
+        self.locations = []
+        self.site = tk.StringVar(value=self.everywhere)
+        self.room = tk.StringVar(value=self.everywhere)
+
+        _place_label(self, "Site:", row=0, column=0, sticky="news")
+        self.site_widget = _place_selection(self, [], self.site, row=0, column=1, sticky="news")
+        _place_label(self, "Room:", row=1, column=0, sticky="news")
+        self.room_widget = _place_selection(self, [], self.room, row=1, column=1, sticky="news")
+        _place_button(self, "Add Location", self.add_location, row=2, column=0, columnspan=2, pady=5)
+        self.load()
+
+        self.site.trace_add("write", self.on_site_change)
+        self.room.trace_add("write", self.on_room_change)
+
+    def load(self):
+        self.locations = self.database.get_locations()
+        self.site_widget.config(values=[self.everywhere] + sorted({loc.site for loc in self.locations}))
+        self.update_rooms()
+
+    def update_rooms(self):
+        rooms = sorted({loc.room for loc in self.locations if loc.site == self.site.get() and loc.room})
+        self.room_widget.config(values=[self.everywhere] + rooms)
+
+    def on_site_change(self, var, index, mode):
+        self.update_rooms()
+        # setting the room reloads the panels
+        self.room.set(self.everywhere)
+
+    def on_room_change(self, var, index, mode):
+        if self.command is not None:
+            self.command()
+
+    def scope(self):
+        site, room = self.site.get(), self.room.get()
+        return (None if site == self.everywhere else site), (None if room == self.everywhere else room)
+
+    def get_location_id(self):
+        # the location of the selected room, or of the site without a room; added if it was only typed in
+        site, room = self.scope()
+        if site is None:
+            return None
+        location = Location(None, site, room or "")
+        key = (location.site, location.room, location.rack)
+        if not any((loc.site, loc.room, loc.rack) == key for loc in self.locations):
+            self.database.write(location)
+            self.load()
+        return next(loc.id for loc in self.locations if (loc.site, loc.room, loc.rack) == key)
+
+    def add_location(self):
+        def write_location():
+            try:
+                self.database.write(Location(None, site_var.get(), room_var.get(), rack_var.get()))
+            except (AssertionError, sqlite3.DatabaseError) as e:
+                messagebox.showerror("Error", e, parent=popup)
+                return
+            self.load()
+            popup.destroy()
+
+        popup = _create_popup(self)
+        popup.title("Add Location")
+        site_var, room_var, rack_var = tk.StringVar(value=self.scope()[0] or ""), tk.StringVar(), tk.StringVar()
+        for row, (text, variable) in enumerate((("Site:", site_var), ("Room:", room_var), ("Rack:", rack_var))):
+            _place_label(popup, text, row=row, column=0, sticky="news")
+            _place_entry(popup, variable, row=row, column=1, sticky="news")
+        _place_button(popup, "Okay", write_location, row=3, column=0, columnspan=2, pady=5)
 
 
 class LabTab(tk.Frame):
@@ -633,18 +1016,33 @@ class LabTab(tk.Frame):
 
         observed_at = tk.StringVar(value=date.today().strftime("%Y-%m-%d"))
 
-        create_panel = CreatePanel(self, database, observed_at)
+        # the panels only load the experiments of the selected site and room
+        self.location = LocationSelector(self, database, command=lambda: self.update_contents(None, None, None))
+        self.location.grid(row=1, column=0, sticky="new", padx=5, pady=5)
+        create_panel = CreatePanel(self, database, observed_at, location=self.location)
         self.notebook = ttk.Notebook(self)
 
+        self.photo_store = PhotoStore(database)
         self.inspect_bag_panel = InspectBagPanel(self.notebook,
-                                                 "Inspect Bags", database, observed_at, width=700)
+                                                 "Inspect Bags", database, observed_at, width=700,
+                                                 photo_store=self.photo_store, location=self.location)
         self.inspect_grain_spawn_panel = InspectGrainSpawnPanel(self.notebook,
-                                                                "Inspect Grain Spawn", database, observed_at, width=700)
+                                                                "Inspect Grain Spawn", database, observed_at, width=700,
+                                                                photo_store=self.photo_store, location=self.location)
         self.inspect_culture_panel = InspectCulturePanel(self.notebook,
-                                                         "Inspect Cultures", database, observed_at, width=700)
-
-        for tab, lab in zip([self.inspect_bag_panel, self.inspect_grain_spawn_panel, self.inspect_culture_panel],
-                            ["Bags", "Grain Spawn", "Cultures"]):
+                                                         "Inspect Cultures", database, observed_at, width=700,
+                                                         photo_store=self.photo_store, location=self.location)
+
+        # the scheduler follows the writes of a local database, against a server it is reloaded instead
+        self.scheduler = Scheduler(database)
+        self.scheduler.load(observed_at.get())
+        self.due_panel = DuePanel(self.notebook, self.scheduler, observed_at)
+        if isinstance(database, Database):
+            database.add_listener(self.on_write)
+
+        for tab, lab in zip([self.due_panel, self.inspect_bag_panel, self.inspect_grain_spawn_panel,
+                             self.inspect_culture_panel],
+                            ["Due", "Bags", "Grain Spawn", "Cultures"]):
             self.notebook.add(tab, text=lab)
 
         create_panel.grid(row=0, column=1, sticky="ews")
@@ -656,17 +1054,133 @@ class LabTab(tk.Frame):
             self.grid_rowconfigure(i, weight=1)
         observed_at.trace_add("write", self.update_contents)
 
+    @tracing.traced
     def update_contents(self, var, index, mode):
         self.inspect_culture_panel.populate()
         self.inspect_grain_spawn_panel.populate()
         self.inspect_bag_panel.populate()
+        if not isinstance(self.scheduler.database, Database):
+            self.scheduler.load(self.due_panel.observed_at.get())
+        self.due_panel.populate()
+
+    def on_write(self, obj):
+        self.scheduler.on_write(obj)
+        self.due_panel.populate()
 
 
 class FinanceTab(tk.Frame):
+    links = {
+        "Recipe": None,
+        "Culture": "cultures",
+        "Grain Spawn": "grain_spawn",
+        "Bag": "bags",
+        "Batch of Cultures": "cultures",
+        "Batch of Grain Spawn": "grain_spawn",
+        "Batch of Bags": "bags",
+    }
+    columns = ("Cost", "Bags", "Harvested", "Cost / Bag", "Cost / kg")
+
     def __init__(self, parent, database):
         super().__init__(parent)
         self.database = database
 
+        self.booked_at = tk.StringVar(value=date.today().strftime("%Y-%m-%d"))
+        self.category = tk.StringVar(value="Substrate")
+        self.amount = tk.DoubleVar(value=0.0)
+        self.description = tk.StringVar()
+        self.link = tk.StringVar(value="Recipe")
+        self.target = tk.StringVar()
+        self.targets = {}
+
+        entry_frame = _place_labelframe(self, "Book Cost", row=0, column=0, sticky="nw", padx=5, pady=5)
+        _place_label(entry_frame, "Booked At:", row=0, column=0, sticky="news")
+        booked_at_widget = DateEntry(entry_frame, date_pattern='y-mm-dd', textvariable=self.booked_at)
+        booked_at_widget.grid(row=0, column=1, sticky="news")
+        _place_label(entry_frame, "Category:", row=1, column=0, sticky="news")
+        _place_selection(entry_frame, ["Substrate", "Grain", "Agar", "Labour", "Other"], self.category,
+                         row=1, column=1, sticky="news")
+        _place_label(entry_frame, "Amount:", row=2, column=0, sticky="news")
+        _place_entry(entry_frame, self.amount, row=2, column=1, sticky="news")
+        _place_label(entry_frame, "Booked On:", row=3, column=0, sticky="news")
+        _place_selection(entry_frame, list(self.links), self.link, row=3, column=1, sticky="news")
+        _place_label(entry_frame, "", row=4, column=0, sticky="news")
+        self.target_widget = _place_selection(entry_frame, [], self.target, row=4, column=1, sticky="news")
+        _place_label(entry_frame, "Description:", row=5, column=0, sticky="news")
+        _place_entry(entry_frame, self.description, row=5, column=1, sticky="news")
+        _place_button(entry_frame, "Book", self.book, row=6, column=0, columnspan=2, pady=5)
+
+        self.strain_view = self._place_economics(self, "Per Strain", row=0, column=1)
+        self.recipe_view = self._place_economics(self, "Per Recipe", row=1, column=1)
+
+        self.columnconfigure(1, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self.link.trace_add("write", self.update_targets)
+        self.booked_at.trace_add("write", self.update_targets)
+        self.update_targets()
+        self.update_economics()
+
+    def _place_economics(self, parent, text, row, column):
+        frame = _place_labelframe(parent, text, row=row, column=column, sticky="news", padx=5, pady=5)
+        view = ttk.Treeview(frame, columns=self.columns)
+        view.heading("#0", text=text.split()[-1])
+        for column_name in self.columns:
+            view.heading(column_name, text=column_name)
+            view.column(column_name, anchor="e", width=90)
+        view.pack(fill="both", expand=True)
+        return view
+
+    def update_targets(self, *args):
+        # recipes by name, experiments alive at the booking date by name, batches by their creation date
+        link = self.link.get()
+        booked_at = self.booked_at.get()
+        if link == "Recipe":
+            self.targets = self.database.get_recipes()
+        elif link.startswith("Batch"):
+            self.targets = {booked_at: booked_at}
+        elif self.links[link] == "cultures":
+            self.targets = {str(c): c for c in self.database.get_current_cultures(booked_at)}
+        elif self.links[link] == "grain_spawn":
+            self.targets = {str(g): g for g in self.database.get_current_grain_spawn(booked_at)}
+        else:
+            self.targets = {str(b): b for b in self.database.get_current_bags(booked_at)}
+        self.target_widget["values"] = list(self.targets)
+        self.target.set(next(iter(self.targets), ""))
+
+    @tracing.traced
+    def book(self):
+        link = self.link.get()
+        try:
+            target = self.targets[self.target.get()]
+            cost_entry = CostEntry(self.booked_at.get(), self.category.get(), self.amount.get(),
+                                   self.description.get() or None)
+            if link == "Recipe":
+                cost_entry.recipe_id = target.id
+            elif link.startswith("Batch"):
+                cost_entry.batch_type = self.links[link]
+                cost_entry.batch_created_at = target
+            else:
+                setattr(cost_entry, {"cultures": "culture_id", "grain_spawn": "grain_spawn_id",
+                                     "bags": "bag_id"}[self.links[link]], target.id)
+            self.database.write(cost_entry)
+        except (KeyError, AssertionError, tk.TclError, sqlite3.DatabaseError) as e:
+            messagebox.showerror("Error", str(e) or "Nothing selected to book the cost on.", parent=self)
+            return
+        self.amount.set(0.0)
+        self.description.set("")
+        self.update_economics()
+
+    @tracing.traced
+    def update_economics(self):
+        for view, by in ((self.strain_view, "strain"), (self.recipe_view, "recipe")):
+            view.delete(*view.get_children())
+            for label, cost, n_bags, harvested, cost_per_bag, cost_per_kg in self.database.get_unit_economics(by):
+                values = [f"{cost:.2f}", n_bags, f"{harvested:.2f}",
+                          "" if cost_per_bag is None else f"{cost_per_bag:.2f}",
+                          "" if cost_per_kg is None else f"{cost_per_kg:.2f}"]
+                view.insert("", tk.END, text=label, values=values)
+
 
 class HistoryTab(tk.Frame):
     def __init__(self, parent, database):
@@ -681,25 +1195,56 @@ class HistoryTab(tk.Frame):
         self.columnconfigure(0, weight=1)
         self.update_calendar()
 
+    @tracing.traced
     def update_calendar(self):
-        for (date, msg, action) in self.database.get_actions():
-            self.calendar.calevent_create(date=datetime.strptime(date, "%Y-%m-%d"), text=msg, tags=[action])
+        with self.database.snapshot():
+            actions = self.database.get_actions()
+        with tracing.phase("render", rows=len(actions)):
+            for (date, msg, action) in actions:
+                self.calendar.calevent_create(date=datetime.strptime(date, "%Y-%m-%d"), text=msg, tags=[action])
 
 
 class App(tk.Tk):
-    def __init__(self, *args, **kwargs):
+    flush_interval = 5 * 60 * 1000
+
+    def __init__(self, *args, database=None, trace=None, **kwargs):
         tk.Tk.__init__(self, *args, **kwargs)
         self._set_style()
         self.title("PyLabBook")
 
-        database = Database()
+        # with trace, interactions and main loop stalls are recorded and written to that file on exit
+        self.trace = trace
+        self.tracer = None
+        if trace is not None:
+            self.tracer = tracing.Tracer()
+            tracing.install(self.tracer)
+            self.tracer.start(self)
+
+        if database is None:
+            database = Database()
         database.connect()
         database.initialize_tables()
 
+        self.database = database
+        self.backup_scheduler = None
+        if isinstance(database, Database) and database.database_path != ":memory:":
+            self.backup_scheduler = BackupScheduler(database.database_path)
+            self.backup_scheduler.start()
+        self.maintenance_scheduler = None
+        if isinstance(database, Database) and database.database_path != ":memory:" and not database.working_copy:
+            # the working copy replaces the file on every flush, nothing else may write to the file meanwhile
+            self.maintenance_scheduler = MaintenanceScheduler(database.database_path)
+            database.add_listener(self.maintenance_scheduler.on_write)
+            self.maintenance_scheduler.start()
+        if isinstance(database, Database) and database.working_copy:
+            self.after(self.flush_interval, self.flush)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
         notebook = ttk.Notebook(self)
         lab_tab = LabTab(notebook, database)
         lab_tab.pack(fill="both", expand=True)
-        history_tab = HistoryTab(notebook, database)
+        # the history scans every observation, it reads on a connection of its own so writes never wait for it
+        history_tab = HistoryTab(notebook, database.reader())
         history_tab.pack(fill="both", expand=True)
         finance_tab = FinanceTab(notebook, database)
         finance_tab.pack(fill="both", expand=True)
@@ -709,6 +1254,23 @@ class App(tk.Tk):
 
         notebook.pack(expand=True, fill='both')
 
+    def flush(self):
+        self.database.flush()
+        self.after(self.flush_interval, self.flush)
+
+    def on_close(self):
+        if self.tracer is not None:
+            self.tracer.stop()
+            self.tracer.export(self.trace)
+        if self.backup_scheduler is not None:
+            self.backup_scheduler.stop()
+        if self.maintenance_scheduler is not None:
+            self.maintenance_scheduler.stop()
+        if isinstance(self.database, Database):
+            self.database.optimize()
+            self.database.flush()
+        self.destroy()
+
     def _set_style(self):
         self.style = ttk.Style(self)
         # Import the tcl file
@@ -718,5 +1280,21 @@ class App(tk.Tk):
 
 
 if __name__ == "__main__":
-    app = App()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", help="run against a lab server (see server.py), e.g. http://127.0.0.1:8765")
+    parser.add_argument("--sparse-observations", action="store_true",
+                        help="store one sweep per inspection and rows only for failures, actions and harvests")
+    parser.add_argument("--database", default=os.path.join("data", "pyLabBook.db"),
+                        help="database file, or :memory: for a throwaway database")
+    parser.add_argument("--working-copy", action="store_true",
+                        help="work on an in-memory copy of the database, written back every few minutes and on exit")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="record interactions and stalls, written as a Chrome trace to PATH on exit")
+    args = parser.parse_args()
+
+    if args.server:
+        app = App(database=RemoteDatabase(args.server), trace=args.trace)
+    else:
+        app = App(database=Database(args.database, sparse_observations=args.sparse_observations,
+                                    working_copy=args.working_copy), trace=args.trace)
     app.mainloop()
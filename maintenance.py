@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+
+from database import Database
+
+
+def format_stats(before, after):
+    # one line per metric, before and after
+    lines = [f"{'':16} {'before':>14} {'after':>14}"]
+    for name in ("file_bytes", "wal_bytes", "page_count", "freelist_count", "free_ratio", "unused_ratio",
+                 "scattered_ratio"):
+        if name not in before:
+            continue
+        if name.endswith("ratio"):
+            lines.append(f"{name:16} {before[name]:14.2%} {after[name]:14.2%}")
+        else:
+            lines.append(f"{name:16} {before[name]:14,d} {after[name]:14,d}")
+    return "\n".join(lines)
+
+
+class MaintenanceScheduler(threading.Thread):
+    """Once no write came in for a while, refreshes the planner's statistics and gives the database's free pages
+    back to the file system in bounded steps, stopping as soon as writes resume."""
+
+    def __init__(self, database_path, idle_after=120, interval=60, pages=256, pause=0.05, analyze_every=24 * 3600):
+        super().__init__(daemon=True)
+        self.database_path = database_path
+        self.idle_after = idle_after
+        self.interval = interval
+        self.pages = pages
+        self.pause = pause
+        self.analyze_every = analyze_every
+        self.stopped = threading.Event()
+        self.last_write = time.monotonic()
+        self.last_analyze = None
+        self.last_report = None
+        self.last_error = None
+
+    def on_write(self, obj):
+        # registered with Database.add_listener, every write puts the maintenance off
+        self.last_write = time.monotonic()
+
+    def idle(self):
+        return time.monotonic() - self.last_write >= self.idle_after
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.idle():
+                continue
+            try:
+                self.maintain()
+            except sqlite3.Error as e:
+                self.last_error = e
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.join(timeout)
+
+    def maintain(self):
+        # the storage stats before the first step and after the last one
+        analyze = self.last_analyze is None or time.monotonic() - self.last_analyze >= self.analyze_every
+        database = Database(self.database_path)
+        database.connect()
+        try:
+            before, after = database.maintain(self.pages, analyze)
+            if analyze:
+                self.last_analyze = time.monotonic()
+            # a step only holds the write lock briefly, the UI's writes get through in between
+            while after["freelist_count"] and after["auto_vacuum"] == 2 and self.idle():
+                if self.stopped.wait(self.pause):
+                    break
+                _, after = database.maintain(self.pages)
+        finally:
+            database.connection.close()
+        self.last_report = (before, after)
+        self.last_error = None
+        return before, after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze the lab book database and give its free pages back to "
+                                                 "the file system, and report its size and fragmentation.")
+    parser.add_argument("--database", default=os.path.join("data", "pyLabBook.db"))
+    parser.add_argument("--pages", type=int, default=256, help="free pages given back per step")
+    parser.add_argument("--steps", type=int, help="stop after this many steps, by default once nothing is free")
+    parser.add_argument("--no-analyze", action="store_true")
+    parser.add_argument("--detailed", action="store_true",
+                        help="also measure the unused space in pages and the scattered leaves, reads every page")
+    args = parser.parse_args()
+
+    database = Database(args.database)
+    database.connect()
+    before = database.get_storage_stats(args.detailed)
+    start = time.perf_counter()
+    # an existing file is switched to incremental auto-vacuum here, once
+    database.initialize_tables()
+    migrated = time.perf_counter()
+    _, after = database.maintain(args.pages, not args.no_analyze)
+    steps = 1
+    while after["freelist_count"] and (args.steps is None or steps < args.steps):
+        _, after = database.maintain(args.pages)
+        steps += 1
+    after = database.get_storage_stats(args.detailed)
+    elapsed = time.perf_counter() - migrated
+
+    print(format_stats(before, after))
+    print(f"Set up in {migrated - start:.2f} s, {steps} steps in {elapsed:.2f} s.")
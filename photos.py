@@ -0,0 +1,141 @@
+import os
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from datastructures import Photo
+from database import Database
+
+
+class PhotoStore:
+    """Keeps observation photos outside the database, named by the SHA-256 of their content, so every image is
+    stored once however often it is attached, and serves thumbnails from a memory and a disk cache."""
+
+    def __init__(self, database, directory=os.path.join("data", "photos"), thumbnail_size=(160, 160),
+                 disk_cache_size=2000, memory_cache_size=200, workers=2):
+        self.database = database
+        self.directory = directory
+        self.thumbnail_size = thumbnail_size
+        self.disk_cache_size = disk_cache_size
+        self.memory_cache_size = memory_cache_size
+        self.executor = ThreadPoolExecutor(workers)
+        self.memory_cache = collections.OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def path(self, digest, extension):
+        return os.path.join(self.directory, "objects", digest[:2], digest + extension)
+
+    def thumbnail_path(self, digest):
+        width, height = self.thumbnail_size
+        return os.path.join(self.directory, "thumbnails", f"{digest}-{width}x{height}.png")
+
+    def add(self, source):
+        digest = hashlib.sha256()
+        with open(source, "rb") as file:
+            while chunk := file.read(1 << 20):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(source)[1].lower()
+
+        path = self.path(digest, extension)
+        if not os.path.exists(path):
+            # copied under a temporary name first, a crash never leaves a truncated image under its hash
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(path))
+            os.close(descriptor)
+            shutil.copyfile(source, partial)
+            os.replace(partial, path)
+        return digest, extension
+
+    def attach(self, experiment_type, experiment_id, observed_at, source):
+        digest, extension = self.add(source)
+        photo = Photo(experiment_type, experiment_id, observed_at, digest, extension)
+        self.database.write(photo)
+        return photo
+
+    def thumbnail(self, photo):
+        # a future of the thumbnail as PNG bytes, already resolved when it is in the memory cache
+        with self.lock:
+            if photo.digest in self.memory_cache:
+                self.memory_cache.move_to_end(photo.digest)
+                future = Future()
+                future.set_result(self.memory_cache[photo.digest])
+                return future
+            if photo.digest not in self.pending:
+                self.pending[photo.digest] = self.executor.submit(self.__load_thumbnail, photo)
+            return self.pending[photo.digest]
+
+    def __load_thumbnail(self, photo):
+        path = self.thumbnail_path(photo.digest)
+        try:
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+                # the modification time orders the disk cache for eviction
+                os.utime(path)
+            except FileNotFoundError:
+                data = self.__render_thumbnail(photo, path)
+        except Exception:
+            with self.lock:
+                del self.pending[photo.digest]
+            raise
+
+        with self.lock:
+            self.memory_cache[photo.digest] = data
+            while len(self.memory_cache) > self.memory_cache_size:
+                self.memory_cache.popitem(last=False)
+            del self.pending[photo.digest]
+        return data
+
+    def __render_thumbnail(self, photo, path):
+        with Image.open(self.path(photo.digest, photo.extension)) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(self.thumbnail_size)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            descriptor, partial = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(descriptor, "wb") as file:
+                image.convert("RGB").save(file, "PNG")
+        os.replace(partial, path)
+        self.__evict()
+        with open(path, "rb") as file:
+            return file.read()
+
+    def __evict(self):
+        directory = os.path.dirname(self.thumbnail_path(""))
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".png")]
+        if len(entries) <= self.disk_cache_size:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.disk_cache_size]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Attach photos to an observation.")
+    parser.add_argument("experiment_type", choices=["cultures", "grain_spawn", "bags"])
+    parser.add_argument("experiment_id", type=int)
+    parser.add_argument("observed_at", help="date of the observation (YYYY-MM-DD)")
+    parser.add_argument("photos", nargs="+")
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+    store = PhotoStore(database)
+    for source in args.photos:
+        photo = store.attach(args.experiment_type, args.experiment_id, args.observed_at, source)
+        print(f"{source} -> {store.path(photo.digest, photo.extension)}")
+    store.close()
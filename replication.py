@@ -0,0 +1,87 @@
+import os
+import json
+import argparse
+
+from database import Database, CHANGE_LOG_TABLES
+
+
+class Replica:
+    """Applies the change log of a source database to a replica, idempotently and in sequence order."""
+
+    def __init__(self, database_path, source_name):
+        self.database = Database(database_path)
+        self.source_name = source_name
+
+    def connect(self):
+        self.database.connect()
+        self.database.initialize_tables()
+        sql = """
+        CREATE TABLE IF NOT EXISTS replication_state(
+            source TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL)"""
+        self.database.cursor.execute(sql)
+        self.database.connection.commit()
+
+    def get_seq(self):
+        sql = "SELECT seq FROM replication_state WHERE source = $source"
+        row = self.database.cursor.execute(sql, {"source": self.source_name}).fetchone()
+        return row[0] if row else 0
+
+    def apply(self, changes):
+        cursor = self.database.cursor
+        seq = self.get_seq()
+        try:
+            for seq, table, operation, row_data in changes:
+                row = json.loads(row_data)
+                if operation == "upsert":
+                    # rows are updated in place, a REPLACE would delete and insert them again and fire the insert
+                    # triggers that keep the finance rollups a second time
+                    keys = CHANGE_LOG_TABLES[table]
+                    updates = ", ".join(f"{c} = excluded.{c}" for c in row if c not in keys)
+                    sql = f"""
+                    INSERT INTO {table}({', '.join(row)})
+                    VALUES ({', '.join(f'${c}' for c in row)})
+                    ON CONFLICT ({', '.join(keys)}) DO {f'UPDATE SET {updates}' if updates else 'NOTHING'}"""
+                else:
+                    sql = f"DELETE FROM {table} WHERE {' AND '.join(f'{c} = ${c}' for c in CHANGE_LOG_TABLES[table])}"
+                cursor.execute(sql, row)
+
+            # the watermark moves in the same transaction as the rows, so re-running a batch is a no-op
+            sql = """
+            INSERT INTO replication_state(source, seq) VALUES ($source, $seq)
+            ON CONFLICT (source) DO UPDATE SET seq = excluded.seq"""
+            cursor.execute(sql, {"source": self.source_name, "seq": seq})
+            self.database.connection.commit()
+        except Exception:
+            # a batch is applied whole or not at all, a half-applied one would be committed with the next
+            self.database.connection.rollback()
+            raise
+        return seq
+
+
+def replicate(source_path, replica_path, batch_size=1000):
+    source = Database(source_path)
+    source.connect()
+    replica = Replica(replica_path, os.path.abspath(source_path))
+    replica.connect()
+
+    seq = replica.get_seq()
+    applied = 0
+    while changes := source.get_changes(seq, batch_size):
+        seq = replica.apply(changes)
+        applied += len(changes)
+
+    source.connection.close()
+    replica.database.connection.close()
+    return applied, seq
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ship new change log entries to a replica database.")
+    parser.add_argument("replica", help="path of the replica database, created if it does not exist")
+    parser.add_argument("--source", default=os.path.join("data", "pyLabBook.db"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    applied, seq = replicate(args.source, args.replica, args.batch_size)
+    print(f"Applied {applied} changes, replica is at sequence number {seq}.")
@@ -0,0 +1,165 @@
+import os
+import json
+import html
+import hashlib
+import argparse
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+from database import Database, REPORT_SECTIONS, REPORT_SECTION_TABLES
+
+# bump when the rendering changes, so cached sections are not reused
+RENDER_VERSION = 1
+
+SECTIONS = {
+    "inventory": ("Inventory", ("Experiments", "Created", "Closed", "Alive at End"), 3),
+    "yields": ("Yields", ("Strain", "Bags", "Flushes", "Harvested"), 3),
+    "losses": ("Losses", ("Experiments", "Strain", "Failed Inspections", "Destroyed"), 3),
+    "costs": ("Costs", ("Category", "Entries", "Amount"), 2),
+}
+
+_database = None
+
+
+def periods(first, last, seasonal=False):
+    # (name, start, end) of every month, or every quarter, between the months `first` and `last`
+    year, month = map(int, first.split("-"))
+    last_year, last_month = map(int, last.split("-"))
+    step = 3 if seasonal else 1
+    if seasonal:
+        month -= (month - 1) % 3
+    while (year, month) <= (last_year, last_month):
+        next_year, next_month = (year + 1, month + step - 12) if month + step > 12 else (year, month + step)
+        name = f"{year}-Q{(month - 1) // 3 + 1}" if seasonal else f"{year}-{month:02d}"
+        yield name, f"{year}-{month:02d}-01", f"{next_year}-{next_month:02d}-01"
+        year, month = next_year, next_month
+
+
+def bar_chart(labels, values, width=480, bar_height=18):
+    if not values:
+        return ""
+    label_width = 160
+    scale = (width - label_width - 60) / (max(values) or 1)
+    bars = []
+    for i, (label, value) in enumerate(zip(labels, values)):
+        y = i * (bar_height + 4)
+        bars.append(f'<text x="{label_width - 6}" y="{y + bar_height - 5}" text-anchor="end">{html.escape(label)}</text>'
+                    f'<rect x="{label_width}" y="{y}" width="{value * scale:.1f}" height="{bar_height}" '
+                    f'fill="#217346"/>'
+                    f'<text x="{label_width + value * scale + 4:.1f}" y="{y + bar_height - 5}">{value:.2f}</text>')
+    height = len(values) * (bar_height + 4)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'font-family="sans-serif" font-size="12">{"".join(bars)}</svg>')
+
+
+def render_section(section, rows):
+    title, columns, chart_column = SECTIONS[section]
+    if not rows:
+        return f"<h2>{title}</h2><p>Nothing recorded.</p>"
+    header = "".join(f"<th>{html.escape(c)}</th>" for c in columns)
+    body = "".join("<tr>" + "".join(f"<td>{v:.2f}</td>" if isinstance(v, float) else f"<td>{html.escape(str(v))}</td>"
+                                    for v in row) + "</tr>"
+                   for row in rows)
+    labels = [" ".join(str(v) for v in row[:chart_column] if isinstance(v, str)) or "-" for row in rows]
+    chart = bar_chart(labels, [float(row[chart_column] or 0) for row in rows])
+    return f"<h2>{title}</h2><table><tr>{header}</tr>{body}</table>{chart}"
+
+
+def _open_database(database_path, archive_directory):
+    # every worker process reads through a connection of its own
+    global _database
+    _database = Database(database_path, archive_directory)
+    _database.connect(read_only=True)
+    _database.connection.execute("PRAGMA query_only = 1")
+
+
+def watermark(watermarks, section, start, end):
+    # the last change to a row the section of the period may read: of the rows dated within the period, or
+    # before its end for the tables whose earlier rows count too
+    tables = REPORT_SECTION_TABLES[section]
+    return max((seq for (table, month), seq in watermarks.items()
+                if table in tables and (month is None or (start[:7] if tables[table] else "") <= month < end[:7])),
+               default=0)
+
+
+def section_path(cache_directory, database_path, period, section, seq):
+    name, start, end = period
+    key = [RENDER_VERSION, os.path.abspath(database_path), section, name, start, end, seq]
+    return os.path.join(cache_directory, f"{hashlib.sha256(json.dumps(key).encode()).hexdigest()}.html")
+
+
+def build_section(period, section, path):
+    name, start, end = period
+    with _database.snapshot():
+        rows = _database.get_report_section(section, start, end)
+
+    fragment = render_section(section, rows)
+    with open(path + ".partial", "w") as file:
+        file.write(fragment)
+    os.replace(path + ".partial", path)
+    return name, section, fragment
+
+
+def write_report(directory, name, fragments):
+    style = ("body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin:1em 0}"
+             "td,th{border:1px solid #ccc;padding:2px 8px;text-align:right}")
+    content = (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Lab Report {name}</title>"
+               f"<style>{style}</style></head><body><h1>Lab Report {name}</h1>"
+               f"{''.join(fragments[s] for s in SECTIONS)}</body></html>")
+    path = os.path.join(directory, f"{name}.html")
+    with open(path, "w") as file:
+        file.write(content)
+    return path
+
+
+def generate_reports(database_path, archive_directory, first, last, directory=os.path.join("data", "reports"),
+                     seasonal=False, workers=None):
+    cache_directory = os.path.join(directory, ".cache")
+    os.makedirs(cache_directory, exist_ok=True)
+    database = Database(database_path, archive_directory)
+    database.connect(read_only=True)
+    try:
+        watermarks = database.get_change_watermarks()
+    finally:
+        database.connection.close()
+
+    # a section is only queried and rendered again once a row it reads changed, the others come from the cache
+    reports, tasks, total = {}, [], 0
+    for period in periods(first, last, seasonal):
+        reports[period[0]] = {}
+        for section in REPORT_SECTIONS:
+            total += 1
+            path = section_path(cache_directory, database_path, period, section,
+                                watermark(watermarks, section, *period[1:]))
+            if os.path.exists(path):
+                with open(path) as file:
+                    reports[period[0]][section] = file.read()
+            else:
+                tasks.append((period, section, path))
+
+    if tasks:
+        with ProcessPoolExecutor(workers, initializer=_open_database,
+                                 initargs=(database_path, archive_directory)) as executor:
+            futures = [executor.submit(build_section, *task) for task in tasks]
+            for future in futures:
+                name, section, fragment = future.result()
+                reports[name][section] = fragment
+
+    paths = [write_report(directory, name, fragments) for name, fragments in reports.items()]
+    return paths, total - len(tasks), total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render monthly or seasonal lab reports as self-contained HTML.")
+    parser.add_argument("first", help="first month (YYYY-MM)")
+    parser.add_argument("last", nargs="?", default=date.today().strftime("%Y-%m"), help="last month (YYYY-MM)")
+    parser.add_argument("--seasonal", action="store_true", help="one report per quarter instead of per month")
+    parser.add_argument("--database", default=os.path.join("data", "pyLabBook.db"))
+    parser.add_argument("--archive-directory", default=os.path.join("data", "archive"))
+    parser.add_argument("--output", default=os.path.join("data", "reports"))
+    parser.add_argument("--workers", type=int, help="number of processes, defaults to the number of cores")
+    args = parser.parse_args()
+
+    paths, reused, total = generate_reports(args.database, args.archive_directory, args.first, args.last,
+                                            args.output, args.seasonal, args.workers)
+    print(f"Wrote {len(paths)} reports to {args.output}, {reused} of {total} sections were unchanged.")
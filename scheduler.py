@@ -0,0 +1,166 @@
+import heapq
+import argparse
+import itertools
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from datastructures import Culture, GrainSpawn, Bag, Observation, CultureObservation, GrainSpawnObservation, \
+    BagObservation, Inspection
+from database import Database
+
+EXPERIMENT_TYPES = {Culture: "cultures", GrainSpawn: "grain_spawn", Bag: "bags",
+                    CultureObservation: "cultures", GrainSpawnObservation: "grain_spawn", BagObservation: "bags"}
+CLOSING_ACTIONS = {"cultures": ("Destroyed",), "grain_spawn": ("Used", "Destroyed"),
+                   "bags": ("Harvested", "Destroyed")}
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+@dataclass(order=True)
+class Task:
+    due: date
+    deadline: date
+    experiment_type: str = field(compare=False)
+    experiment_id: int = field(compare=False)
+    name: str = field(compare=False)
+    action: str = field(compare=False)
+    rule_id: int = field(compare=False)
+
+    def overdue(self, today):
+        return self.deadline < today
+
+
+class Scheduler:
+    """Keeps the next due task of every rule and live experiment in a heap, updated from the database's writes."""
+
+    def __init__(self, database):
+        self.database = database
+        self.rules = {}
+        self.experiments = {}
+        self.tasks = {}
+        self.heap = []
+        self.counter = itertools.count()
+
+    def load(self, today=None):
+        # the only full read, every later change comes in through on_write
+        today = today or date.today().strftime("%Y-%m-%d")
+        self.rules = {}
+        for rule_id, experiment_type, recipe_id, action, start_after, repeat_every, window \
+                in self.database.get_schedule_rules():
+            self.rules.setdefault(experiment_type, []).append((rule_id, recipe_id, action, start_after, repeat_every,
+                                                               window))
+        self.experiments, self.tasks, self.heap = {}, {}, []
+        for experiment_type, experiments in (("cultures", self.database.get_current_cultures(today)),
+                                             ("grain_spawn", self.database.get_current_grain_spawn(today)),
+                                             ("bags", self.database.get_current_bags(today))):
+            self.add_experiments(experiment_type, experiments)
+
+    def add_experiments(self, experiment_type, experiments):
+        last = {}
+        for (id_, action), observed_at in self.database.get_last_observations(experiment_type,
+                                                                              [e.id for e in experiments]).items():
+            last.setdefault(id_, {})[action] = _date(observed_at)
+        for experiment in experiments:
+            key = (experiment_type, experiment.id)
+            self.experiments[key] = {
+                "name": str(experiment),
+                "created_at": _date(experiment.created_at),
+                "recipe_id": getattr(experiment, "recipe_id", None),
+                "last": last.get(experiment.id, {}),
+            }
+            self.reschedule(key)
+
+    def reschedule(self, key):
+        experiment_type, experiment_id = key
+        experiment = self.experiments[key]
+        rules = self.rules.get(experiment_type, [])
+        # a rule for the experiment's recipe replaces the general rule for the same action
+        specific = {action for _, recipe_id, action, *_ in rules
+                    if recipe_id is not None and recipe_id == experiment["recipe_id"]}
+        for rule_id, recipe_id, action, start_after, repeat_every, window in rules:
+            if recipe_id is None and action in specific or recipe_id not in (None, experiment["recipe_id"]):
+                continue
+            last = experiment["last"].get(action)
+            if last is not None and repeat_every is None:
+                self.tasks.pop((*key, rule_id), None)
+                continue
+            due = last + timedelta(days=repeat_every) if last else experiment["created_at"] + \
+                timedelta(days=start_after)
+            task = Task(due, due + timedelta(days=window), experiment_type, experiment_id, experiment["name"],
+                        action, rule_id)
+            current = self.tasks.get((*key, rule_id))
+            if current is None or (current.due, current.deadline) != (task.due, task.deadline):
+                # replaced entries stay in the heap until they surface and are dropped as stale
+                self.tasks[(*key, rule_id)] = task
+                heapq.heappush(self.heap, (task, next(self.counter)))
+
+    def close(self, key):
+        self.experiments.pop(key, None)
+        for rule_id, *_ in self.rules.get(key[0], []):
+            self.tasks.pop((*key, rule_id), None)
+
+    def on_write(self, obj):
+        created = {}
+        for o in obj if isinstance(obj, list) else [obj]:
+            if isinstance(o, Inspection):
+                self.on_write(o.observations)
+            elif isinstance(o, Observation):
+                self.observe(o)
+            elif type(o) in EXPERIMENT_TYPES:
+                created.setdefault(EXPERIMENT_TYPES[type(o)], []).append(o.name)
+
+        # written experiments only carry their number of the day, their rows are looked up by name
+        for experiment_type, names in created.items():
+            ids = self.database.get_ids_by_name(experiment_type, names)
+            self.add_experiments(experiment_type, list(self.database.get_by_id(experiment_type, ids.values()).values()))
+
+    def observe(self, observation):
+        experiment_type = EXPERIMENT_TYPES[type(observation)]
+        key = (experiment_type, observation.experiment.id)
+        if key not in self.experiments:
+            return
+        if observation.action in CLOSING_ACTIONS[experiment_type]:
+            self.close(key)
+            return
+        observed_at = _date(observation.observed_at)
+        last = self.experiments[key]["last"]
+        for action in ("Inspect", observation.action) if observation.action else ("Inspect",):
+            last[action] = max(last.get(action, observed_at), observed_at)
+        self.reschedule(key)
+
+    def due(self, today=None):
+        # tasks due up to today, overdue ones included, in order of their due date
+        today = _date(today or date.today())
+        out, seen = [], []
+        while self.heap and self.heap[0][0].due <= today:
+            entry = heapq.heappop(self.heap)
+            task = entry[0]
+            if self.tasks.get((task.experiment_type, task.experiment_id, task.rule_id)) is task:
+                out.append(task)
+                seen.append(entry)
+        for entry in seen:
+            heapq.heappush(self.heap, entry)
+        return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the inspections and actions due today or overdue.")
+    parser.add_argument("--date", default=date.today().strftime("%Y-%m-%d"))
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+    scheduler = Scheduler(database)
+    scheduler.load(args.date)
+
+    today = _date(args.date)
+    for task in scheduler.due(today):
+        status = "overdue" if task.overdue(today) else ""
+        print(f"{task.due} {task.name:16} {task.action:12} {status}")
@@ -0,0 +1,62 @@
+import math
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from datastructures import SensorReading
+from database import Database
+
+
+def simulate_readings(locations, start, end, interval=timedelta(seconds=10), seed=0):
+    """Yields plausible grow room conditions: a daily temperature cycle, humidity and a CO2 random walk."""
+    generator = random.Random(seed)
+    co2 = {location: 800.0 for location in locations}
+    measured_at = start
+    while measured_at < end:
+        hour = measured_at.hour + measured_at.minute / 60
+        for i, location in enumerate(locations):
+            co2[location] = min(max(co2[location] + generator.gauss(0, 15), 400.0), 5000.0)
+            yield SensorReading(location=location,
+                                measured_at=measured_at,
+                                temperature=21 + i + 2 * math.sin((hour - 9) / 24 * 2 * math.pi)
+                                + generator.gauss(0, 0.2),
+                                humidity=min(85 + generator.gauss(0, 3), 100.0),
+                                co2=co2[location])
+        measured_at += interval
+
+
+def ingest(database, readings, batch_size=5000):
+    n = 0
+    batch = []
+    for reading in readings:
+        batch.append(reading)
+        if len(batch) == batch_size:
+            database.write_sensor_readings(batch)
+            n += len(batch)
+            batch = []
+    if batch:
+        database.write_sensor_readings(batch)
+        n += len(batch)
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feed simulated sensor readings into the lab book database.")
+    parser.add_argument("--locations", nargs="+", default=["Incubator", "Grow Room"])
+    parser.add_argument("--days", type=float, default=1.0)
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between readings")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    database = Database()
+    database.connect()
+    database.initialize_tables()
+
+    end = datetime.now().replace(microsecond=0)
+    readings = simulate_readings(args.locations, end - timedelta(days=args.days), end,
+                                 timedelta(seconds=args.interval))
+    start = time.perf_counter()
+    n = ingest(database, readings, args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"Ingested {n} readings in {elapsed:.2f}s ({n / elapsed:.0f} readings/s).")
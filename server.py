@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+import contextlib
+import dataclasses
+import http.client
+from datetime import datetime
+from urllib.parse import urlparse
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import tracing
+from datastructures import Recipe, Culture, GrainSpawn, Bag, Observation, CultureObservation, GrainSpawnObservation, \
+    BagObservation, Inspection, CostEntry, Photo, Location
+from database import Database
+
+READS = ("get_unique_mushrooms", "get_unique_recipe_names", "get_recipes", "get_recipes_page", "search_recipes",
+         "get_n", "get_current_bags", "get_current_bags_page", "get_current_grain_spawn",
+         "get_current_grain_spawn_page", "get_current_cultures", "get_current_cultures_page", "get_culture_by_id",
+         "get_cultures_by_id", "get_grain_spawn_by_id", "get_bags_by_id", "get_recipes_by_id",
+         "get_observations", "get_actions", "get_unit_economics", "get_by_id", "get_schedule_rules",
+         "get_last_observations", "get_ids_by_name", "get_photo_counts", "get_photos", "get_locations",
+         "get_failed_ids", "get_labels")
+
+TYPES = {cls.__name__: cls for cls in (Recipe, Culture, GrainSpawn, Bag,
+                                       CultureObservation, GrainSpawnObservation, BagObservation, Inspection,
+                                       CostEntry, Photo, Location)}
+
+
+def encode(obj):
+    if dataclasses.is_dataclass(obj):
+        return {"type": type(obj).__name__,
+                "fields": {f.name: encode(getattr(obj, f.name)) for f in dataclasses.fields(obj)}}
+    if isinstance(obj, dict):
+        return {"type": "dict", "items": [[encode(k), encode(v)] for k, v in obj.items()]}
+    if isinstance(obj, (list, tuple)):
+        return [encode(o) for o in obj]
+    if isinstance(obj, datetime):
+        return obj.strftime("%Y-%m-%d %H:%M:%S")
+    return obj
+
+
+def decode(obj):
+    if isinstance(obj, list):
+        return [decode(o) for o in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if obj["type"] == "dict":
+        # tuple keys come back as lists, which cannot be keys
+        return {tuple(k) if isinstance(k, list) else k: decode(v) for k, v in map(decode, obj["items"])}
+
+    cls = TYPES[obj["type"]]
+    fields = {k: decode(v) for k, v in obj["fields"].items()}
+    if issubclass(cls, Observation):
+        # observed_at and action are assigned after construction, the same way InspectPanel.confirm does it
+        observation = cls(**{**fields, "observed_at": None, "action": None})
+        observation.observed_at = fields["observed_at"]
+        observation.action = fields["action"]
+        return observation
+    return cls(**fields)
+
+
+class ConnectionPool:
+    def __init__(self, database_path, size=4):
+        self.connections = queue.Queue()
+        for _ in range(size):
+            # opened read-only like Database.reader(), so snapshots leave creating the archives to the writer
+            database = Database(database_path)
+            database.connect(read_only=True, check_same_thread=False)
+            database.connection.execute("PRAGMA query_only = 1")
+            self.connections.put(database)
+
+    @contextlib.contextmanager
+    def connection(self):
+        database = self.connections.get()
+        try:
+            yield database
+        finally:
+            self.connections.put(database)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().connection.close()
+
+
+class Writer(threading.Thread):
+    """Serializes all writes on one connection and commits concurrent requests together (group commit)."""
+
+    def __init__(self, database_path, max_batch=256, max_delay=0.002, sparse_observations=False):
+        super().__init__(daemon=True)
+        self.database = Database(database_path, sparse_observations=sparse_observations)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.requests = queue.Queue()
+        self.stopped = threading.Event()
+
+    def submit(self, obj):
+        future = Future()
+        self.requests.put((obj, future))
+        return future
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        self.database.connect()
+        while not (self.stopped.is_set() and self.requests.empty()):
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.requests.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self.commit(batch)
+        self.database.connection.close()
+
+    def commit(self, batch):
+        cursor = self.database.cursor
+        errors = []
+        cursor.execute("BEGIN")
+        for obj, future in batch:
+            # a savepoint per request keeps one failing request from rolling back the rest of the group
+            cursor.execute("SAVEPOINT request")
+            try:
+                self.database.write(obj, commit=False)
+                errors.append(None)
+            except Exception as e:
+                cursor.execute("ROLLBACK TO request")
+                errors.append(e)
+            cursor.execute("RELEASE request")
+
+        try:
+            self.database.connection.commit()
+        except sqlite3.Error as e:
+            self.database.connection.rollback()
+            errors = [e] * len(batch)
+
+        for (_, future), error in zip(batch, errors):
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if self.path != "/batch":
+            self.respond(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+
+        calls = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        try:
+            self.respond(200, {"results": self.server.execute(calls)})
+        except Exception as e:
+            self.respond(400, {"error": f"{type(e).__name__}: {e}"})
+
+    def respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LabServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, database_path, readers=4, max_batch=256, max_delay=0.002,
+                 sparse_observations=False):
+        database = Database(database_path)
+        database.connect()
+        database.connection.execute("PRAGMA journal_mode = WAL")
+        database.initialize_tables()
+        database.connection.close()
+
+        self.readers = ConnectionPool(database_path, readers)
+        self.writer = Writer(database_path, max_batch, max_delay, sparse_observations)
+        self.writer.start()
+        super().__init__(address, RequestHandler)
+
+    def execute(self, calls):
+        # the writes of a batch are committed together, before any of its reads run
+        writes = [decode(call["args"][0]) for call in calls if call["method"] == "write"]
+        if writes:
+            self.writer.submit(writes).result()
+
+        results = []
+        # the reads of a batch see one snapshot, however many writes other requests commit meanwhile
+        with self.readers.connection() as database, database.snapshot():
+            for call in calls:
+                if call["method"] == "write":
+                    results.append(None)
+                elif call["method"] in READS:
+                    results.append(encode(getattr(database, call["method"])(*decode(call["args"]))))
+                else:
+                    raise ValueError(f"Unknown method {call['method']}")
+        return results
+
+    def server_close(self):
+        super().server_close()
+        self.writer.stop()
+        self.readers.close()
+
+
+class RemoteDatabase:
+    """Client for a LabServer that stands in for Database in App."""
+
+    def __init__(self, url):
+        self.url = urlparse(url)
+        self.local = threading.local()
+
+    def connect(self):
+        pass
+
+    def initialize_tables(self):
+        pass
+
+    def reader(self):
+        # the server reads on connections of its own already
+        return self
+
+    @contextlib.contextmanager
+    def snapshot(self):
+        yield self
+
+    def batch(self, calls):
+        with tracing.phase("query", calls=len(calls)):
+            body = json.dumps([{"method": method, "args": encode(list(args))} for method, args in calls])
+            try:
+                response = self.__post(body)
+            except (ConnectionError, http.client.HTTPException):
+                # the server dropped the kept-alive connection, reconnect once
+                del self.local.connection
+                response = self.__post(body)
+
+            payload = json.loads(response.read())
+        if response.status != 200:
+            raise sqlite3.DatabaseError(payload["error"])
+        with tracing.phase("hydrate"):
+            return [decode(r) for r in payload["results"]]
+
+    def __post(self, body):
+        if not hasattr(self.local, "connection"):
+            self.local.connection = http.client.HTTPConnection(self.url.hostname, self.url.port)
+        self.local.connection.request("POST", "/batch", body, {"Content-Type": "application/json"})
+        return self.local.connection.getresponse()
+
+    def write(self, obj):
+        self.batch([("write", (obj,))])
+
+    def __getattr__(self, name):
+        if name not in READS:
+            raise AttributeError(name)
+        return lambda *args: self.batch([(name, args)])[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the lab book database over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database", default=os.path.join("data", "pyLabBook.db"))
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--sparse-observations", action="store_true")
+    args = parser.parse_args()
+
+    server = LabServer((args.host, args.port), args.database, args.readers,
+                       sparse_observations=args.sparse_observations)
+    print(f"Serving {args.database} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
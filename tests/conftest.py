@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from datastructures import Recipe, Culture, GrainSpawn, Bag, Location  # noqa: E402
+
+
+def add_lab(database, rooms=(("Farm", "r1"),), bags_per_room=2, created_at="2024-01-10"):
+    # one culture and grain spawn, and bags_per_room bags in each (site, room); returns the bags by room
+    database.write([Recipe(None, "Rye", "Grain Spawn", "rye, gypsum", "soak and boil"),
+                    Recipe(None, "CVG", "Substrate", "coir, vermiculite", "mix and pasteurize")])
+    database.write([Location(None, site, room) for site, room in rooms])
+    locations = {(loc.site, loc.room): loc.id for loc in database.get_locations()}
+    database.write(Culture("2024-01-01", 1, "Oyster", "Blue", "MEA"))
+    database.write(GrainSpawn("2024-01-05", 1, 1, 1))
+    bags, n = {}, 0
+    for site, room in rooms:
+        for _ in range(bags_per_room):
+            n += 1
+            bags.setdefault(room, []).append(Bag(created_at, n, 1, 2, "Oyster", "Blue", locations[(site, room)]))
+        database.write(bags[room])
+    return bags
+
+
+@pytest.fixture
+def database():
+    database = Database(":memory:")
+    database.connect()
+    database.initialize_tables()
+    yield database
+    database.connection.close()
+
+
+@pytest.fixture
+def file_database(tmp_path):
+    database = Database(str(tmp_path / "pyLabBook.db"), str(tmp_path / "archive"))
+    database.connect()
+    database.initialize_tables()
+    yield database
+    database.connection.close()
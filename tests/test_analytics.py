@@ -0,0 +1,26 @@
+import pytest
+
+from analytics import SurvivalAnalysis
+from conftest import add_lab
+from datastructures import Bag, BagObservation, Recipe
+
+
+def test_log_rank_counts_censored_experiments_at_risk_up_to_their_last_day(database):
+    cvg = add_lab(database, bags_per_room=3)["r1"]
+    database.write(Recipe(None, "Straw", "Substrate", "straw", "pasteurize"))
+    straw = [Bag("2024-01-10", n, 1, 3) for n in (4, 5, 6)]
+    database.write(straw)
+    # CVG: fails on day 3, harvested on day 5, fails on day 7; straw: fails on day 7, the others live on
+    database.write([BagObservation(cvg[0], "2024-01-13", False, "Destroyed"),
+                    BagObservation(cvg[1], "2024-01-15", True, "Harvested", 1.0),
+                    BagObservation(cvg[2], "2024-01-17", False, "Destroyed"),
+                    BagObservation(straw[1], "2024-01-17", False, "Destroyed")])
+
+    rows, statistic, df = SurvivalAnalysis(database).compare("bags", "recipe", "2024-01-20")
+    # day 3: 3 and 3 at risk, 1 failure; day 7: 1 and 3 at risk, the harvested bag is gone, 2 failures
+    expected = {"CVG": 3 / 6 + 1 * 2 / 4, "Straw": 3 / 6 + 3 * 2 / 4}
+    assert {group: (n, failures) for group, n, failures, *_ in rows} == {"CVG": (3, 2), "Straw": (3, 1)}
+    assert {group: e for group, *_, e in rows} == pytest.approx(expected)
+    # variance of the CVG failures: 1 * 5/5 * 3/6 * 3/6 on day 3, 2 * 2/3 * 1/4 * 3/4 on day 7
+    assert statistic == pytest.approx((2 - 1) ** 2 / (0.25 + 0.25))
+    assert df == 1
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+
+import pytest
+
+from conftest import add_lab
+from database import Database
+from datastructures import BagObservation
+
+
+def archive(database):
+    bags = add_lab(database, bags_per_room=2)["r1"]
+    database.write([BagObservation(bags[0], "2024-01-15", True, "Harvested", 1.25),
+                    BagObservation(bags[0], "2024-01-20", False, "Destroyed")])
+    assert database.archive_closed_experiments("2024-06-01") == {2024: 1}
+    return bags
+
+
+def test_reader_reads_the_archives(file_database):
+    bags = archive(file_database)
+    reader = file_database.reader()
+    with reader.snapshot():
+        assert [(bag_id, harvested) for bag_id, _, harvested in reader.get_harvests()] == [(bags[0].id, 1.25)]
+    assert reader.attached_years == {2024}
+
+
+def test_reader_skips_missing_archives(file_database):
+    bags = archive(file_database)
+    # an archive the writer has not created yet
+    file_database.cursor.execute("INSERT INTO archives(year, archived_until) VALUES (2023, '2023-12-31')")
+    file_database.connection.commit()
+    missing = file_database.archive_path(2023)
+    assert not os.path.exists(missing)
+
+    reader = file_database.reader()
+    with reader.snapshot():
+        assert [bag_id for bag_id, _, _ in reader.get_harvests()] == [bags[0].id]
+    assert reader.attached_years == {2024} and not os.path.exists(missing)
+
+    # once the writer has created it, the reader attaches it too
+    file_database.attach_archive(2023)
+    with reader.snapshot():
+        reader.get_harvests()
+    assert reader.attached_years == {2023, 2024}
+
+
+def test_reader_without_any_archive_file(file_database):
+    bags = add_lab(file_database, bags_per_room=1)["r1"]
+    file_database.write(BagObservation(bags[0], "2024-01-15", True, "Harvested", 2.5))
+    file_database.cursor.execute("INSERT INTO archives(year, archived_until) VALUES (2023, '2023-12-31')")
+    file_database.connection.commit()
+
+    reader = file_database.reader()
+    assert [harvested for _, _, harvested in reader.get_harvests()] == [2.5]
+    assert reader.attached_years == set() and not os.path.exists(file_database.archive_directory)
+
+
+def test_attaching_never_commits_pending_writes(file_database):
+    bags = archive(file_database)
+    writer = Database(file_database.database_path, file_database.archive_directory)
+    writer.connect()
+    writer.write(BagObservation(bags[1], "2024-01-21", False, "Destroyed"), commit=False)
+
+    # the read needs the archive, which cannot be attached without ending the open transaction
+    with pytest.raises(sqlite3.OperationalError, match="within a transaction"):
+        writer.get_harvests()
+    assert writer.connection.in_transaction
+    writer.connection.rollback()
+    assert writer.get_failed_ids("bags", [bags[1].id], "2024-01-21") == []
+    assert [bag_id for bag_id, _, _ in writer.get_harvests()] == [bags[0].id]
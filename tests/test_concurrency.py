@@ -0,0 +1,62 @@
+import time
+import threading
+from datetime import date
+
+import loadgen
+from database import Database
+
+
+def run_side_by_side(targets):
+    # runs the loops in threads of their own, and returns the exceptions they raised
+    errors = []
+
+    def run(target, *args):
+        try:
+            target(*args)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def snapshot_worker(reader, deadline, counts):
+    # two reads of one snapshot agree, however many writes commit between them
+    while time.monotonic() < deadline:
+        with reader.snapshot():
+            first, = reader.cursor.execute("SELECT count(*), sum(passed) FROM bag_observations").fetchall()
+            reader.get_actions()
+            second, = reader.cursor.execute("SELECT count(*), sum(passed) FROM bag_observations").fetchall()
+        counts.append((first, second))
+
+
+def test_writes_and_analytics_side_by_side(tmp_path):
+    database = Database(str(tmp_path / "loadgen.db"), str(tmp_path / "archive"))
+    database.connect(check_same_thread=False)
+    database.initialize_tables()
+    loadgen.seed(database, 50)
+    reader = database.reader(check_same_thread=False)
+    checker = database.reader(check_same_thread=False)
+
+    latencies = {"write": [], "analytics": []}
+    counts = []
+    deadline = time.monotonic() + 1.5
+    errors = run_side_by_side([(loadgen.worker, database, deadline, 1.0, latencies),
+                               (loadgen.analytics_worker, reader, deadline, latencies),
+                               (snapshot_worker, checker, deadline, counts)])
+
+    assert not errors, [str(e) for e in errors]
+    assert latencies["write"] and latencies["analytics"] and counts
+    assert all(first == second for first, second in counts)
+
+    # every write landed: one observation of today per bag that was written to, all of them passed
+    today = date.today().strftime("%Y-%m-%d")
+    rows, passed = database.cursor.execute("SELECT count(*), sum(passed) FROM bag_observations "
+                                           "WHERE observed_at = $today", {"today": today}).fetchone()
+    assert 0 < rows <= 50 and passed == rows
+    with reader.snapshot():
+        assert reader.cursor.execute("SELECT count(*) FROM bag_observations").fetchone() == (rows,)
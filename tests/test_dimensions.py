@@ -0,0 +1,22 @@
+from datastructures import Culture
+
+
+def change_log(database, table):
+    sql = "SELECT operation, json_extract(row_data, '$.culture_id') FROM change_log WHERE table_name = $table"
+    return database.cursor.execute(sql, {"table": table}).fetchall()
+
+
+def test_one_change_log_row_per_culture_insert(database):
+    database.write([Culture("2024-01-01", 1, "Oyster", "Blue", "MEA"),
+                    Culture("2024-01-02", 2, "Oyster", "Pink", "MEA")])
+    assert change_log(database, "cultures") == [("upsert", 1), ("upsert", 2)]
+    # the trigger still encoded both
+    keys = database.cursor.execute("SELECT mushroom_key, variant_key, medium_key FROM cultures").fetchall()
+    assert len(keys) == 2 and all(key is not None for row in keys for key in row)
+
+    # a database initialized again keeps logging each insert once, and real updates still count
+    database.initialize_tables()
+    database.write(Culture("2024-01-03", 3, "Lion's Mane", "White", "PDA"))
+    database.cursor.execute("UPDATE cultures SET variant = 'Golden' WHERE culture_id = 3")
+    database.cursor.execute("UPDATE cultures SET medium = medium WHERE culture_id = 1")
+    assert change_log(database, "cultures")[2:] == [("upsert", 3), ("upsert", 3)]
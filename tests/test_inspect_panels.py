@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("tkcalendar")
+import tkinter as tk  # noqa: E402
+
+import main  # noqa: E402
+from conftest import add_lab  # noqa: E402
+from datastructures import Bag  # noqa: E402
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    root.withdraw()
+    yield root
+    root.destroy()
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_mark_all_ok_with_a_filter_fails_no_hidden_row(root, database, monkeypatch, sparse):
+    monkeypatch.setattr(main.messagebox, "showinfo", lambda *args, **kwargs: None)
+    database.sparse_observations = sparse
+    bags = add_lab(database, bags_per_room=2)["r1"]
+    young = Bag("2024-01-15", 3, 1, 2, "Oyster", "Blue", bags[0].location_id)
+    database.write(young)
+
+    panel = main.InspectBagPanel(root, "Bags", database, tk.StringVar(root, value="2024-01-20"))
+    # only the bags at least a week old are shown
+    panel.min_age.set("7")
+    assert [panel.entries[i].experiment.id for i in panel.shown] == [b.id for b in bags]
+
+    panel.mark_all_ok()
+    panel.confirm()
+    ids = [b.id for b in bags] + [young.id]
+    assert database.get_failed_ids("bags", ids, "2024-01-20") == []
+    assert all(o.passed for o in database.get_observations("bags", bags + [young], "2024-01-20"))
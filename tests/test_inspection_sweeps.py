@@ -0,0 +1,46 @@
+from conftest import add_lab
+from datastructures import Inspection
+
+
+def confirm(database, date, site=None, room=None):
+    bags = database.get_current_bags(date, site, room)
+    observations = database.get_observations("bags", bags, date)
+    for observation in observations:
+        observation.passed = True
+    database.write(Inspection("bags", date, observations, site, room))
+
+
+def passed(database, date):
+    bags = database.get_current_bags(date)
+    return {o.experiment.id: o.passed for o in database.get_observations("bags", bags, date)}
+
+
+def test_sweep_of_a_room_only_covers_its_bags(database):
+    database.sparse_observations = True
+    bags = add_lab(database, rooms=(("Farm", "r1"), ("Farm", "r2")), bags_per_room=1)
+    confirm(database, "2024-01-20", "Farm", "r1")
+
+    r1, r2 = bags["r1"][0].id, bags["r2"][0].id
+    assert passed(database, "2024-01-20") == {r1: True, r2: False}
+    assert database.get_last_observations("bags", [r1, r2]) == {(r1, "Inspect"): "2024-01-20"}
+    assert database.cursor.execute("SELECT count(*) FROM bag_observations").fetchone() == (0,)
+
+
+def test_sweep_of_a_site_covers_its_rooms_but_not_other_sites(database):
+    database.sparse_observations = True
+    bags = add_lab(database, rooms=(("Farm", "r1"), ("Farm", "r2"), ("Shed", "")), bags_per_room=1)
+    confirm(database, "2024-01-20", "Farm")
+
+    assert passed(database, "2024-01-20") == {bags["r1"][0].id: True, bags["r2"][0].id: True, bags[""][0].id: False}
+
+
+def test_sweep_without_a_scope_covers_everything(database):
+    database.sparse_observations = True
+    bags = add_lab(database, rooms=(("Farm", "r1"), ("Shed", "")), bags_per_room=1)
+    confirm(database, "2024-01-20")
+    confirm(database, "2024-01-21", "Farm", "r1")
+
+    ids = [bags["r1"][0].id, bags[""][0].id]
+    assert all(passed(database, "2024-01-20").values())
+    assert database.get_last_observations("bags", ids) == {(ids[0], "Inspect"): "2024-01-21",
+                                                         (ids[1], "Inspect"): "2024-01-20"}
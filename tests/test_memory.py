@@ -0,0 +1,78 @@
+import os
+import sqlite3
+
+from conftest import add_lab
+from database import Database
+from datastructures import BagObservation
+
+
+def count(path, table):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_in_memory_database_leaves_nothing_on_disk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database = Database(":memory:")
+    database.connect()
+    database.initialize_tables()
+    bags = add_lab(database, bags_per_room=3)["r1"]
+    database.write(BagObservation(bags[0], "2024-01-20", False, "Destroyed"))
+
+    assert [b.id for b in database.get_current_bags("2024-01-21")] == [b.id for b in bags[1:]]
+    assert database.get_failed_ids("bags", [b.id for b in bags], "2024-01-20") == [bags[0].id]
+    # the one connection is also the reader, and snapshots work on it
+    assert database.reader() is database
+    with database.reader().snapshot():
+        assert len(database.get_current_bags("2024-01-15")) == 3
+    assert database.flush() is False
+    assert os.listdir(tmp_path) == []
+
+
+def test_in_memory_databases_are_separate():
+    first, second = Database(":memory:"), Database(":memory:")
+    for database in (first, second):
+        database.connect()
+        database.initialize_tables()
+    add_lab(first)
+    assert len(first.get_current_bags("2024-01-20")) == 2
+    assert second.get_current_bags("2024-01-20") == []
+
+
+def test_working_copy_is_written_back_by_flush(file_database):
+    path = file_database.database_path
+    add_lab(file_database, bags_per_room=2)
+    file_database.connection.close()
+
+    working_copy = Database(path, working_copy=True)
+    working_copy.connect()
+    working_copy.initialize_tables()
+    working_copy.flush()
+    bags = working_copy.get_current_bags("2024-01-20")
+    working_copy.write(BagObservation(bags[0], "2024-01-20", True, "Harvested", 2.5))
+
+    # the file only changes on flush, and a flush without changes does nothing
+    assert count(path, "bag_observations") == 0
+    assert working_copy.flush() is True
+    assert count(path, "bag_observations") == 1
+    assert working_copy.flush() is False
+    assert not os.path.exists(path + ".partial")
+
+    reopened = Database(path, working_copy=True)
+    reopened.connect()
+    assert [b.id for b in reopened.get_current_bags("2024-01-21")] == [bags[1].id]
+
+
+def test_working_copy_of_a_new_file(tmp_path):
+    path = str(tmp_path / "new" / "pyLabBook.db")
+    working_copy = Database(path, working_copy=True)
+    working_copy.connect()
+    working_copy.initialize_tables()
+    assert not os.path.exists(path)
+
+    add_lab(working_copy)
+    assert working_copy.flush() is True
+    assert count(path, "bags") == 2
@@ -0,0 +1,81 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from conftest import add_lab
+from database import Database
+from datastructures import BagObservation, CostEntry, Photo
+from replication import Replica, replicate
+
+
+def economics(database):
+    return database.cursor.execute("SELECT mushroom, variant, cost, n_bags, harvested FROM strain_economics "
+                                   "ORDER BY mushroom, variant").fetchall()
+
+
+def test_updates_are_applied_in_place(file_database, tmp_path):
+    bag = add_lab(file_database, bags_per_room=1)["r1"][0]
+    file_database.write(BagObservation(bag, "2024-02-01", True, None, 1.0))
+    replica_path = str(tmp_path / "replica.db")
+    replicate(file_database.database_path, replica_path)
+
+    # the flush was weighed again, the edit reaches the replica as an update of the same row
+    file_database.write(BagObservation(bag, "2024-02-01", True, None, 2.0))
+    replicate(file_database.database_path, replica_path)
+
+    replica = Database(replica_path)
+    replica.connect()
+    assert economics(replica) == economics(file_database)
+    assert economics(replica)[0][-1] == 2.0
+    replica.connection.close()
+
+
+def test_ledger_is_replicated(file_database, tmp_path):
+    bag = add_lab(file_database, bags_per_room=1)["r1"][0]
+    file_database.write([CostEntry("2024-01-10", "Substrate", 3.5, "coir", bag_id=bag.id),
+                         CostEntry("2024-01-10", "Labour", 10.0, batch_type="bags", batch_created_at="2024-01-10")])
+    replica_path = str(tmp_path / "replica.db")
+    replicate(file_database.database_path, replica_path)
+
+    replica = Database(replica_path)
+    replica.connect()
+    sql = "SELECT * FROM cost_entries ORDER BY cost_entry_id"
+    assert replica.cursor.execute(sql).fetchall() == file_database.cursor.execute(sql).fetchall()
+    assert economics(replica) == economics(file_database)
+    replica.connection.close()
+
+
+def test_photos_are_replicated(file_database, tmp_path):
+    bag = add_lab(file_database, bags_per_room=1)["r1"][0]
+    file_database.write(Photo("bags", bag.id, "2024-02-01", "ab" * 32, ".jpg"))
+    replica_path = str(tmp_path / "replica.db")
+    replicate(file_database.database_path, replica_path)
+
+    replica = Database(replica_path)
+    replica.connect()
+    assert replica.get_photos("bags", bag.id) == file_database.get_photos("bags", bag.id)
+    assert len(replica.get_photos("bags", bag.id)) == 1
+    replica.connection.close()
+
+
+def test_a_failing_batch_leaves_the_replica_unchanged(file_database, tmp_path):
+    add_lab(file_database, bags_per_room=2)
+    replica = Replica(str(tmp_path / "replica.db"), os.path.abspath(file_database.database_path))
+    replica.connect()
+    changes = file_database.get_changes(0, 1000)
+    seq = replica.apply(changes[:-2])
+
+    # the last change of the batch fails after the one before it was applied
+    broken = json.loads(changes[-1][3])
+    broken["colour"] = "blue"
+    with pytest.raises(sqlite3.OperationalError):
+        replica.apply(changes[-2:-1] + [(changes[-1][0], "bags", "upsert", json.dumps(broken))])
+    assert replica.get_seq() == seq
+    assert replica.database.cursor.execute("SELECT count(*) FROM bags").fetchone() == (0,)
+
+    # the next batch commits only its own rows
+    assert replica.apply(changes[-1:]) == changes[-1][0]
+    assert [bag_id for bag_id, in replica.database.cursor.execute("SELECT bag_id FROM bags")] == [2]
+    replica.database.connection.close()
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+import reports
+from conftest import add_lab
+from datastructures import BagObservation, CostEntry
+
+
+class NoPool:
+    def __init__(self, *args, **kwargs):
+        raise AssertionError("a section was queried again")
+
+
+def generate(database, tmp_path):
+    paths, reused, total = reports.generate_reports(database.database_path, database.archive_directory,
+                                                    "2024-01", "2024-03", str(tmp_path / "reports"), workers=1)
+    pages = {}
+    for path in paths:
+        with open(path) as file:
+            pages[os.path.basename(path)] = file.read()
+    return pages, reused, total
+
+
+@pytest.fixture
+def lab(file_database):
+    bags = add_lab(file_database, bags_per_room=2)["r1"]
+    file_database.write([BagObservation(bags[0], "2024-02-10", True, "Harvested", 1.25),
+                         CostEntry("2024-01-15", "Substrate", 12.0)])
+    return file_database, bags
+
+
+def test_unchanged_sections_are_not_queried_again(lab, tmp_path, monkeypatch):
+    database, _ = lab
+    first, reused, total = generate(database, tmp_path)
+    assert (reused, total) == (0, 12)
+    assert "1.25" in first["2024-02.html"] and "12.00" in first["2024-01.html"]
+
+    monkeypatch.setattr(reports, "ProcessPoolExecutor", NoPool)
+    second, reused, total = generate(database, tmp_path)
+    assert (reused, total) == (12, 12)
+    assert second == first
+
+
+def test_a_change_only_invalidates_the_sections_that_read_it(lab, tmp_path):
+    database, bags = lab
+    generate(database, tmp_path)
+
+    # a harvest in March: the sections of March reading bag observations are built again, nothing else
+    database.write(BagObservation(bags[1], "2024-03-05", True, "Harvested", 2.5))
+    pages, reused, total = generate(database, tmp_path)
+    assert (reused, total) == (12 - 3, 12)
+    assert "2.50" in pages["2024-03.html"] and "2.50" not in pages["2024-02.html"]
+
+    # a cost booked in January only touches the costs of January
+    database.write(CostEntry("2024-01-20", "Labour", 30.0))
+    pages, reused, total = generate(database, tmp_path)
+    assert (reused, total) == (12 - 1, 12)
+    assert "42.00" not in pages["2024-01.html"] and "30.00" in pages["2024-01.html"]
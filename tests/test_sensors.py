@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import sensors
+from conftest import add_lab
+from database import SENSOR_METRICS, SENSOR_RESOLUTIONS
+from datastructures import BagObservation
+
+LOCATIONS = ["Incubator", "Grow Room"]
+
+
+def readings(start="2024-01-10 22:00:00", hours=4, interval=timedelta(seconds=30)):
+    start = datetime.fromisoformat(start)
+    return list(sensors.simulate_readings(LOCATIONS, start, start + timedelta(hours=hours), interval))
+
+
+def expected_rollups(readings, resolution):
+    # {(location, bucket): {metric: (n, sum, min, max)}} computed from the readings directly
+    out = {}
+    for r in readings:
+        bucket = datetime.strptime(r.measured_at, "%Y-%m-%d %H:%M:%S").strftime(SENSOR_RESOLUTIONS[resolution])
+        metrics = out.setdefault((r.location, bucket), {m: [] for m in SENSOR_METRICS})
+        for m in SENSOR_METRICS:
+            metrics[m].append(getattr(r, m))
+    return {key: {m: (len(v), sum(v), min(v), max(v)) for m, v in metrics.items()} for key, metrics in out.items()}
+
+
+def stored_rollups(database, resolution):
+    columns = ", ".join(f"{m}_n, {m}_sum, {m}_min, {m}_max" for m in SENSOR_METRICS)
+    sql = f"SELECT location, bucket, {columns} FROM sensor_rollups WHERE resolution = $resolution"
+    out = {}
+    for location, bucket, *values in database.cursor.execute(sql, {"resolution": resolution}):
+        out[(location, bucket)] = {m: tuple(values[4 * i:4 * i + 4]) for i, m in enumerate(SENSOR_METRICS)}
+    return out
+
+
+def assert_rollups_match(database, readings):
+    for resolution in SENSOR_RESOLUTIONS:
+        expected, stored = expected_rollups(readings, resolution), stored_rollups(database, resolution)
+        assert stored.keys() == expected.keys()
+        for key, metrics in expected.items():
+            for m, (n, total, low, high) in metrics.items():
+                assert stored[key][m] == pytest.approx((n, total, low, high)), (resolution, key, m)
+
+
+def test_rollups_match_the_readings(database):
+    feed = readings()
+    # batches that end in the middle of a minute, an hour and the day
+    assert sensors.ingest(database, iter(feed), batch_size=97) == len(feed)
+    assert database.cursor.execute("SELECT count(*) FROM sensor_readings").fetchone() == (len(feed),)
+    assert_rollups_match(database, feed)
+
+
+def test_redelivered_readings_are_not_counted_twice(database):
+    feed = readings(hours=1)
+    sensors.ingest(database, iter(feed[:300]))
+    # the second delivery overlaps the first, and repeats readings within its own batches
+    sensors.ingest(database, iter(feed[200:] + feed[250:260]), batch_size=50)
+    assert database.cursor.execute("SELECT count(*) FROM sensor_readings").fetchone() == (len(feed),)
+    assert_rollups_match(database, feed)
+
+
+def test_series_are_averaged_per_bucket(database):
+    feed = readings()
+    sensors.ingest(database, iter(feed))
+    expected = expected_rollups(feed, "hour")
+
+    series = database.get_sensor_series("Grow Room", "2024-01-10 00:00:00", "2024-01-12 00:00:00", "hour")
+    assert [bucket for bucket, *_ in series] == sorted(b for location, b in expected if location == "Grow Room")
+    for bucket, *averages in series:
+        metrics = expected[("Grow Room", bucket)]
+        assert averages == pytest.approx([metrics[m][1] / metrics[m][0] for m in SENSOR_METRICS])
+
+    raw = database.get_sensor_series("Incubator", "2024-01-10 22:00:00", "2024-01-10 23:00:00")
+    assert len(raw) == 120
+    # longer ranges are read from the minute rollups
+    minutes = database.get_sensor_series("Incubator", "2024-01-10 12:00:00", "2024-01-11 12:00:00")
+    assert len(minutes) == 240 and minutes[0][0] == "2024-01-10 22:00:00"
+
+
+def test_bag_conditions_cover_the_bag_lifetime(database):
+    bags = add_lab(database, bags_per_room=2, created_at="2024-01-10")["r1"]
+    feed = readings(start="2024-01-09 00:00:00", hours=72, interval=timedelta(minutes=15))
+    sensors.ingest(database, iter(feed))
+    # the first bag is harvested the day it was made, the second one lives on past the last reading
+    database.write(BagObservation(bags[0], "2024-01-10", True, "Harvested", 1.5))
+
+    conditions = database.get_bag_conditions("Grow Room", [b.id for b in bags])
+    days = expected_rollups(feed, "day")
+    for bag, lifetime in ((bags[0], ["2024-01-10"]), (bags[1], ["2024-01-10", "2024-01-11"])):
+        n_days, *summary = conditions[bag.id]
+        assert n_days == len(lifetime)
+        for i, m in enumerate(SENSOR_METRICS):
+            n = sum(days[("Grow Room", day)][m][0] for day in lifetime)
+            total = sum(days[("Grow Room", day)][m][1] for day in lifetime)
+            low = min(days[("Grow Room", day)][m][2] for day in lifetime)
+            high = max(days[("Grow Room", day)][m][3] for day in lifetime)
+            assert summary[3 * i:3 * i + 3] == pytest.approx([total / n, low, high])
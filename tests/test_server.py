@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import add_lab
+from database import Database
+from datastructures import Bag, BagObservation, CostEntry
+from server import LabServer, RemoteDatabase, Writer
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = LabServer(("127.0.0.1", 0), str(tmp_path / "pyLabBook.db"), readers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def client(server):
+    return RemoteDatabase(f"http://127.0.0.1:{server.server_address[1]}")
+
+
+def test_reads_round_trip(client, tmp_path):
+    bags = add_lab(client, rooms=(("Farm", "r1"), ("Farm", "r2")), bags_per_room=2)
+
+    remote = client.get_current_bags("2024-01-20")
+    assert [(b.id, b.name, b.location_id) for b in remote] == [(b.id, b.name, b.location_id)
+                                                              for room in ("r1", "r2") for b in bags[room]]
+    assert [str(loc) for loc in client.get_locations()] == ["Farm / r1", "Farm / r2"]
+    assert [b.id for b in client.get_current_bags("2024-01-20", "Farm", "r2")] == [b.id for b in bags["r2"]]
+    assert client.get_ids_by_name("bags", [bags["r1"][0].name]) == {bags["r1"][0].name: bags["r1"][0].id}
+
+    # the server wrote to its file, a local connection sees the same rows
+    database = Database(str(tmp_path / "pyLabBook.db"))
+    database.connect()
+    assert len(database.get_current_bags("2024-01-20")) == 4
+    database.connection.close()
+
+
+def test_batch_writes_before_its_reads(client):
+    bag = add_lab(client, bags_per_room=1)["r1"][0]
+    observation = BagObservation(bag, None, False, "Destroyed")
+    observation.observed_at = "2024-01-20"
+
+    written, failed, observations = client.batch([
+        ("write", (observation,)),
+        ("get_failed_ids", ("bags", [bag.id], "2024-01-20")),
+        ("get_observations", ("bags", [bag], "2024-01-20")),
+    ])
+    assert written is None
+    assert failed == [bag.id]
+    assert (observations[0].passed, observations[0].action) == (False, "Destroyed")
+
+
+def test_failed_write_is_reported_and_rolled_back(client):
+    add_lab(client, bags_per_room=1)
+    with pytest.raises(sqlite3.DatabaseError, match="IntegrityError"):
+        client.write(Bag("2024-01-10", 1, 1, 2))
+    assert len(client.get_current_bags("2024-01-20")) == 1
+
+    with pytest.raises(AttributeError):
+        client.drop_tables()
+
+
+def test_reads_reach_into_the_archives(server, client, tmp_path, monkeypatch):
+    # the server's connections keep their archives in data/archive below the working directory
+    monkeypatch.chdir(tmp_path)
+    bags = add_lab(client, bags_per_room=2)["r1"]
+    client.write([BagObservation(bags[0], "2024-01-15", True, "Harvested", 1.25),
+                  BagObservation(bags[0], "2024-01-20", False, "Destroyed")])
+    database = Database(str(tmp_path / "pyLabBook.db"))
+    database.connect()
+    assert database.archive_closed_experiments("2024-06-01") == {2024: 1}
+    # and a year whose archive the server's readers cannot see yet
+    database.cursor.execute("INSERT INTO archives(year, archived_until) VALUES (2023, '2023-12-31')")
+    database.connection.commit()
+    database.connection.close()
+
+    assert [b.id for b in client.get_current_bags("2024-01-14")] == [b.id for b in bags]
+    assert [b.id for b in client.get_current_bags("2024-01-21")] == [bags[1].id]
+    assert not os.path.exists(database.archive_path(2023))
+
+
+def test_concurrent_writes_are_committed_in_groups(tmp_path, monkeypatch):
+    database = Database(str(tmp_path / "pyLabBook.db"))
+    database.connect()
+    database.initialize_tables()
+    database.connection.close()
+
+    writer = Writer(database.database_path, max_delay=0.05)
+    batches = []
+    commit = writer.commit
+    monkeypatch.setattr(writer, "commit", lambda batch: batches.append(len(batch)) or commit(batch))
+    writer.start()
+
+    # the entries arrive together and are committed in one transaction; the broken one fails on its own
+    entries = [CostEntry("2024-01-10", "Labour", i) for i in range(1, 20)]
+    broken = CostEntry("2024-01-10", "Other", 1.0)
+    broken.category = "Lunch"
+    futures = [writer.submit(entry) for entry in entries] + [writer.submit(broken)]
+    for future in futures[:-1]:
+        future.result(timeout=5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[-1].result(timeout=5)
+    writer.stop()
+
+    assert sum(batches) == len(futures) and len(batches) < len(futures)
+    database.connect()
+    total, = database.cursor.execute("SELECT count(*) FROM cost_entries").fetchone()
+    assert total == len(entries)
+    database.connection.close()
@@ -0,0 +1,100 @@
+import json
+import time
+
+import pytest
+
+import tracing
+from conftest import add_lab
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.Tracer(heartbeat_interval=10, stall_threshold=50)
+    tracing.install(tracer)
+    yield tracer
+    tracing.uninstall()
+
+
+def events(tracer, category=None):
+    return [e for e in tracer.events if category is None or e["cat"] == category]
+
+
+def contains(outer, inner):
+    return outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def test_phases_nest_in_the_interaction(tracer, database):
+    add_lab(database)
+
+    @tracing.traced
+    def populate():
+        bags = database.get_current_bags("2024-01-20")
+        observations = database.get_observations("bags", bags, "2024-01-20")
+        with tracing.phase("render"):
+            return [str(o.experiment) for o in observations]
+
+    root = tracing.HeadlessRoot()
+    root.after(0, populate)
+    root.run(0.1)
+
+    interaction, = events(tracer, "interaction")
+    assert interaction["name"].endswith("populate")
+    phases = {e["name"]: e for e in events(tracer, "phase")}
+    assert {"query", "hydrate", "render"} <= set(phases)
+    assert all(contains(interaction, phase) for phase in phases.values())
+    assert phases["query"]["ts"] < phases["hydrate"]["ts"] < phases["render"]["ts"]
+
+
+def test_spans_record_their_arguments(tracer):
+    with tracing.span("outer", rows=3):
+        with tracing.phase("inner"):
+            time.sleep(0.001)
+    inner, outer = tracer.events
+    assert (outer["name"], outer["cat"], outer["args"]) == ("outer", "interaction", {"rows": 3})
+    assert contains(outer, inner) and inner["dur"] >= 1000
+
+
+def test_a_blocking_callback_is_recorded_as_a_stall(tracer):
+    root = tracing.HeadlessRoot()
+    tracer.start(root)
+    root.after(30, time.sleep, 0.2)
+    root.run(0.4)
+    tracer.stop()
+
+    stalls = events(tracer, "stall")
+    assert len(stalls) == 1
+    assert 150 * 1000 < stalls[0]["dur"] < 400 * 1000
+    # the heartbeat is cancelled, nothing runs after stop
+    assert all(timer in root.cancelled for _, timer, _, _ in root.timers)
+
+
+def test_a_responsive_loop_has_no_stalls(tracer):
+    root = tracing.HeadlessRoot()
+    tracer.start(root)
+    root.run(0.2)
+    tracer.stop()
+    assert not events(tracer, "stall")
+
+
+def test_export_writes_chrome_trace_json(tracer, tmp_path):
+    with tracing.span("confirm"):
+        with tracing.phase("query"):
+            pass
+    path = str(tmp_path / "trace.json")
+    tracer.export(path)
+
+    with open(path) as file:
+        trace = json.load(file)
+    assert trace["displayTimeUnit"] == "ms"
+    complete = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+    metadata = [e for e in trace["traceEvents"] if e["ph"] == "M"]
+    assert [e["name"] for e in complete] == ["query", "confirm"]
+    assert all({"name", "cat", "ts", "dur", "pid", "tid", "args"} <= set(e) for e in complete)
+    assert any(e["name"] == "thread_name" for e in metadata)
+
+
+def test_nothing_is_recorded_without_a_tracer():
+    tracing.uninstall()
+    assert tracing.span("confirm") is tracing.phase("query")
+    traced = tracing.traced(lambda: 1)
+    assert traced() == 1
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import heapq
+import argparse
+import itertools
+import threading
+import functools
+import contextlib
+import collections
+from datetime import date
+
+_tracer = None
+_untraced = contextlib.nullcontext()
+
+
+class Tracer:
+    """Times UI interactions and their query, hydrate and render phases, and detects stalls of the Tk main loop
+    with a heartbeat timer; everything is exported in the Chrome trace format (chrome://tracing, Perfetto)."""
+
+    def __init__(self, heartbeat_interval=50, stall_threshold=100, max_events=200000):
+        # intervals in milliseconds, the main loop stalled if a heartbeat comes stall_threshold late
+        self.heartbeat_interval = heartbeat_interval
+        self.stall_threshold = stall_threshold
+        self.events = collections.deque(maxlen=max_events)
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.root = None
+        self.timer = None
+        self.expected = None
+
+    def now(self):
+        # microseconds, the unit of trace timestamps
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def record(self, name, category, start, duration, **args):
+        self.events.append({"name": name, "cat": category, "ph": "X", "ts": start, "dur": duration,
+                            "pid": self.pid, "tid": threading.get_ident(), "args": args})
+
+    @contextlib.contextmanager
+    def span(self, name, category="interaction", **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, self.now() - start, **args)
+
+    def start(self, root):
+        # root only needs after() and after_cancel(), a HeadlessRoot does where there is no display
+        self.root = root
+        self.expected = self.now() + self.heartbeat_interval * 1000
+        self.timer = root.after(self.heartbeat_interval, self.__beat)
+
+    def __beat(self):
+        now = self.now()
+        late = now - self.expected
+        if late > self.stall_threshold * 1000:
+            # the loop was blocked from when the heartbeat was due until it ran
+            self.record("stall", "stall", self.expected, late)
+        self.expected = now + self.heartbeat_interval * 1000
+        self.timer = self.root.after(self.heartbeat_interval, self.__beat)
+
+    def stop(self):
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+            self.timer = None
+
+    def summary(self):
+        # {(category, name): (count, total ms, max ms)}
+        out = {}
+        for event in self.events:
+            count, total, longest = out.get((event["cat"], event["name"]), (0, 0.0, 0.0))
+            out[(event["cat"], event["name"])] = (count + 1, total + event["dur"] / 1000,
+                                                 max(longest, event["dur"] / 1000))
+        return out
+
+    def export(self, path):
+        names = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread.ident, "args": {"name": thread.name}}
+                 for thread in threading.enumerate()]
+        with open(path + ".partial", "w") as file:
+            json.dump({"traceEvents": names + list(self.events), "displayTimeUnit": "ms"}, file)
+        os.replace(path + ".partial", path)
+
+
+def install(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def uninstall():
+    install(None)
+
+
+def span(name, category="interaction", **args):
+    # a no-op unless a tracer is installed, so the instrumented code pays next to nothing otherwise
+    if _tracer is None:
+        return _untraced
+    return _tracer.span(name, category, **args)
+
+
+def phase(name, **args):
+    return span(name, "phase", **args)
+
+
+def traced(function):
+    # one span per call of a UI handler, named after it
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _tracer is None:
+            return function(*args, **kwargs)
+        with _tracer.span(function.__qualname__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+class HeadlessRoot:
+    """Stands in for the Tk root without a display: callbacks scheduled with after() run from run()."""
+
+    def __init__(self):
+        self.timers = []
+        self.cancelled = set()
+        self.counter = itertools.count()
+
+    def after(self, ms, func, *args):
+        timer = next(self.counter)
+        heapq.heappush(self.timers, (time.monotonic() + ms / 1000, timer, func, args))
+        return timer
+
+    def after_cancel(self, timer):
+        self.cancelled.add(timer)
+
+    def run(self, seconds):
+        deadline = time.monotonic() + seconds
+        while self.timers and self.timers[0][0] <= deadline:
+            due, timer, func, args = heapq.heappop(self.timers)
+            if timer in self.cancelled:
+                self.cancelled.discard(timer)
+                continue
+            time.sleep(max(due - time.monotonic(), 0))
+            func(*args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trace the reads of the inspection panels without a display, "
+                                                 "to check the instrumentation and see where the time goes.")
+    parser.add_argument("--database", default=os.path.join("data", "pyLabBook.db"))
+    parser.add_argument("--date", default=date.today().strftime("%Y-%m-%d"))
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--output", default="trace.json")
+    args = parser.parse_args()
+
+    # run as a script this module is __main__, the tracer is installed in the module the database imports
+    import tracing
+    from database import Database
+    database = Database(args.database)
+    database.connect()
+    database.initialize_tables()
+
+    root = tracing.HeadlessRoot()
+    tracer = tracing.Tracer()
+    tracing.install(tracer)
+    tracer.start(root)
+
+    def populate(experiment_type, read):
+        # what InspectPanel.populate does, with labels formatted instead of placed; the database records the
+        # query and hydrate phases of its reads itself
+        with tracing.span(f"populate {experiment_type}"):
+            experiments = read(args.date)
+            observations = database.get_observations(experiment_type, experiments, args.date)
+            with tracing.phase("render"):
+                rows = [(str(o.experiment), o.experiment.mushroom, o.experiment.variant) for o in observations]
+        root.after(200, populate, experiment_type, read)
+        return rows
+
+    for experiment_type, read in (("cultures", database.get_current_cultures),
+                                  ("grain_spawn", database.get_current_grain_spawn),
+                                  ("bags", database.get_current_bags)):
+        root.after(0, populate, experiment_type, read)
+    root.run(args.duration)
+    tracer.stop()
+
+    print(f"{'':12} {'span':24} {'count':>7} {'total ms':>10} {'max ms':>8}")
+    for (category, name), (count, total, longest) in sorted(tracer.summary().items()):
+        print(f"{category:12} {name:24} {count:7d} {total:10.1f} {longest:8.1f}")
+    tracer.export(args.output)
+    print(f"Trace written to {args.output}")